@@ -47,6 +47,7 @@ CHANNEL_LAYERS = {
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'myapp.metrics.MetricsMiddleware',  # Per-endpoint latency/query metrics (api/metrics/)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +85,45 @@ DATABASES = {
     }
 }
 
+# Cache shared by every worker on this host (settings registry version stamps, ...).
+# It holds a few entries per user (profiles, auth stamps, teaching scopes), so it
+# needs far more room than Django's default of 300 entries, past which it culls
+# a third of the files at random, version stamps included
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
+# How often (seconds) a worker re-checks the version stamp of cached global settings
+SETTINGS_REGISTRY_CHECK_INTERVAL = 1.0
+
+# Lifetime (seconds) of a cached login profile (myapp.profiles); edits invalidate it sooner
+PROFILE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Seconds a worker trusts its cached copy of an authenticated user before re-checking
+# its version stamp (deactivation and role changes take at most this long to apply)
+AUTH_USER_CACHE_TTL = 10
+
+# Exam ranking (see myapp.results.recalculate_rankings)
+RANKING = {
+    'METHOD': 'rank',  # 'rank' (1, 1, 3), 'dense' (1, 1, 2) or 'row_number' (1, 2, 3)
+    'ORDER_BY': ['-total_marks_obtained'],  # Append fields such as '-gpa' or 'student__roll_no' to break ties
+}
+
+# Bill/payment numbers reserved per worker at a time (1 = gapless, one UPDATE per number)
+NUMBER_SEQUENCE_BLOCK_SIZE = 10
+
+# Request metrics (myapp.metrics): requests slower than SLOW_REQUEST_MS (None = never)
+# are kept, with their SQL, in a per-worker log of the last SLOW_REQUEST_LOG_SIZE
+METRICS = {
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_REQUEST_LOG_SIZE': 100,
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -104,7 +144,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'myapp.authentication.ClaimsJWTAuthentication',  # JWTAuthentication trusting the role claims of login tokens
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',  # For token-based auth
@@ -114,8 +154,35 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.IsAuthenticated',  # Restrict access to authenticated users
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'myapp.throttling.TokenBucketThrottle',  # Only throttles views with a throttle_scope (see THROTTLE_BUCKETS)
+    ),
+    # Reverse proxies in front of the app: the client address is taken this many entries from the end of
+    # X-Forwarded-For (0: REMOTE_ADDR). Unset, any client could pick its own address with that header.
+    'NUM_PROXIES': 0,
+}
+
+# Token buckets per throttle_scope (myapp.throttling): each request takes a token from every
+# bucket of its scope. key: "ip", "user", "username" (posted, for login) or "scope" (whole group);
+# rate: refill ("N/sec|min|hour|day"); burst: bucket size (default N)
+THROTTLE_BUCKETS = {
+    'login': [
+        {'key': 'ip', 'rate': '20/min', 'burst': 10},
+        {'key': 'username', 'rate': '5/min', 'burst': 5},
+        {'key': 'scope', 'rate': '300/min', 'burst': 60},  # Caps the PBKDF2 work of all logins together
+    ],
+    'heavy': [
+        {'key': 'user', 'rate': '30/min', 'burst': 10},
+        {'key': 'scope', 'rate': '600/min', 'burst': 100},
+    ],
+    'import': [
+        {'key': 'user', 'rate': '10/hour', 'burst': 3},
+    ],
 }
 
+# SQLite file holding the token buckets, shared by every worker on this host
+THROTTLE_STORE = BASE_DIR / 'throttle.sqlite3'
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -169,8 +236,24 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),  # Adjust the refresh token duration
     'ROTATE_REFRESH_TOKENS': True,  # Optionally rotate refresh tokens upon use
     'BLACKLIST_AFTER_ROTATION': True,  # Optionally blacklist old refresh tokens
+    'AUTH_TOKEN_CLASSES': ('myapp.revocation.RevocableAccessToken',),  # Refuse access tokens revoked on logout
+    'TOKEN_REFRESH_SERIALIZER': 'myapp.authentication.ClaimsTokenRefreshSerializer',  # Revokes rotated refresh tokens
 }
 
+# Revoked tokens (myapp.revocation): how often (seconds) a worker picks up tokens
+# revoked by other workers, and the false positive rate of its Bloom filter
+TOKEN_REVOCATION_CHECK_INTERVAL = 1.0
+TOKEN_REVOCATION_ERROR_RATE = 0.01
+
+# Student typeahead (myapp.typeahead): how often (seconds) a worker checks whether
+# students changed in another worker and its index must be rebuilt
+TYPEAHEAD_CHECK_INTERVAL = 5.0
+
+# Bulk profile jobs (myapp.bulk): profiles per transaction, and whether a job starts
+# in a thread of the worker that created it (off: run them with run_bulk_jobs)
+BULK_JOB_BATCH_SIZE = 200
+BULK_JOBS_IN_BACKGROUND = True
+
 CORS_ALLOW_METHODS = [
     'GET',
     'POST',
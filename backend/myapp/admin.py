@@ -1,6 +1,9 @@
+from collections import defaultdict
+
 from django.contrib import admin
 from django import forms
 from .models import *
+from .attendance import clear_monthly_attendance, mark_monthly_attendance, refresh_attendance_rollup
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -99,6 +102,32 @@ class DailyAttendanceAdmin(admin.ModelAdmin):
     def recorded_by(self, obj):
         return obj.recorded_by.user.username if obj.recorded_by else "N/A"  # Show teacher name
 
+    # Keep the MonthlyAttendance bitmaps in step with edits made here
+    def save_model(self, request, obj, form, change):
+        old = None
+        if change:
+            old = DailyAttendance.objects.filter(pk=obj.pk).values('student_id', 'student__class_code_id', 'date').first()
+            if old:
+                clear_monthly_attendance(old['date'], [old['student_id']])
+        super().save_model(request, obj, form, change)
+        mark_monthly_attendance(obj.date, {obj.student_id: obj.status})
+        if old:
+            refresh_attendance_rollup(old['date'], [old['student__class_code_id']])
+        refresh_attendance_rollup(obj.date, [obj.student.class_code_id])
+
+    # The rollup of deleted records is recounted by myapp.attendance's delete signals
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        clear_monthly_attendance(obj.date, [obj.student_id])
+
+    def delete_queryset(self, request, queryset):
+        students_by_date = defaultdict(list)
+        for student_id, date in queryset.values_list('student_id', 'date'):
+            students_by_date[date].append(student_id)
+        super().delete_queryset(request, queryset)
+        for date, student_ids in students_by_date.items():
+            clear_monthly_attendance(date, student_ids)
+
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'description', 'start_time', 'end_time')
@@ -277,7 +306,7 @@ class StudentResultAdmin(admin.ModelAdmin):
 @admin.register(StudentOverallResult)
 class StudentOverallResultAdmin(admin.ModelAdmin):
     # Display these fields in the list view
-    list_display = ('student', 'exam', 'total_marks_obtained', 'total_full_marks', 'percentage', 'gpa', 'grade', 'updated_at')
+    list_display = ('student', 'exam', 'total_marks_obtained', 'total_full_marks', 'percentage', 'gpa', 'grade', 'rank', 'section_rank', 'school_rank', 'updated_at')
 
     # Add filters to make it easier to filter by specific fields
     list_filter = ('exam', 'grade', 'updated_at')
@@ -349,6 +378,12 @@ class StudentTransactionAdmin(admin.ModelAdmin):
         return obj.payment.payment_number if obj.transaction_type == 'payment' else None
     payment_number.short_description = 'Payment Number'
 
+@admin.register(StudentAccount)
+class StudentAccountAdmin(admin.ModelAdmin):
+    list_display = ('student', 'balance', 'updated_at')
+    search_fields = ('student__user__username',)
+    readonly_fields = ('balance',)  # Only changed through bills and payments
+
 # Communication admin customization
 
 @admin.register(Communication)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        from . import attendance, authentication, enrolment, profiles, teaching, typeahead  # noqa: F401  (connect their signals)
+        from .metrics import install_serializer_timing
+        install_serializer_timing()
@@ -0,0 +1,305 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import AttendanceDailyRollup, Class, DailyAttendance, MonthlyAttendance, Section, Student
+
+FULL_MONTH = (1 << 31) - 1  # All 31 day bits of a MonthlyAttendance mask
+
+
+def _student_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def record_daily_attendance(entries, date, teacher):
+    """
+    Record the attendance of `date` for the students in `entries` (dicts with
+    "student" and "status"), skipping students already recorded that day.
+
+    Runs one SELECT and one bulk INSERT whatever the number of students; the
+    unique (student, date) constraint makes a concurrent submission a no-op.
+    Returns the lists of already recorded and newly recorded student ids.
+    """
+    statuses = {}
+    already_recorded = []
+    for entry in entries:
+        student_id = _student_id(entry.get('student'))
+        if student_id in statuses:
+            already_recorded.append(student_id)  # Listed twice: the first entry wins
+        else:
+            statuses[student_id] = entry.get('status')
+
+    existing = set(
+        DailyAttendance.objects.filter(student_id__in=statuses, date=date).values_list('student_id', flat=True)
+    )
+    new_records = [
+        DailyAttendance(student_id=student_id, date=date, status=status_value, recorded_by=teacher)
+        for student_id, status_value in statuses.items()
+        if student_id not in existing
+    ]
+    DailyAttendance.objects.bulk_create(new_records, ignore_conflicts=True)
+    mark_monthly_attendance(date, {record.student_id: record.status for record in new_records})
+    if new_records:
+        refresh_attendance_rollup(
+            date, Student.objects.filter(id__in=[record.student_id for record in new_records]).values_list('class_code_id', flat=True)
+        )
+
+    already_recorded = [student_id for student_id in statuses if student_id in existing] + already_recorded
+    return already_recorded, [record.student_id for record in new_records]
+
+
+def update_class_attendance(class_obj, date, entries):
+    """
+    Correct the recorded attendance of a class on `date` from `entries` (dicts
+    with "student" and "status") with one SELECT and one bulk UPDATE.
+
+    Nothing is written if a student has no record for that day; the ids of those
+    students are returned instead (empty list on success).
+    """
+    statuses = {_student_id(entry.get('student')): entry.get('status') for entry in entries}
+    records = {
+        record.student_id: record
+        for record in DailyAttendance.objects.filter(
+            student__class_code=class_obj, date=date, student_id__in=statuses
+        )
+    }
+    missing = [student_id for student_id in statuses if student_id not in records]
+    if missing:
+        return missing
+
+    for student_id, record in records.items():
+        record.status = statuses[student_id]
+    DailyAttendance.objects.bulk_update(records.values(), ['status'])
+    mark_monthly_attendance(date, statuses)
+    refresh_attendance_rollup(date, [class_obj.id])
+    return []
+
+
+def mark_monthly_attendance(date, statuses):
+    """
+    Set the bit of `date` in the MonthlyAttendance rows of the students in
+    `statuses` ({student_id: present}), creating the missing rows.
+    Three queries whatever the number of students.
+    """
+    if not statuses:
+        return
+    bit = 1 << (date.day - 1)
+    MonthlyAttendance.objects.bulk_create(
+        [MonthlyAttendance(student_id=student_id, year=date.year, month=date.month) for student_id in statuses],
+        ignore_conflicts=True,
+    )
+    rows = MonthlyAttendance.objects.filter(year=date.year, month=date.month)
+    present = [student_id for student_id, status_value in statuses.items() if status_value]
+    absent = [student_id for student_id, status_value in statuses.items() if not status_value]
+    if present:
+        rows.filter(student_id__in=present).update(
+            recorded_mask=F('recorded_mask').bitor(bit), present_mask=F('present_mask').bitor(bit)
+        )
+    if absent:
+        rows.filter(student_id__in=absent).update(
+            recorded_mask=F('recorded_mask').bitor(bit), present_mask=F('present_mask').bitand(FULL_MONTH ^ bit)
+        )
+
+
+def clear_monthly_attendance(date, student_ids):
+    """Clear the bit of `date` for the given students (their attendance of that day was deleted)"""
+    bit = FULL_MONTH ^ (1 << (date.day - 1))
+    MonthlyAttendance.objects.filter(year=date.year, month=date.month, student_id__in=student_ids).update(
+        recorded_mask=F('recorded_mask').bitand(bit), present_mask=F('present_mask').bitand(bit)
+    )
+
+
+def _in_classes(field, class_ids):
+    # `field` in `class_ids`, where a None id stands for "no class" (which IN never matches)
+    condition = Q(**{f"{field}__in": [class_id for class_id in class_ids if class_id is not None]})
+    if None in class_ids:
+        condition |= Q(**{f"{field}__isnull": True})
+    return condition
+
+
+def refresh_attendance_rollup(date, class_ids):
+    """
+    Recount the AttendanceDailyRollup rows of `date` for the given class ids
+    from DailyAttendance, in four queries. A None id stands for the students
+    without a class, counted in rows with no class. Only sections with
+    attendance taken that day get a row.
+    """
+    class_ids = set(class_ids)
+    counts = (
+        DailyAttendance.objects.filter(_in_classes('student__class_code_id', class_ids), date=date)
+        .values('student__class_code_id', 'student__class_code_section_id')
+        .annotate(present=Count('id', filter=Q(status=True)), absent=Count('id', filter=Q(status=False)))
+    )
+    enrolled = {
+        (row['class_code_id'], row['class_code_section_id']): row['total']
+        for row in Student.objects.filter(_in_classes('class_code_id', class_ids))
+        .values('class_code_id', 'class_code_section_id')
+        .annotate(total=Count('id'))
+    }
+    rows = [
+        AttendanceDailyRollup(
+            school_class_id=row['student__class_code_id'],
+            section_id=row['student__class_code_section_id'],
+            date=date,
+            total=enrolled.get((row['student__class_code_id'], row['student__class_code_section_id']), 0),
+            present=row['present'],
+            absent=row['absent'],
+        )
+        for row in counts
+    ]
+    AttendanceDailyRollup.objects.filter(_in_classes('school_class_id', class_ids), date=date).delete()
+    AttendanceDailyRollup.objects.bulk_create(rows)
+
+
+class _PendingRollups(threading.local):
+    """
+    The rollup days touched by the deletes of this thread's transaction, recounted
+    once it commits: (date, student id) of deleted attendance records, the class of
+    deleted students (gone by then) and (date, class id) pairs of deleted classes
+    and sections.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.records = set()
+        self.student_classes = {}
+        self.class_days = set()
+
+    def schedule(self):
+        # One callback per delete; the first to run recounts everything, the others find nothing left
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        records, student_classes, class_days = self.records, self.student_classes, self.class_days
+        self.reset()
+        if not records and not class_days:
+            return
+        classes = dict(Student.objects.filter(
+            id__in={student_id for _, student_id in records if student_id not in student_classes}
+        ).values_list('id', 'class_code_id'))
+        classes.update(student_classes)
+        days = defaultdict(set)
+        for date, student_id in records:
+            if student_id in classes:
+                days[date].add(classes[student_id])
+        for date, class_id in class_days:
+            days[date].add(class_id)
+        with transaction.atomic():
+            for date, class_ids in days.items():
+                refresh_attendance_rollup(date, class_ids)
+
+
+pending_rollups = _PendingRollups()
+
+
+@receiver(post_delete, sender=DailyAttendance)
+def rollup_attendance_deleted(sender, instance, **kwargs):
+    pending_rollups.records.add((instance.date, instance.student_id))
+    pending_rollups.schedule()
+
+
+@receiver(post_delete, sender=Student)
+def rollup_student_deleted(sender, instance, **kwargs):
+    pending_rollups.student_classes[instance.pk] = instance.class_code_id
+
+
+@receiver(pre_delete, sender=Class)
+def rollup_class_deleting(sender, instance, **kwargs):
+    # Its rollup rows go with it; its students are left without a class
+    dates = DailyAttendance.objects.filter(student__class_code=instance).values_list('date', flat=True).distinct()
+    pending_rollups.class_days.update((date, None) for date in dates)
+    pending_rollups.schedule()
+
+
+@receiver(pre_delete, sender=Section)
+def rollup_section_deleting(sender, instance, **kwargs):
+    # Its rollup rows go with it; its students stay in the class without a section
+    dates = DailyAttendance.objects.filter(student__class_code_section=instance).values_list('date', flat=True).distinct()
+    pending_rollups.class_days.update((date, instance.school_class_id) for date in dates)
+    pending_rollups.schedule()
+
+
+def build_monthly_attendance(records):
+    """
+    MonthlyAttendance rows (unsaved) for an iterable of DailyAttendance
+    (student_id, date, status) tuples.
+    """
+    masks = defaultdict(lambda: [0, 0])
+    for student_id, date, status_value in records:
+        bit = 1 << (date.day - 1)
+        mask = masks[(student_id, date.year, date.month)]
+        mask[1] |= bit
+        if status_value:
+            mask[0] |= bit
+    return [
+        MonthlyAttendance(student_id=student_id, year=year, month=month, present_mask=present, recorded_mask=recorded)
+        for (student_id, year, month), (present, recorded) in masks.items()
+    ]
+
+
+def month_register(row, days):
+    """Per-day list of a month: True present, False absent, None not recorded"""
+    if row is None:
+        return [None] * days
+    return [
+        bool(row.present_mask >> day & 1) if row.recorded_mask >> day & 1 else None
+        for day in range(days)
+    ]
+
+
+def percentage(present, recorded):
+    return round(present / recorded * 100, 2) if recorded else 0
+
+
+def _recorded_days_bits(row):
+    """Presence of the recorded days of `row` packed one bit per recorded day (oldest lowest), and their count"""
+    bits = length = 0
+    recorded = row.recorded_mask
+    while recorded:
+        day = recorded & -recorded  # Lowest recorded day left
+        if row.present_mask & day:
+            bits |= 1 << length
+        length += 1
+        recorded ^= day
+    return bits, length
+
+
+def attendance_summary(rows):
+    """
+    Totals and streaks of one student over their MonthlyAttendance `rows`,
+    ordered by (year, month). Days without attendance (holidays) do not break
+    a streak; an absence does.
+    """
+    present = recorded = 0
+    sequence = length = 0
+    for row in rows:
+        present += row.present_days
+        recorded += row.recorded_days
+        bits, count = _recorded_days_bits(row)
+        sequence |= bits << length
+        length += count
+
+    longest = 0
+    run = sequence
+    while run:  # Each step shortens every run of ones by one
+        run &= run >> 1
+        longest += 1
+    absences = ~sequence & ((1 << length) - 1)
+
+    return {
+        "present_days": present,
+        "absent_days": recorded - present,
+        "recorded_days": recorded,
+        "percentage": percentage(present, recorded),
+        "longest_streak": longest,
+        "current_streak": length - absences.bit_length(),  # Present days since the last absence
+    }
@@ -0,0 +1,210 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Accountant, CustomUser, Driver, Principal, Student, Teacher
+from .revocation import RevocableAccessToken, RevocableTokenMixin
+
+ROLES = ('student', 'teacher', 'principal', 'accountant', 'driver')
+ROLE_FLAGS = ('is_master', 'is_principal', 'is_teacher', 'is_student', 'is_accountant', 'is_driver')
+
+
+def _stamp_key(user_id):
+    return f"auth:{user_id}:version"
+
+
+def auth_stamp(user_id):
+    """
+    Version stamp of a user's authentication data (active flag, role flags and
+    role rows), kept in the shared cache. Tokens carry the stamp they were
+    issued with; a different stamp means their role claims are out of date.
+    """
+    key = _stamp_key(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def load_auth_user(user_id):
+    """The user with every role row joined in, so role checks on it never query"""
+    return CustomUser.objects.select_related(*ROLES).get(pk=user_id)
+
+
+def role_claims(user):
+    """
+    Role claims of a user loaded by load_auth_user(): the role flags, the id of
+    each role row the user has (student_id, teacher_id, ...) and the class id
+    (a student's class, or the class a teacher is class teacher of).
+    """
+    claims = {flag: getattr(user, flag) for flag in ROLE_FLAGS}
+    class_id = None
+    for role in ROLES:
+        role_row = getattr(user, role, None)
+        if role_row is None:
+            continue
+        claims[f'{role}_id'] = role_row.pk
+        if class_id is None:
+            class_id = role_row.class_code_id if role == 'student' else role_row.class_teacher_id if role == 'teacher' else None
+    claims['class_id'] = class_id
+    return claims
+
+
+class ClaimsRefreshToken(RevocableTokenMixin, RefreshToken):
+    """Revocable refresh token (and the access tokens made from it) carrying the user's role claims"""
+
+    access_token_class = RevocableAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        auth_user, stamp = user_cache.get(user.pk)
+        token['roles'] = role_claims(auth_user)
+        token['ver'] = stamp
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh refusing revoked refresh tokens, and revoking the old one when rotating"""
+    token_class = ClaimsRefreshToken
+
+
+class UserCache:
+    """
+    Per-worker cache of authenticated users. An entry is trusted for
+    ``AUTH_USER_CACHE_TTL`` seconds; after that it is kept only if the user's
+    stamp in the shared cache hasn't moved, otherwise the user is reloaded.
+    """
+
+    max_entries = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # user id -> [user, stamp, checked_at]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_USER_CACHE_TTL', 10)
+
+    def put(self, user_id, user, stamp):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[user_id] = [user, stamp, time.monotonic()]
+        return user
+
+    def get(self, user_id):
+        """(user, stamp), reloading the user if their stamp moved"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and now - entry[2] < self.ttl:
+            return entry[0], entry[1]
+
+        stamp = auth_stamp(user_id)  # before loading, so a concurrent change always shows as a newer stamp
+        if entry is not None and entry[1] == stamp:
+            entry[2] = now
+            return entry[0], entry[1]
+
+        try:
+            user = load_auth_user(user_id)
+        except CustomUser.DoesNotExist:
+            self.evict(user_id)
+            raise
+        return self.put(user_id, user, stamp), stamp
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication trusting the role claims of tokens issued by
+    ClaimsRefreshToken. The user comes from the per-worker UserCache, so an
+    authenticated request usually runs no query for authentication or role
+    checks. Deactivated or deleted users are refused as soon as the cache
+    notices their stamp moved; tokens with outdated claims get them recomputed.
+    Tokens without role claims are handled like JWTAuthentication does.
+    """
+
+    def get_user(self, validated_token):
+        if 'roles' not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed("Token contained no recognizable user identification", code="token_not_valid")
+
+        try:
+            user, stamp = user_cache.get(user_id)
+        except CustomUser.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if validated_token.get('ver') != stamp:
+            validated_token['roles'] = role_claims(user)
+            validated_token['ver'] = stamp
+
+        # Each request gets its own copy, so changes a view makes to request.user stay out of the cache
+        return copy.copy(user)
+
+
+def token_roles(request):
+    """The role claims of the request's token, or None if it carries none"""
+    token = getattr(request, 'auth', None)
+    try:
+        return token['roles'] if token is not None else None
+    except (KeyError, TypeError):
+        return None
+
+
+def bump_auth_stamp(user_id):
+    """Make every worker reload the user, once the current transaction commits"""
+    bump_auth_stamps([user_id])
+
+
+def bump_auth_stamps(user_ids):
+    user_ids = list(user_ids)
+
+    def bump():
+        stamp = time.time_ns()
+        cache.set_many({_stamp_key(user_id): stamp for user_id in user_ids}, timeout=None)
+        for user_id in user_ids:
+            user_cache.evict(user_id)
+    transaction.on_commit(bump)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def auth_user_changed(sender, instance, **kwargs):
+    bump_auth_stamp(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Teacher)
+@receiver([post_save, post_delete], sender=Principal)
+@receiver([post_save, post_delete], sender=Accountant)
+@receiver([post_save, post_delete], sender=Driver)
+def auth_role_changed(sender, instance, **kwargs):
+    bump_auth_stamp(instance.user_id)
@@ -0,0 +1,158 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import (
+    FeeCategory, NumberSequence, Student, StudentAccount, StudentBill, StudentBillFeeCategory, StudentTransaction,
+    TransportationFee, first_free_number,
+)
+
+ZERO = models.Value(Decimal('0.00'), output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+
+def _allocate_bill_numbers(year, count):
+    """Reserve `count` bill numbers in one go"""
+    numbers = NumberSequence.reserve(
+        "B", year, count, initial=lambda: first_free_number(StudentBill, 'bill_number', "B", year)
+    )
+    return [f"{year}B{str(number).zfill(2)}" for number in numbers]
+
+
+def _previous_bill_settings(student_ids):
+    """
+    Scholarship fee categories and transportation fee of each student's latest
+    bill, carried forward to the new month.
+    """
+    latest_bill = StudentBill.objects.filter(student=models.OuterRef('pk')).order_by('-date', '-id').values('id')[:1]
+    latest_bills = dict(
+        Student.objects.filter(id__in=student_ids)
+        .annotate(latest_bill_id=models.Subquery(latest_bill))
+        .exclude(latest_bill_id__isnull=True)
+        .values_list('latest_bill_id', 'id')
+    )
+    transportation = dict(
+        StudentBill.objects.filter(id__in=latest_bills, transportation_fee__isnull=False)
+        .values_list('student_id', 'transportation_fee_id')
+    )
+    scholarships = defaultdict(set)
+    for bill_id, fee_category_id in StudentBillFeeCategory.objects.filter(
+        student_bill_id__in=latest_bills, scholarship=True
+    ).values_list('student_bill_id', 'fee_category_id'):
+        scholarships[latest_bills[bill_id]].add(fee_category_id)
+    return scholarships, transportation
+
+
+def generate_monthly_bills(month, class_ids=None, scholarships=None, remarks=None, chunk_size=500, progress=None):
+    """
+    Bill every student of the given classes (the whole school if None) for `month`
+    in one database transaction. Students already billed for the month are skipped.
+
+    Every student is billed the fee categories of their class. `scholarships` maps a
+    student id to the fee category ids they get a scholarship on; students not in it
+    keep the scholarships (and transportation fee) of their latest bill. Rows are
+    bulk-created per chunk of students, totals are computed in SQL, and the student
+    accounts are updated set-based. `progress(done, total)` is called after each chunk.
+
+    Returns a summary dict.
+    """
+    students = Student.objects.filter(class_code__isnull=False).exclude(bills__month=month)
+    if class_ids:
+        students = students.filter(class_code_id__in=class_ids)
+    scholarships = {int(student_id): set(fee_ids) for student_id, fee_ids in (scholarships or {}).items()}
+
+    with transaction.atomic():
+        student_rows = list(students.order_by('class_code_id', 'id').values_list('id', 'class_code_id'))
+        student_ids = [student_id for student_id, _ in student_rows]
+
+        fees_by_class = defaultdict(list)
+        for fee_id, class_id in FeeCategory.objects.filter(
+            class_assigned_id__in={class_id for _, class_id in student_rows}
+        ).values_list('id', 'class_assigned_id'):
+            fees_by_class[class_id].append(fee_id)
+
+        carried_scholarships, transportation = _previous_bill_settings(student_ids)
+        StudentAccount.ensure_for(student_ids)
+
+        now = timezone.now()
+        bill_numbers = iter(_allocate_bill_numbers(now.year, len(student_rows)))
+        total_amount = Decimal('0.00')
+        total = len(student_rows)
+
+        for start in range(0, total, chunk_size):
+            chunk = student_rows[start:start + chunk_size]
+            chunk_ids = [student_id for student_id, _ in chunk]
+
+            bills = StudentBill.objects.bulk_create([
+                StudentBill(
+                    student_id=student_id,
+                    month=month,
+                    date=now,
+                    bill_number=next(bill_numbers),
+                    transportation_fee_id=transportation.get(student_id),
+                    remarks=remarks,
+                )
+                for student_id, _ in chunk
+            ])
+            bill_ids = [bill.id for bill in bills]
+
+            StudentBillFeeCategory.objects.bulk_create([
+                StudentBillFeeCategory(
+                    student_bill=bill,
+                    fee_category_id=fee_id,
+                    scholarship=fee_id in scholarships.get(student_id, carried_scholarships.get(student_id, ())),
+                )
+                for bill, (student_id, class_id) in zip(bills, chunk)
+                for fee_id in fees_by_class[class_id]
+            ])
+
+            # Totals in SQL: fee categories without scholarship + transportation - discount, never negative
+            fee_total = (
+                StudentBillFeeCategory.objects.filter(student_bill=models.OuterRef('pk'), scholarship=False)
+                .values('student_bill')
+                .annotate(total=models.Sum('fee_category__amount'))
+                .values('total')
+            )
+            transportation_amount = TransportationFee.objects.filter(
+                pk=models.OuterRef('transportation_fee')
+            ).values('amount')
+            chunk_bills = StudentBill.objects.filter(id__in=bill_ids)
+            chunk_bills.update(
+                subtotal=Coalesce(models.Subquery(fee_total), ZERO) + Coalesce(models.Subquery(transportation_amount), ZERO)
+            )
+            chunk_bills.update(total_amount=Greatest(models.F('subtotal') - models.F('discount'), ZERO))
+
+            # Add each new bill to its student's account, set-based
+            new_bill_total = StudentBill.objects.filter(
+                id__in=bill_ids, student=models.OuterRef('student')
+            ).values('total_amount')[:1]
+            StudentAccount.objects.filter(student_id__in=chunk_ids).update(
+                balance=models.F('balance') + Coalesce(models.Subquery(new_bill_total), ZERO),
+                updated_at=now,
+            )
+            balances = dict(
+                StudentAccount.objects.filter(student_id__in=chunk_ids).values_list('student_id', 'balance')
+            )
+
+            StudentTransaction.objects.bulk_create([
+                StudentTransaction(
+                    student_id=student_id,
+                    transaction_type='bill',
+                    bill_id=bill_id,
+                    balance=balances[student_id],
+                    transaction_date=now,
+                )
+                for bill_id, student_id in chunk_bills.values_list('id', 'student_id')
+            ])
+            total_amount += chunk_bills.aggregate(total=models.Sum('total_amount'))['total'] or 0
+
+            if progress:
+                progress(start + len(chunk), total)
+
+    return {
+        "month": month,
+        "students_billed": total,
+        "total_amount": total_amount,
+    }
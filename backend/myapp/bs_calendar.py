@@ -0,0 +1,113 @@
+"""
+Precomputed AD <-> BS calendar.
+
+nepali_datetime walks its calendar data for every conversion. Here the whole
+supported range (BS 1975-2100) is laid out once, on first use, as flat arrays:
+
+* ``_ad_to_bs[i]`` is the packed BS date (``year * 10000 + month * 100 + day``)
+  of the AD day with ordinal ``_first_ordinal + i``.
+* ``_month_start[j]`` is the AD ordinal of the first day of BS month ``j``
+  (counted from Baisakh 1975), ``_month_length[j]`` its number of days.
+
+Converting a date is then one array lookup, and ``convert_many`` converts a
+whole column of dates in a single pass.
+"""
+from array import array
+from datetime import date, datetime
+
+import nepali_datetime
+
+_first_ordinal = None
+_ad_to_bs = None
+_month_start = None
+_month_length = None
+_formatted = None  # Lazily filled cache of "YYYY-MM-DD" strings, same index as _ad_to_bs
+
+
+def _build():
+    global _first_ordinal, _ad_to_bs, _month_start, _month_length, _formatted
+
+    month_start = array('l')
+    month_length = array('H')
+    for year in range(nepali_datetime.MINYEAR, nepali_datetime.MAXYEAR + 1):
+        for month in range(1, 13):
+            month_start.append(nepali_datetime.date(year, month, 1).to_datetime_date().toordinal())
+    end_ordinal = nepali_datetime.date.max.to_datetime_date().toordinal() + 1
+    for index, start in enumerate(month_start):
+        next_start = month_start[index + 1] if index + 1 < len(month_start) else end_ordinal
+        month_length.append(next_start - start)
+
+    ad_to_bs = array('l')
+    for index, length in enumerate(month_length):
+        year = nepali_datetime.MINYEAR + index // 12
+        packed_month = year * 10000 + (index % 12 + 1) * 100
+        ad_to_bs.extend(range(packed_month + 1, packed_month + length + 1))
+
+    _month_start, _month_length = month_start, month_length
+    _formatted = [None] * len(ad_to_bs)
+    _first_ordinal = month_start[0]
+    _ad_to_bs = ad_to_bs  # Assigned last: marks the table as ready
+
+
+def _table():
+    if _ad_to_bs is None:
+        _build()
+    return _ad_to_bs
+
+
+def _format(index, packed):
+    text = f"{packed // 10000:04d}-{packed // 100 % 100:02d}-{packed % 100:02d}"
+    _formatted[index] = text
+    return text
+
+
+def ad_to_bs(value):
+    """Return the BS date of an AD ``date``/``datetime`` as ``YYYY-MM-DD``."""
+    if value is None:
+        return None
+    table = _table()
+    if isinstance(value, datetime):
+        value = value.date()
+    index = value.toordinal() - _first_ordinal
+    if not 0 <= index < len(table):
+        # Outside the supported range: let nepali_datetime raise its usual error
+        return nepali_datetime.date.from_datetime_date(value).strftime('%Y-%m-%d')
+    return _formatted[index] or _format(index, table[index])
+
+
+def convert_many(dates):
+    """
+    Convert a column of AD dates to BS ``YYYY-MM-DD`` strings in one pass.
+
+    Accepts ``date``/``datetime`` objects; ``None`` entries are kept as ``None``.
+    """
+    table = _table()
+    size = len(table)
+    first_ordinal = _first_ordinal
+    formatted = _formatted
+    converted = []
+    append = converted.append
+    for value in dates:
+        if value is None:
+            append(None)
+            continue
+        if isinstance(value, datetime):
+            value = value.date()
+        index = value.toordinal() - first_ordinal
+        if 0 <= index < size:
+            append(formatted[index] or _format(index, table[index]))
+        else:
+            append(ad_to_bs(value))
+    return converted
+
+
+def bs_to_ad(year, month, day):
+    """Return the AD ``date`` of a BS year/month/day."""
+    _table()
+    if not nepali_datetime.MINYEAR <= year <= nepali_datetime.MAXYEAR or not 1 <= month <= 12:
+        # Let nepali_datetime raise its usual error
+        return nepali_datetime.date(year, month, day).to_datetime_date()
+    index = (year - nepali_datetime.MINYEAR) * 12 + month - 1
+    if not 1 <= day <= _month_length[index]:
+        raise ValueError('day is out of range for month', day)
+    return date.fromordinal(_month_start[index] + day - 1)
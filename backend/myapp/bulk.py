@@ -0,0 +1,164 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import signals
+from django.utils import timezone
+
+from .attendance import refresh_attendance_rollup
+from .authentication import bump_auth_stamps
+from .models import (
+    Accountant, BulkJob, CustomUser, DailyAttendance, Driver, Principal, Student, StudentEnrolment, Teacher,
+)
+from .profiles import invalidate_profiles
+from .teaching import teaching_changed
+from .typeahead import student_index
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODELS = {'students': Student, 'teachers': Teacher, 'accountants': Accountant, 'drivers': Driver}
+# Deleted without their per-object signals; delete_profiles() does the same cache invalidation and
+# attendance recount once per batch
+QUIET_MODELS = frozenset([CustomUser, Student, Teacher, Principal, Accountant, Driver, DailyAttendance])
+
+
+def _relations(model):
+    # What Django's deletion collector follows: reverse foreign keys and one-to-ones, m2m through tables included
+    return [
+        field for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete and (field.one_to_one or field.one_to_many)
+    ]
+
+
+def _has_delete_signals(model):
+    return signals.pre_delete.has_listeners(model) or signals.post_delete.has_listeners(model)
+
+
+def cascade_delete(queryset, counts, quiet=frozenset(), path=()):
+    """
+    Delete `queryset` and everything that cascades from it, one statement per
+    table: the rows depending on it first (picked by a subquery on their
+    parent), then the rows themselves. Models with delete signals are left to
+    the ORM collector, which loads the rows to send them, unless they are in
+    `quiet`. Adds the rows deleted per model label to `counts`.
+    """
+    model = queryset.model
+    path += (model,)
+    needs_collector = model not in quiet and _has_delete_signals(model)
+    for relation in _relations(model):
+        related = relation.related_model._base_manager.filter(**{f"{relation.field.name}__in": queryset.values('pk')})
+        if relation.on_delete is models.CASCADE:
+            if relation.related_model in path:
+                needs_collector = True  # A cycle (a self-reference): the collector sorts those out
+            else:
+                cascade_delete(related, counts, quiet, path)
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+        elif relation.on_delete is not models.DO_NOTHING:
+            needs_collector = True  # PROTECT, SET_DEFAULT, ...
+
+    if needs_collector:
+        counts.update(queryset.delete()[1])
+    else:
+        deleted = queryset._raw_delete(queryset.db)  # What QuerySet.delete() does when nothing depends on the rows
+        if deleted:
+            counts[model._meta.label] += deleted
+
+
+def delete_profiles(model, profile_ids, counts):
+    """Delete the users of these profiles with everything that belongs to them"""
+    user_ids = list(model.objects.filter(id__in=profile_ids).values_list('user_id', flat=True))
+    attendance_days = _attendance_days(profile_ids) if model is Student else {}
+    cascade_delete(CustomUser._base_manager.filter(pk__in=user_ids), counts, quiet=QUIET_MODELS)
+    for date, class_ids in attendance_days.items():
+        refresh_attendance_rollup(date, class_ids)  # Their attendance records went with them
+    _users_changed(model, user_ids)
+
+
+def _attendance_days(student_ids):
+    """The class ids of these students' attendance records, per date"""
+    days = defaultdict(set)
+    for date, class_id in DailyAttendance.objects.filter(student_id__in=student_ids).values_list(
+        'date', 'student__class_code_id'
+    ).distinct():
+        days[date].add(class_id)
+    return days
+
+
+def deactivate_profiles(model, profile_ids, archive=False):
+    """
+    Deactivate the users of these profiles, keeping all their records; they can
+    no longer log in and drop out of the student typeahead. Archiving also takes
+    students out of their class and section and teachers off their classes,
+    sections and subjects.
+    """
+    user_ids = list(model.objects.filter(id__in=profile_ids).values_list('user_id', flat=True))
+    CustomUser.objects.filter(id__in=user_ids).update(is_active=False)
+    if archive and model is Student:
+        Student.objects.filter(id__in=profile_ids).update(class_code=None, class_code_section=None, roll_no=None)
+        Student.optional_subjects.through.objects.filter(student_id__in=profile_ids).delete()
+        StudentEnrolment.sync_for(profile_ids)
+    elif archive and model is Teacher:
+        Teacher.objects.filter(id__in=profile_ids).update(class_teacher=None, class_teacher_section=None)
+        for through in (Teacher.subjects.through, Teacher.classes.through, Teacher.classes_section.through):
+            through.objects.filter(teacher_id__in=profile_ids).delete()
+        teaching_changed(profile_ids)
+
+    _users_changed(model, user_ids)  # update() and through-table deletes send no signals
+
+
+def _users_changed(model, user_ids):
+    bump_auth_stamps(user_ids)
+    invalidate_profiles(user_ids)
+    if model is Student:
+        transaction.on_commit(student_index.invalidate)
+
+
+def run_bulk_job(job_id):
+    """
+    Run a pending BulkJob, BULK_JOB_BATCH_SIZE profiles per transaction so
+    other requests get to write in between; `processed` is saved after every
+    batch. Batches already done stay done if a later one fails, and a job put
+    back to pending resumes after them.
+    """
+    if not BulkJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=timezone.now()):
+        return  # Taken by another runner
+    job = BulkJob.objects.get(pk=job_id)
+    model = PROFILE_MODELS[job.kind]
+    batch_size = getattr(settings, 'BULK_JOB_BATCH_SIZE', 200)
+    counts = Counter(job.deleted)
+    try:
+        for start in range(job.processed, len(job.profile_ids), batch_size):
+            batch = job.profile_ids[start:start + batch_size]
+            with transaction.atomic():
+                if job.action == 'delete':
+                    delete_profiles(model, batch, counts)
+                else:
+                    deactivate_profiles(model, batch, archive=job.action == 'archive')
+            BulkJob.objects.filter(pk=job_id).update(processed=start + len(batch), deleted=dict(counts))
+    except Exception as exc:
+        logger.exception("Bulk job %s failed", job_id)
+        BulkJob.objects.filter(pk=job_id).update(status='failed', error=str(exc), finished_at=timezone.now())
+    else:
+        BulkJob.objects.filter(pk=job_id).update(status='done', finished_at=timezone.now())
+
+
+def _run_in_thread(job_id):
+    try:
+        run_bulk_job(job_id)
+    finally:
+        connection.close()  # This thread's own connection
+
+
+def start_bulk_job(job_id):
+    """
+    Run the job in a background thread of this worker once the current
+    transaction commits, unless BULK_JOBS_IN_BACKGROUND is off, in which case
+    it waits for the run_bulk_jobs command.
+    """
+    if getattr(settings, 'BULK_JOBS_IN_BACKGROUND', True):
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_in_thread, args=(job_id,), name=f"bulk-job-{job_id}", daemon=True
+        ).start())
@@ -0,0 +1,63 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Class, Student, StudentEnrolment
+
+ENROLMENT_FIELDS = {'class_code', 'class_code_section'}
+
+
+def enrolment_changed(student_ids):
+    """Rebuild the StudentEnrolment rows of these students"""
+    student_ids = {student_id for student_id in student_ids if student_id is not None}
+    if student_ids:
+        StudentEnrolment.sync_for(student_ids)
+
+
+def class_enrolment_changed(class_ids):
+    """Rebuild the StudentEnrolment rows of every student in these classes"""
+    enrolment_changed(Student.objects.filter(class_code_id__in=list(class_ids)).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Student)
+def enrolment_student_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or ENROLMENT_FIELDS & set(update_fields):
+        enrolment_changed([instance.pk])
+
+
+@receiver(m2m_changed, sender=Student.optional_subjects.through)
+def enrolment_choices_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            enrolment_changed([instance.pk])
+    elif action == 'pre_clear':
+        # From the subject side: remember who chose it before the links go
+        instance._enrolment_students = list(sender.objects.filter(subject=instance.pk).values_list('student_id', flat=True))
+    elif action == 'post_clear':
+        enrolment_changed(instance.__dict__.pop('_enrolment_students', ()))
+    elif action.startswith('post_'):
+        enrolment_changed(pk_set)
+
+
+@receiver(m2m_changed, sender=Class.subjects.through)
+@receiver(m2m_changed, sender=Class.optional_subjects.through)
+def enrolment_class_subjects_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            class_enrolment_changed([instance.pk])
+    elif action == 'pre_clear':
+        instance._enrolment_classes = list(sender.objects.filter(subject=instance.pk).values_list('class_id', flat=True))
+    elif action == 'post_clear':
+        class_enrolment_changed(instance.__dict__.pop('_enrolment_classes', ()))
+    elif action.startswith('post_'):
+        class_enrolment_changed(pk_set)
+
+
+@receiver(pre_delete, sender=Class)
+def enrolment_class_deleting(sender, instance, **kwargs):
+    instance._enrolment_students = list(instance.students.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Class)
+def enrolment_class_deleted(sender, instance, **kwargs):
+    # Its students are left without a class: only their chosen optional subjects remain
+    enrolment_changed(instance.__dict__.pop('_enrolment_students', ()))
@@ -0,0 +1,214 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import bs_calendar
+from .models import DateSetting, Subject
+from .serializers import convert_date_columns
+
+ROLE_NAMES = (('is_master', "Master"), ('is_principal', "Principal"), ('is_teacher', "Teacher"),
+              ('is_student', "Student"), ('is_accountant', "Accountant'"))
+CENT = Decimal('0.01')
+
+
+def _decimal(value):
+    # What a DRF DecimalField(decimal_places=2) returns
+    return None if value is None else format(value.quantize(CENT), 'f')
+
+
+def _role(row, prefix):
+    # UserSerializer.get_role
+    return next((role for flag, role in ROLE_NAMES if row[prefix + flag]), "Unknown")
+
+
+class ValuesSerializer:
+    """
+    Read-only list serializer over `.values()` rows for the largest responses:
+    no model instances, no serializer field objects per row. `data` is the same
+    JSON as the DRF serializer each subclass stands in for (see the parity
+    tests), date columns converted to BS by the same convert_date_columns().
+    Subclasses list the `columns` to read and build each item in `represent()`.
+    """
+    columns = ()
+    date_fields = {}  # Output column -> DRF field, as DateFormatListSerializer sees them
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    @property
+    def data(self):
+        # DateTimeField output as DRF gives it, the current timezone looked up once instead of per row
+        self.datetime_field = serializers.DateTimeField(
+            default_timezone=timezone.get_current_timezone() if settings.USE_TZ else None
+        )
+        rows = list(self.queryset.values(*self.columns))
+        self.prepare(rows)
+        data = [self.represent(row) for row in rows]
+        convert_date_columns(self.date_fields, data)
+        return data
+
+    def prepare(self, rows):
+        """Load what the rows need besides their columns, in bulk"""
+
+    def represent(self, row):
+        raise NotImplementedError
+
+
+class FastStudentSerializer(ValuesSerializer):
+    """GetStudentSerializer (all fields), for student lists"""
+
+    columns = (
+        'id', 'phone', 'address', 'date_of_birth', 'parents', 'gender', 'roll_no',
+        'user_id', 'user__username', 'user__email', 'user__first_name', 'user__last_name', 'user__is_master',
+        'user__is_principal', 'user__is_teacher', 'user__is_student', 'user__is_accountant',
+        'class_code_id', 'class_code__class_code', 'class_code__class_name',
+    )
+    date_fields = {'date_of_birth': serializers.DateField()}
+
+    def prepare(self, rows):
+        # The same subject query prefetch_related('optional_subjects') runs
+        self.optional_subjects = defaultdict(list)
+        for student_id, subject_id, code, name in Subject.objects.filter(
+            student__in=[row['id'] for row in rows]
+        ).values_list('student', 'id', 'subject_code', 'subject_name'):
+            self.optional_subjects[student_id].append({"id": subject_id, "subject_code": code, "subject_name": name})
+
+    def represent(self, row):
+        return {
+            'id': row['id'],
+            'user': {
+                'id': row['user_id'],
+                'username': row['user__username'],
+                'email': row['user__email'],
+                'first_name': row['user__first_name'],
+                'last_name': row['user__last_name'],
+                'is_master': row['user__is_master'],
+                'is_principal': row['user__is_principal'],
+                'is_teacher': row['user__is_teacher'],
+                'is_student': row['user__is_student'],
+                'is_accountant': row['user__is_accountant'],
+                'role': _role(row, 'user__'),
+            },
+            'phone': row['phone'],
+            'address': row['address'],
+            'date_of_birth': row['date_of_birth'].isoformat() if row['date_of_birth'] else None,
+            'parents': row['parents'],
+            'gender': row['gender'],
+            'class_details': {
+                "id": row['class_code_id'],
+                "class_code": row['class_code__class_code'],
+                "class_name": row['class_code__class_name'],
+            } if row['class_code_id'] else None,
+            'roll_no': row['roll_no'],
+            'optional_subjects': self.optional_subjects.get(row['id'], []),
+        }
+
+
+class FastStudentTransactionSerializer(ValuesSerializer):
+    """StudentTransactionSerializer (all fields), for a student's ledger"""
+
+    columns = (
+        'transaction_type', 'balance', 'transaction_date',
+        'bill_id', 'bill__bill_number', 'bill__total_amount', 'bill__month', 'bill__remarks',
+        'payment_id', 'payment__payment_number', 'payment__amount_paid', 'payment__remarks',
+    )
+    date_fields = {'transaction_date': serializers.DateTimeField()}
+
+    def represent(self, row):
+        is_bill = row['transaction_type'] == "bill" and row['bill_id'] is not None
+        is_payment = row['transaction_type'] == "payment" and row['payment_id'] is not None
+        return {
+            "transaction_type": row['transaction_type'],
+            "bill": row['bill_id'],
+            "bill_number": row['bill__bill_number'] if row['bill_id'] else None,
+            "payment": row['payment_id'],
+            "payment_number": row['payment__payment_number'] if row['payment_id'] else None,
+            "balance": _decimal(row['balance']),
+            "transaction_date": self.datetime_field.to_representation(row['transaction_date']),
+            "total_amount": row['bill__total_amount'] if is_bill else None,
+            "paid_amount": row['payment__amount_paid'] if is_payment else None,
+            "month": row['bill__month'] if is_bill else None,
+            "remarks": row['bill__remarks'] if is_bill else row['payment__remarks'] if is_payment else None,
+        }
+
+
+class FastStudentResultSerializer(ValuesSerializer):
+    """GetStudentResultSerializer, for result lists"""
+
+    columns = (
+        'id', 'practical_marks', 'theory_marks', 'total_marks', 'percentage', 'gpa', 'created_by__username', 'created_at',
+        'student_id', 'student__user__username', 'student__user__email', 'student__user__first_name',
+        'student__user__last_name', 'student__gender', 'student__address', 'student__phone', 'student__date_of_birth',
+        'exam_detail_id', 'exam_detail__exam_id', 'exam_detail__exam__name', 'exam_detail__subject_id',
+        'exam_detail__subject__subject_code', 'exam_detail__subject__subject_name', 'exam_detail__class_assigned_id',
+        'exam_detail__class_assigned__class_code', 'exam_detail__class_assigned__class_name',
+        'exam_detail__full_marks', 'exam_detail__pass_marks', 'exam_detail__exam_date',
+    )
+    date_fields = {'created_at': serializers.DateTimeField()}
+
+    def prepare(self, rows):
+        # The nested dates follow the date setting themselves, a column at a time
+        for column in ('student__date_of_birth', 'exam_detail__exam_date'):
+            dates = [row[column] for row in rows]
+            if DateSetting.get_instance().is_ad:
+                dates = [value.strftime('%Y-%m-%d') if value else None for value in dates]
+            else:
+                dates = bs_calendar.convert_many(dates)
+            for row, value in zip(rows, dates):
+                row[column] = value
+
+    def represent(self, row):
+        return {
+            'id': row['id'],
+            'student_details': {
+                "id": row['student_id'],
+                "username": row['student__user__username'],
+                "email": row['student__user__email'],
+                "full_name": f"{row['student__user__first_name']} {row['student__user__last_name']}",
+                "gender": row['student__gender'],
+                "address": row['student__address'],
+                "phone": row['student__phone'],
+                "date_of_birth": row['student__date_of_birth'],
+            },
+            'exam_detail': {
+                "id": row['exam_detail_id'],
+                "exam": {"id": row['exam_detail__exam_id'], "name": row['exam_detail__exam__name']},
+                "subject": {
+                    "id": row['exam_detail__subject_id'],
+                    "subject_code": row['exam_detail__subject__subject_code'],
+                    "subject_name": row['exam_detail__subject__subject_name'],
+                },
+                "class_assigned": {
+                    "id": row['exam_detail__class_assigned_id'],
+                    "class_code": row['exam_detail__class_assigned__class_code'],
+                    "class_name": row['exam_detail__class_assigned__class_name'],
+                } if row['exam_detail__class_assigned_id'] else None,
+                "full_marks": row['exam_detail__full_marks'],
+                "pass_marks": row['exam_detail__pass_marks'],
+                "exam_date": row['exam_detail__exam_date'],
+            },
+            'practical_marks': _decimal(row['practical_marks']),
+            'theory_marks': _decimal(row['theory_marks']),
+            'total_marks': _decimal(row['total_marks']),
+            'percentage': _decimal(row['percentage']),
+            'gpa': _decimal(row['gpa']),
+            'created_by': row['created_by__username'],
+            'created_at': self.datetime_field.to_representation(row['created_at']),
+        }
+
+
+class FastClassAttendanceSerializer(ValuesSerializer):
+    """The "attendance" list of AttendanceByClassAPIView, from DailyAttendance rows"""
+
+    columns = ('student_id', 'student__user__first_name', 'student__user__last_name', 'student__roll_no', 'status')
+
+    def represent(self, row):
+        return {
+            "student_id": row['student_id'],
+            "full_name": f"{row['student__user__first_name']} {row['student__user__last_name']}".strip(),
+            "roll_no": row['student__roll_no'],
+            "status": row['status'],
+        }
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import get_hasher
+
+CHUNK_SIZE = 25  # Passwords per task handed to a process
+MIN_PARALLEL = 50  # Fewer passwords than this are hashed in-process
+
+
+def _encode(hasher, items):
+    return [hasher.encode(password, salt) for password, salt in items]
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Hash `passwords` with the default hasher (as make_password() would) using
+    up to `workers` processes (default: one per CPU). Returns the encoded
+    passwords in order.
+    """
+    hasher = get_hasher('default')
+    items = [(password, hasher.salt()) for password in passwords]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(items) < MIN_PARALLEL:
+        return _encode(hasher, items)
+
+    # "spawn", not fork: forking a web worker with open database connections is unsafe.
+    # Spawned processes import this module without setting Django up, hence no model imports here.
+    chunks = [items[start:start + CHUNK_SIZE] for start in range(0, len(items), CHUNK_SIZE)]
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        encoded = []
+        for chunk in executor.map(_encode, [hasher] * len(chunks), chunks):
+            encoded.extend(chunk)
+    return encoded
@@ -0,0 +1,327 @@
+import csv
+import datetime
+import io
+import itertools
+import re
+
+import nepali_datetime
+from django.db import transaction
+
+from .hashing import hash_passwords
+from .models import Class, CustomUser, DateSetting, Section, Student, StudentEnrolment, Subject, Teacher, TeachingAssignment
+from .typeahead import student_index
+
+GENDERS = ('male', 'female', 'other')
+LIST_SEPARATOR = re.compile(r'[;|]')  # Between the codes of a multi-valued cell ("MATH;SCI")
+LOOKUP_CHUNK = 500
+IMPORT_CHUNK = 2000  # Rows read, checked and written at a time
+
+USER_COLUMNS = ['username', 'password', 'email', 'first_name', 'last_name']
+COLUMNS = {
+    'students': USER_COLUMNS + [
+        'phone', 'address', 'date_of_birth', 'gender', 'parents', 'class_code', 'section', 'roll_no', 'optional_subjects',
+    ],
+    'teachers': USER_COLUMNS + [
+        'phone', 'address', 'date_of_joining', 'gender', 'subjects', 'classes', 'class_teacher', 'class_teacher_section',
+    ],
+}
+REQUIRED = {
+    'students': ['username', 'password', 'phone', 'address', 'date_of_birth', 'gender', 'parents', 'class_code'],
+    'teachers': ['username', 'password', 'phone', 'address', 'date_of_joining', 'gender'],
+}
+
+
+class ImportFileError(Exception):
+    """The file itself can't be imported (unknown format, missing columns, ...)"""
+
+
+def read_rows(file, filename):
+    """
+    Stream the rows of a .csv or .xlsx file as (row number, {column: value}),
+    row numbers counting the header as row 1. Column names are lower-cased.
+    """
+    name = (filename or '').lower()
+    if name.endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportFileError("Reading .xlsx files needs openpyxl (in requirements.txt); upload a .csv instead.")
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    elif name.endswith('.csv'):
+        text = file if isinstance(file, io.TextIOBase) else io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        rows = csv.reader(text)
+    else:
+        raise ImportFileError("Unsupported file type; upload a .csv or .xlsx file.")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    header = [str(column or '').strip().lower() for column in header]
+    for number, values in enumerate(rows, start=2):
+        if values is None or all(value in (None, '') for value in values):
+            continue
+        yield number, dict(zip(header, values))
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Spreadsheets turn phone numbers and roll numbers into floats
+    return str(value).strip()
+
+
+def _codes(value):
+    return [code.strip() for code in LIST_SEPARATOR.split(_text(value)) if code.strip()]
+
+
+def _date(value, is_ad):
+    """A date cell: a spreadsheet date, or YYYY-MM-DD text in the school's date setting (AD or BS)"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    year, month, day = map(int, _text(value).split('-'))
+    if is_ad:
+        return datetime.date(year, month, day)
+    return nepali_datetime.date(year, month, day).to_datetime_date()
+
+
+class PeopleImport:
+    """
+    Validate and bulk-import students or teachers from spreadsheet rows.
+
+    Rows are read IMPORT_CHUNK at a time, so only one chunk of the file is in
+    memory. Each row is checked: required columns, gender, dates, unique
+    username and phone (in the database and within the file), and that the
+    classes, sections and subjects it names exist. The valid rows of a chunk
+    are then created: passwords hashed in a process pool, then users, profiles
+    and their many-to-many links bulk-created. All chunks share one
+    transaction; unless `partial` is set it is rolled back if any row has
+    errors, and writing stops at the first one.
+    """
+
+    def __init__(self, kind, dry_run=False, partial=False, workers=None):
+        if kind not in COLUMNS:
+            raise ImportFileError(f"Unknown import '{kind}'; use one of: {', '.join(COLUMNS)}.")
+        self.kind = kind
+        self.dry_run = dry_run
+        self.partial = partial
+        self.workers = workers
+        self.is_ad = DateSetting.get_instance().is_ad
+
+        self.classes = dict(Class.objects.values_list('class_code', 'id'))
+        self.sections = {
+            (class_id, name.lower()): section_id
+            for section_id, class_id, name in Section.objects.values_list('id', 'school_class_id', 'section_name')
+        }
+        self.subjects = {code: (subject_id, is_optional) for subject_id, code, is_optional in
+                         Subject.objects.values_list('id', 'subject_code', 'is_optional')}
+
+    def run(self, rows):
+        """Import the (row number, values) pairs; returns the report"""
+        rows = iter(rows)
+        seen_usernames, seen_phones = set(), set()
+        errors = []
+        total = valid_count = created = 0
+        with transaction.atomic():
+            while chunk := list(itertools.islice(rows, IMPORT_CHUNK)):
+                if not total:
+                    missing = [column for column in REQUIRED[self.kind] if column not in chunk[0][1]]
+                    if missing:
+                        raise ImportFileError(f"Missing column(s): {', '.join(missing)}.")
+                total += len(chunk)
+                valid = self.check(chunk, seen_usernames, seen_phones, errors)
+                valid_count += len(valid)
+                if valid and not self.dry_run and (self.partial or not errors):
+                    created += self.create(valid)
+            if errors and not self.partial:
+                transaction.set_rollback(True)
+                created = 0
+        return {
+            "kind": self.kind,
+            "rows": total,
+            "valid": valid_count,
+            "created": created,
+            "dry_run": self.dry_run,
+            "errors": errors,
+        }
+
+    def check(self, rows, seen_usernames, seen_phones, errors):
+        """The cleaned valid rows of a chunk; the others' errors are added to `errors`"""
+        taken_usernames, taken_phones = self.taken([values for _, values in rows])
+        valid = []
+        for number, values in rows:
+            cleaned, row_errors = self.clean(values)
+            username, phone = cleaned.get('username'), cleaned.get('phone')
+            if username and (username in taken_usernames or username in seen_usernames):
+                row_errors['username'] = "A user with this username already exists."
+            if phone and (phone in taken_phones or phone in seen_phones):
+                row_errors['phone'] = f"A {self.kind[:-1]} with this phone already exists."
+            seen_usernames.add(username)
+            seen_phones.add(phone)
+
+            if row_errors:
+                errors.append({"row": number, "username": username, "errors": row_errors})
+            else:
+                valid.append(cleaned)
+        return valid
+
+    def taken(self, rows):
+        """Usernames and phones of the file that are already in use"""
+        usernames = [_text(values.get('username')) for values in rows]
+        phones = [_text(values.get('phone')) for values in rows]
+        model = Student if self.kind == 'students' else Teacher
+        taken_usernames, taken_phones = set(), set()
+        for start in range(0, len(rows), LOOKUP_CHUNK):
+            taken_usernames.update(CustomUser.objects.filter(
+                username__in=usernames[start:start + LOOKUP_CHUNK]
+            ).values_list('username', flat=True))
+            taken_phones.update(model.objects.filter(
+                phone__in=phones[start:start + LOOKUP_CHUNK]
+            ).values_list('phone', flat=True))
+        return taken_usernames, taken_phones
+
+    def clean(self, values):
+        """The row's values ready to be saved, and {column: error}"""
+        cleaned = {column: _text(values.get(column)) for column in COLUMNS[self.kind]}
+        errors = {
+            column: "This field is required."
+            for column in REQUIRED[self.kind] if not cleaned[column]
+        }
+        for column, max_length in (('username', 150), ('phone', 15), ('parents', 15), ('roll_no', 10)):
+            if column in cleaned and len(cleaned[column]) > max_length:
+                errors[column] = f"At most {max_length} characters."
+        if cleaned['gender'] and cleaned['gender'].lower() not in GENDERS:
+            errors['gender'] = f"Must be one of: {', '.join(GENDERS)}."
+        cleaned['gender'] = cleaned['gender'].lower()
+
+        date_column = 'date_of_birth' if self.kind == 'students' else 'date_of_joining'
+        if cleaned[date_column]:
+            try:
+                cleaned[date_column] = _date(values.get(date_column), self.is_ad)
+            except (TypeError, ValueError):
+                errors[date_column] = f"Invalid {'AD' if self.is_ad else 'BS'} date; use YYYY-MM-DD."
+
+        if self.kind == 'students':
+            self.clean_student(cleaned, values, errors)
+        else:
+            self.clean_teacher(cleaned, values, errors)
+        return cleaned, errors
+
+    def class_and_section(self, cleaned, class_column, section_column, errors):
+        class_id = section_id = None
+        if cleaned[class_column]:
+            class_id = self.classes.get(cleaned[class_column])
+            if class_id is None:
+                errors[class_column] = f"No class with code '{cleaned[class_column]}'."
+        if cleaned[section_column] and class_id is not None:
+            section_id = self.sections.get((class_id, cleaned[section_column].lower()))
+            if section_id is None:
+                errors[section_column] = f"Class '{cleaned[class_column]}' has no section '{cleaned[section_column]}'."
+        elif cleaned[section_column] and class_column not in errors:
+            errors[section_column] = f"A section needs {class_column}."
+        return class_id, section_id
+
+    def subject_ids(self, codes, column, errors, optional_only=False):
+        ids = []
+        for code in codes:
+            subject = self.subjects.get(code)
+            if subject is None:
+                errors[column] = f"No subject with code '{code}'."
+            elif optional_only and not subject[1]:
+                errors[column] = f"Subject '{code}' is not optional."
+            else:
+                ids.append(subject[0])
+        return ids
+
+    def clean_student(self, cleaned, values, errors):
+        cleaned['class_id'], cleaned['section_id'] = self.class_and_section(cleaned, 'class_code', 'section', errors)
+        cleaned['subject_ids'] = self.subject_ids(
+            _codes(values.get('optional_subjects')), 'optional_subjects', errors, optional_only=True
+        )
+
+    def clean_teacher(self, cleaned, values, errors):
+        cleaned['class_teacher_id'], cleaned['class_teacher_section_id'] = self.class_and_section(
+            cleaned, 'class_teacher', 'class_teacher_section', errors
+        )
+        cleaned['subject_ids'] = self.subject_ids(_codes(values.get('subjects')), 'subjects', errors)
+        cleaned['class_ids'] = []
+        for code in _codes(values.get('classes')):
+            if code in self.classes:
+                cleaned['class_ids'].append(self.classes[code])
+            else:
+                errors['classes'] = f"No class with code '{code}'."
+
+    def create(self, rows):
+        passwords = hash_passwords([row['password'] for row in rows], workers=self.workers)
+        is_student = self.kind == 'students'
+        with transaction.atomic():
+            users = CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=row['username'],
+                    password=password,
+                    email=row['email'],
+                    first_name=row['first_name'],
+                    last_name=row['last_name'],
+                    is_student=is_student,
+                    is_teacher=not is_student,
+                )
+                for row, password in zip(rows, passwords)
+            ])
+            if is_student:
+                self.create_students(rows, users)
+                transaction.on_commit(student_index.invalidate)  # bulk_create sends no signals
+            else:
+                self.create_teachers(rows, users)
+        return len(users)
+
+    def create_students(self, rows, users):
+        students = Student.objects.bulk_create([
+            Student(
+                user=user,
+                phone=row['phone'],
+                address=row['address'],
+                date_of_birth=row['date_of_birth'],
+                gender=row['gender'],
+                parents=row['parents'],
+                class_code_id=row['class_id'],
+                class_code_section_id=row['section_id'],
+                roll_no=row['roll_no'] or None,
+            )
+            for row, user in zip(rows, users)
+        ])
+        Student.optional_subjects.through.objects.bulk_create([
+            Student.optional_subjects.through(student_id=student.id, subject_id=subject_id)
+            for row, student in zip(rows, students)
+            for subject_id in set(row['subject_ids'])
+        ])
+        StudentEnrolment.sync_for([student.id for student in students])
+        return students
+
+    def create_teachers(self, rows, users):
+        teachers = Teacher.objects.bulk_create([
+            Teacher(
+                user=user,
+                phone=row['phone'],
+                address=row['address'],
+                date_of_joining=row['date_of_joining'],
+                gender=row['gender'],
+                class_teacher_id=row['class_teacher_id'],
+                class_teacher_section_id=row['class_teacher_section_id'],
+            )
+            for row, user in zip(rows, users)
+        ])
+        Teacher.subjects.through.objects.bulk_create([
+            Teacher.subjects.through(teacher_id=teacher.id, subject_id=subject_id)
+            for row, teacher in zip(rows, teachers)
+            for subject_id in set(row['subject_ids'])
+        ])
+        Teacher.classes.through.objects.bulk_create([
+            Teacher.classes.through(teacher_id=teacher.id, class_id=class_id)
+            for row, teacher in zip(rows, teachers)
+            for class_id in set(row['class_ids'])
+        ])
+        TeachingAssignment.sync_for([teacher.id for teacher in teachers])
+        return teachers
@@ -0,0 +1,148 @@
+import datetime
+import json
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.fast_serializers import (
+    FastClassAttendanceSerializer, FastStudentResultSerializer, FastStudentSerializer, FastStudentTransactionSerializer,
+)
+from myapp.models import (
+    Class, CustomUser, DailyAttendance, Exam, ExamDetail, Section, Student, StudentResult, StudentTransaction, Subject,
+)
+from myapp.serializers import GetStudentResultSerializer, GetStudentSerializer, StudentTransactionSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU time and peak memory of the DRF list serializers with their fast_serializers "
+        "counterparts on generated N-row lists (created in a transaction that is rolled back), as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Rows per list.")
+        parser.add_argument('--iterations', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = {}
+        try:
+            with transaction.atomic():
+                cases = self.make_rows(options['rows'])
+                for name, drf, fast in cases:
+                    results[name] = {
+                        "drf": self.measure(drf, options['iterations']),
+                        "fast": self.measure(fast, options['iterations']),
+                    }
+                    drf_result, fast_result = results[name]["drf"], results[name]["fast"]
+                    results[name]["cpu_speedup"] = round(drf_result["cpu_ms"] / fast_result["cpu_ms"], 2)
+                    results[name]["memory_saving"] = round(1 - fast_result["peak_kb"] / drf_result["peak_kb"], 3)
+                    self.stderr.write(
+                        f"{name:12} DRF {drf_result['cpu_ms']:9.1f} ms {drf_result['peak_kb']:9.0f} KB   "
+                        f"fast {fast_result['cpu_ms']:8.1f} ms {fast_result['peak_kb']:8.0f} KB   "
+                        f"x{results[name]['cpu_speedup']}"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(json.dumps({"rows": options['rows'], "benchmarks": results}, indent=2, sort_keys=True))
+
+    def measure(self, serialize, iterations):
+        """Median CPU time of serializing the list (queries included), then its peak traced memory"""
+        serialize()  # Warm up (DateSetting, ...)
+        timings = []
+        for _ in range(iterations):
+            started = time.process_time()
+            serialize()
+            timings.append((time.process_time() - started) * 1000)
+
+        tracemalloc.start()
+        serialize()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {"cpu_ms": round(statistics.median(timings), 1), "peak_kb": round(peak / 1024)}
+
+    def make_rows(self, rows):
+        """A class of `rows` students with a result and an attendance record each, and `rows` transactions"""
+        subjects = Subject.objects.bulk_create([
+            Subject(subject_code=f"BENCH{index}", subject_name=f"Bench subject {index}") for index in range(2)
+        ])
+        school_class = Class.objects.create(class_code="BENCH", class_name="Benchmark")
+        section = Section.objects.create(school_class=school_class, section_name="A")
+        creator = CustomUser.objects.create(username="bench_creator", is_principal=True)
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"bench_{index}", password="!", first_name="Bench", last_name=f"Student {index}",
+                       is_student=True)
+            for index in range(rows)
+        ])
+        students = Student.objects.bulk_create([
+            Student(user=user, phone=f"B{index:09d}", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                    gender="male", parents="9800000000", class_code=school_class, class_code_section=section,
+                    roll_no=str(index))
+            for index, user in enumerate(users)
+        ])
+        Student.optional_subjects.through.objects.bulk_create([
+            Student.optional_subjects.through(student_id=student.id, subject_id=subjects[1].id) for student in students
+        ])
+
+        exam_detail = ExamDetail.objects.bulk_create([ExamDetail(
+            exam=Exam.objects.create(name="Benchmark"), subject=subjects[0], class_assigned=school_class,
+            full_marks=100, pass_marks=40, exam_date=datetime.date(2024, 5, 1), created_by=creator,
+        )])[0]
+        StudentResult.objects.bulk_create([
+            StudentResult(student=student, exam_detail=exam_detail, practical_marks=Decimal('20'),
+                          theory_marks=Decimal('50'), total_marks=Decimal('70'), percentage=Decimal('70'),
+                          gpa=Decimal('2.8'), created_by=creator)
+            for student in students
+        ])
+        day = datetime.date(2024, 5, 2)
+        DailyAttendance.objects.bulk_create([
+            DailyAttendance(student=student, date=day, status=index % 10 != 0) for index, student in enumerate(students)
+        ])
+        now = timezone.now()
+        StudentTransaction.objects.bulk_create([
+            StudentTransaction(student=students[0], transaction_type='payment', balance=Decimal(index),
+                               transaction_date=now)
+            for index in range(rows)
+        ])
+
+        students = Student.objects.filter(class_code=school_class)
+        results = StudentResult.objects.filter(exam_detail=exam_detail)
+        transactions = StudentTransaction.objects.filter(student=students[0])
+        attendance = DailyAttendance.objects.filter(student__class_code=school_class, date=day)
+        # The DRF side with its related rows joined or prefetched, as fast as it goes
+        return [
+            ('students',
+             lambda: GetStudentSerializer(GetStudentSerializer().plan_queryset(students), many=True).data,
+             lambda: FastStudentSerializer(students).data),
+            ('transactions',
+             lambda: StudentTransactionSerializer(transactions.select_related('bill', 'payment'), many=True).data,
+             lambda: FastStudentTransactionSerializer(transactions).data),
+            ('results',
+             lambda: GetStudentResultSerializer(results.select_related(
+                 'student__user', 'exam_detail__exam', 'exam_detail__subject', 'exam_detail__class_assigned',
+                 'created_by',
+             ), many=True).data,
+             lambda: FastStudentResultSerializer(results).data),
+            ('attendance',
+             lambda: [
+                 {
+                     "student_id": record.student.id,
+                     "full_name": f"{record.student.user.first_name} {record.student.user.last_name}".strip(),
+                     "roll_no": record.student.roll_no,
+                     "status": record.status,
+                 }
+                 for record in attendance.select_related('student__user')
+             ],
+             lambda: FastClassAttendanceSerializer(attendance).data),
+        ]
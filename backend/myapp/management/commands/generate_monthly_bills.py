@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.billing import generate_monthly_bills
+from myapp.models import Class
+
+
+class Command(BaseCommand):
+    help = "Bill every student of the given classes (default: the whole school) for a month, in one transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', help='Month to bill, e.g. "Baisakh".')
+        parser.add_argument('--class-id', type=int, action='append', dest='class_ids', help='Class to bill (repeatable).')
+        parser.add_argument('--remarks', default=None)
+        parser.add_argument('--chunk-size', type=int, default=500, help='Students inserted per batch.')
+
+    def handle(self, *args, **options):
+        class_ids = options['class_ids']
+        if class_ids:
+            missing = set(class_ids) - set(Class.objects.filter(id__in=class_ids).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Class(es) not found: {', '.join(map(str, sorted(missing)))}")
+
+        def progress(done, total):
+            self.stdout.write(f"Billed {done}/{total} students")
+
+        summary = generate_monthly_bills(
+            options['month'],
+            class_ids=class_ids,
+            remarks=options['remarks'],
+            chunk_size=options['chunk_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {summary['students_billed']} bill(s) for {summary['month']}, total {summary['total_amount']}."
+        ))
@@ -0,0 +1,329 @@
+import datetime
+import random
+import zlib
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.attendance import build_monthly_attendance, refresh_attendance_rollup
+from myapp.billing import generate_monthly_bills
+from myapp.models import (
+    Accountant, Class, Communication, CustomUser, DailyAttendance, DiscussionComment, DiscussionPost, Exam,
+    ExamDetail, FeeCategory, FeeCategoryName, MonthlyAttendance, NumberSequence, Principal, Section, Student,
+    StudentAccount, StudentBill, StudentEnrolment, StudentPayment, StudentResult, StudentTransaction, Subject,
+    Teacher, TeachingAssignment, TransportationFee, first_free_number,
+)
+from myapp.results import recalculate_rankings, recompute_overall_results
+from myapp.typeahead import student_index
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic school (classes, sections, subjects, teachers, students, attendance, bills, "
+        "payments, exam results, forum threads and messages) for benchmarking. Every generated user has "
+        "the username prefix and the given password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='gen', help="Username/code prefix of the generated rows.")
+        parser.add_argument('--classes', type=int, default=10)
+        parser.add_argument('--sections', type=int, default=2, help="Sections per class.")
+        parser.add_argument('--subjects', type=int, default=6, help="Subjects per class (the last one optional).")
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--teachers', type=int, default=60)
+        parser.add_argument('--days', type=int, default=180, help="School days of attendance, back from today.")
+        parser.add_argument('--months', type=int, default=6, help="Months of bills and payments (at most 12).")
+        parser.add_argument('--exams', type=int, default=2)
+        parser.add_argument('--posts', type=int, default=200, help="Forum threads (with a few comments each).")
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--password', default='password123')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.prefix = options['prefix']
+        self.random = random.Random(options['seed'])
+        self.password = make_password(options['password'])  # Hashed once, shared by every generated user
+        if CustomUser.objects.filter(username=f"{self.prefix}_principal").exists():
+            raise CommandError(f"Data with the prefix '{self.prefix}' already exists; use another --prefix.")
+        if not 0 <= options['months'] <= 12:
+            raise CommandError("--months must be between 0 and 12.")
+
+        with transaction.atomic():
+            self.staff()
+            classes = self.classes(options['classes'], options['sections'], options['subjects'])
+            self.teachers(options['teachers'], classes)
+            students = self.students(options['students'], classes)
+            self.attendance(students, options['days'])
+
+        # Billing runs its own transactions, one per month
+        self.billing(classes, options['months'])
+
+        with transaction.atomic():
+            self.exams(classes, students, options['exams'])
+            self.forum(options['posts'])
+            self.messages(options['messages'], classes)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(students)} students in {len(classes)} classes (prefix '{self.prefix}')."
+        ))
+
+    def log(self, message):
+        self.stdout.write(f"  {message}")
+
+    def make_users(self, names, **flags):
+        return CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f"{self.prefix}_{name}", password=self.password, first_name=name.split('_')[0].title(),
+                last_name=name.split('_')[-1], email=f"{self.prefix}_{name}@example.com", **flags
+            )
+            for name in names
+        ], batch_size=BATCH_SIZE)
+
+    def phone(self, kind, number):
+        return f"{kind}{zlib.crc32(self.prefix.encode()) % 1000:03d}{number:06d}"
+
+    def staff(self):
+        principal, accountant = self.make_users(['principal', 'accountant'])
+        principal.is_principal = True
+        accountant.is_accountant = True
+        CustomUser.objects.bulk_update([principal, accountant], ['is_principal', 'is_accountant'])
+        Principal.objects.create(user=principal, phone=self.phone(1, 0), address="School", gender="male")
+        Accountant.objects.create(
+            user=accountant, phone=self.phone(2, 0), address="School", date_of_joining=datetime.date(2015, 4, 14),
+            gender="female",
+        )
+        self.principal = principal
+
+    def classes(self, class_count, section_count, subject_count):
+        classes = Class.objects.bulk_create([
+            Class(class_code=f"{self.prefix.upper()}{grade}", class_name=f"Grade {grade} ({self.prefix})")
+            for grade in range(1, class_count + 1)
+        ])
+        for school_class in classes:
+            subjects = Subject.objects.bulk_create([
+                Subject(
+                    subject_code=f"{school_class.class_code}-{index}", subject_name=f"Subject {index}",
+                    credit_hours=Decimal('4.00'), is_optional=index == subject_count,
+                )
+                for index in range(1, subject_count + 1)
+            ])
+            school_class.subjects.set(subjects)
+            school_class.optional_subjects.set(subjects[-1:])
+            school_class.subject_list = subjects
+            school_class.section_list = Section.objects.bulk_create([
+                Section(school_class=school_class, section_name=chr(ord('A') + index)) for index in range(section_count)
+            ])
+        self.log(f"{len(classes)} classes with {section_count} sections and {subject_count} subjects each")
+        return classes
+
+    def teachers(self, count, classes):
+        users = self.make_users([f"teacher_{number}" for number in range(1, count + 1)], is_teacher=True)
+        teachers = Teacher.objects.bulk_create([
+            Teacher(
+                user=user, phone=self.phone(3, number), address="Kathmandu",
+                date_of_joining=datetime.date(2015, 4, 14) + datetime.timedelta(days=30 * number),
+                gender=self.random.choice(['male', 'female']),
+                class_teacher=classes[number % len(classes)] if number < len(classes) else None,
+            )
+            for number, user in enumerate(users)
+        ], batch_size=BATCH_SIZE)
+
+        subject_links, class_links, section_links = [], [], []
+        for number, teacher in enumerate(teachers):
+            for school_class in {classes[number % len(classes)], classes[(number * 7 + 3) % len(classes)]}:
+                class_links.append(Teacher.classes.through(teacher_id=teacher.id, class_id=school_class.id))
+                subject = school_class.subject_list[number % len(school_class.subject_list)]
+                subject_links.append(Teacher.subjects.through(teacher_id=teacher.id, subject_id=subject.id))
+                section = school_class.section_list[number % len(school_class.section_list)]
+                section_links.append(Teacher.classes_section.through(teacher_id=teacher.id, section_id=section.id))
+        Teacher.subjects.through.objects.bulk_create(subject_links, ignore_conflicts=True)
+        Teacher.classes.through.objects.bulk_create(class_links, ignore_conflicts=True)
+        Teacher.classes_section.through.objects.bulk_create(section_links, ignore_conflicts=True)
+        TeachingAssignment.sync_for([teacher.id for teacher in teachers])
+        self.teacher_list = teachers
+        self.log(f"{len(teachers)} teachers")
+
+    def students(self, count, classes):
+        users = self.make_users([f"student_{number}" for number in range(1, count + 1)], is_student=True)
+        rows = []
+        for number, user in enumerate(users):
+            school_class = classes[number % len(classes)]
+            section = school_class.section_list[number // len(classes) % len(school_class.section_list)]
+            rows.append(Student(
+                user=user, phone=self.phone(4, number), address="Lalitpur",
+                date_of_birth=datetime.date(2008, 1, 1) + datetime.timedelta(days=number % 2500),
+                gender=self.random.choice(['male', 'female']), parents=self.phone(5, number)[:15],
+                class_code=school_class, class_code_section=section, roll_no=str(number // len(classes) + 1),
+            ))
+        students = Student.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+        by_class = {school_class.id: school_class for school_class in classes}
+        Student.optional_subjects.through.objects.bulk_create([
+            Student.optional_subjects.through(student_id=student.id, subject_id=by_class[student.class_code_id].subject_list[-1].id)
+            for student in students if self.random.random() < 0.5
+        ], batch_size=BATCH_SIZE)
+        StudentAccount.ensure_for([student.id for student in students])
+        StudentEnrolment.sync_for([student.id for student in students])
+        transaction.on_commit(student_index.invalidate)  # Make running servers re-read the typeahead index
+        self.log(f"{len(students)} students")
+        return students
+
+    def attendance(self, students, days):
+        dates = []
+        day = timezone.now().date()
+        while len(dates) < days:
+            day -= datetime.timedelta(days=1)
+            if day.weekday() != 5:  # Saturday is the weekly holiday
+                dates.append(day)
+
+        teacher_by_class = {teacher.class_teacher_id: teacher for teacher in self.teacher_list if teacher.class_teacher_id}
+        records = []
+        for date in dates:
+            for student in students:
+                records.append(DailyAttendance(
+                    student_id=student.id, date=date, status=self.random.random() < 0.9,
+                    recorded_by=teacher_by_class.get(student.class_code_id),
+                ))
+            if len(records) >= 20 * BATCH_SIZE:
+                DailyAttendance.objects.bulk_create(records, batch_size=BATCH_SIZE)
+                records = []
+        DailyAttendance.objects.bulk_create(records, batch_size=BATCH_SIZE)
+
+        student_ids = [student.id for student in students]
+        MonthlyAttendance.objects.bulk_create(
+            build_monthly_attendance(
+                DailyAttendance.objects.filter(student_id__in=student_ids)
+                .values_list('student_id', 'date', 'status').iterator(chunk_size=5000)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        class_ids = sorted({student.class_code_id for student in students})
+        for date in dates:
+            refresh_attendance_rollup(date, class_ids)
+        self.log(f"{len(dates)} days of attendance")
+
+    def billing(self, classes, months):
+        fee_names = [FeeCategoryName.objects.get_or_create(name=name)[0] for name in ["Tuition Fee", "Exam Fee", "Computer Fee"]]
+        FeeCategory.objects.bulk_create([
+            FeeCategory(class_assigned=school_class, fee_category_name=fee_name, amount=Decimal(amount + 100 * grade))
+            for grade, school_class in enumerate(classes)
+            for fee_name, amount in zip(fee_names, [2500, 500, 300])
+        ])
+        TransportationFee.objects.bulk_create([
+            TransportationFee(place=f"Route {number} ({self.prefix})", amount=Decimal(800 + 100 * number)) for number in range(3)
+        ])
+
+        class_ids = [school_class.id for school_class in classes]
+        today = timezone.now().date()
+        for offset in range(months - 1, -1, -1):
+            month_index = today.month - 1 - offset  # May go negative: wraps into last year
+            month = datetime.date(today.year + month_index // 12, month_index % 12 + 1, 1).strftime("%B")
+            summary = generate_monthly_bills(month, class_ids=class_ids, remarks=f"Generated ({self.prefix})")
+            self.pay_bills(month, class_ids)
+            self.log(f"{summary['students_billed']} bills and their payments for {month}")
+
+    def pay_bills(self, month, class_ids):
+        """Pay most of the month's bills in full, in bulk, keeping the accounts in step"""
+        bills = [
+            bill for bill in StudentBill.objects.filter(month=month, student__class_code_id__in=class_ids).only('student_id', 'total_amount')
+            if self.random.random() < 0.8
+        ]
+        if not bills:
+            return
+        now = timezone.now()
+        year = now.year
+        numbers = NumberSequence.reserve(
+            "P", year, len(bills), initial=lambda: first_free_number(StudentPayment, 'payment_number', "P", year)
+        )
+        with transaction.atomic():
+            payments = StudentPayment.objects.bulk_create([
+                StudentPayment(
+                    student_id=bill.student_id, date=now, payment_number=f"{year}P{str(number).zfill(2)}",
+                    amount_paid=bill.total_amount, created_by=self.principal,
+                )
+                for bill, number in zip(bills, numbers)
+            ], batch_size=BATCH_SIZE)
+            accounts = {account.student_id: account for account in StudentAccount.objects.filter(student_id__in=[bill.student_id for bill in bills])}
+            transactions = []
+            for payment in payments:
+                account = accounts[payment.student_id]
+                account.balance -= payment.amount_paid
+                account.updated_at = now
+                transactions.append(StudentTransaction(
+                    student_id=payment.student_id, transaction_type='payment', payment=payment,
+                    balance=account.balance, transaction_date=now,
+                ))
+            StudentAccount.objects.bulk_update(accounts.values(), ['balance', 'updated_at'], batch_size=BATCH_SIZE)
+            StudentTransaction.objects.bulk_create(transactions, batch_size=BATCH_SIZE)
+
+    def exams(self, classes, students, count):
+        students_by_class = {}
+        for student in students:
+            students_by_class.setdefault(student.class_code_id, []).append(student)
+
+        for number in range(1, count + 1):
+            exam = Exam.objects.create(
+                name=f"Terminal Exam {number} ({self.prefix})", is_timetable_published=True, is_result_published=True
+            )
+            details = ExamDetail.objects.bulk_create([
+                ExamDetail(
+                    exam=exam, subject=subject, class_assigned=school_class, full_marks=100, pass_marks=40,
+                    exam_date=timezone.now().date() - datetime.timedelta(days=60 * (count - number + 1) + index),
+                    exam_time=datetime.time(10, 0), created_by=self.principal,
+                )
+                for school_class in classes
+                for index, subject in enumerate(school_class.subject_list)
+            ])
+            results = []
+            for detail in details:
+                for student in students_by_class.get(detail.class_assigned_id, []):
+                    result = StudentResult(
+                        student=student, exam_detail=detail, created_by=self.principal,
+                        theory_marks=Decimal(self.random.randint(20, 75)), practical_marks=Decimal(self.random.randint(5, 25)),
+                    )
+                    result.calculate_marks()
+                    results.append(result)
+            StudentResult.objects.bulk_create(results, batch_size=BATCH_SIZE)
+            recompute_overall_results(exam, [student.id for student in students])
+            recalculate_rankings(exam)
+            self.log(f"{exam.name}: {len(results)} results")
+
+    def forum(self, count):
+        authors = [self.principal] + [teacher.user for teacher in self.teacher_list]
+        posts = DiscussionPost.objects.bulk_create([
+            DiscussionPost(topic=f"Topic {number}", content=f"Discussion thread {number}.", created_by=self.random.choice(authors))
+            for number in range(1, count + 1)
+        ], batch_size=BATCH_SIZE)
+        comments = DiscussionComment.objects.bulk_create([
+            DiscussionComment(post=post, content=f"Comment {index} on {post.topic}.", created_by=self.random.choice(authors))
+            for post in posts
+            for index in range(self.random.randint(0, 4))
+        ], batch_size=BATCH_SIZE)
+        DiscussionComment.objects.bulk_create([
+            DiscussionComment(post=comment.post, parent=comment, content="Reply.", created_by=self.random.choice(authors))
+            for comment in comments if self.random.random() < 0.3
+        ], batch_size=BATCH_SIZE)
+        self.log(f"{len(posts)} forum threads, {len(comments)} comments")
+
+    def messages(self, count, classes):
+        senders = [self.principal] + [teacher.user for teacher in self.teacher_list]
+        receivers = list(CustomUser.objects.filter(username__startswith=f"{self.prefix}_student_").values_list('id', flat=True)[:500])
+        roles = ['teacher', 'student', 'accountant', 'all']
+        messages = Communication.objects.bulk_create([
+            Communication(
+                sender=self.random.choice(senders), subject=f"Notice {number}", message=f"Message {number}.",
+                receiver_id=self.random.choice(receivers) if receivers and number % 2 else None,
+                receiver_role=None if receivers and number % 2 else self.random.choice(roles),
+            )
+            for number in range(1, count + 1)
+        ], batch_size=BATCH_SIZE)
+        Communication.class_field.through.objects.bulk_create([
+            Communication.class_field.through(communication_id=message.id, class_id=self.random.choice(classes).id)
+            for message in messages if message.receiver_role
+        ], batch_size=BATCH_SIZE)
+        self.log(f"{len(messages)} messages")
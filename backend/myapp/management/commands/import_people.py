@@ -0,0 +1,34 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.importer import COLUMNS, ImportFileError, PeopleImport, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Register students or teachers in bulk from a .csv or .xlsx file. Every row is validated first; "
+        "passwords are hashed in parallel. Prints the per-row error report as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(COLUMNS))
+        parser.add_argument('path', help="The .csv or .xlsx file.")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate, import nothing.")
+        parser.add_argument('--partial', action='store_true', help="Import the valid rows even if others have errors.")
+        parser.add_argument('--workers', type=int, help="Password hashing processes (default: one per CPU).")
+
+    def handle(self, *args, **options):
+        importer = PeopleImport(
+            options['kind'], dry_run=options['dry_run'], partial=options['partial'], workers=options['workers']
+        )
+        try:
+            with open(options['path'], 'rb') as file:
+                report = importer.run(read_rows(file, options['path']))
+        except (OSError, ImportFileError, UnicodeDecodeError, csv.Error) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(report, indent=2, default=str))
+        summary = f"{report['created']} of {report['rows']} {options['kind']} imported, {len(report['errors'])} row(s) with errors."
+        self.stderr.write(self.style.SUCCESS(summary) if not report['errors'] else self.style.WARNING(summary))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from myapp.revocation import revocation_list
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete revoked tokens that have expired anyway, keeping the RevokedToken table (and every "
+        "worker's filter of it) small. Meant to run on a schedule, e.g. hourly from cron."
+    )
+
+    def handle(self, *args, **options):
+        deleted = revocation_list.prune()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} expired revoked token(s)."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.attendance import build_monthly_attendance
+from myapp.models import DailyAttendance, MonthlyAttendance
+
+
+class Command(BaseCommand):
+    help = "Rebuild the MonthlyAttendance bitmaps from DailyAttendance (all years, or only --year)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Only rebuild this (AD) year.")
+
+    def handle(self, *args, **options):
+        records = DailyAttendance.objects.all()
+        months = MonthlyAttendance.objects.all()
+        if options['year']:
+            records = records.filter(date__year=options['year'])
+            months = months.filter(year=options['year'])
+
+        with transaction.atomic():
+            months.delete()
+            rows = build_monthly_attendance(
+                records.values_list('student_id', 'date', 'status').iterator(chunk_size=5000)
+            )
+            MonthlyAttendance.objects.bulk_create(rows, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(rows)} monthly attendance row(s)."))
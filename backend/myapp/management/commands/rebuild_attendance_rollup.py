@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.attendance import refresh_attendance_rollup
+from myapp.models import AttendanceDailyRollup, Class, DailyAttendance
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild AttendanceDailyRollup from DailyAttendance (all days, or --start/--end). "
+        "Totals use the current class enrolment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        records = DailyAttendance.objects.all()
+        rollups = AttendanceDailyRollup.objects.all()
+        if options['start']:
+            records = records.filter(date__gte=options['start'])
+            rollups = rollups.filter(date__gte=options['start'])
+        if options['end']:
+            records = records.filter(date__lte=options['end'])
+            rollups = rollups.filter(date__lte=options['end'])
+
+        class_ids = list(Class.objects.values_list('id', flat=True)) + [None]  # None: students without a class
+        with transaction.atomic():
+            rollups.delete()
+            dates = list(records.values_list('date', flat=True).distinct().order_by('date'))
+            for date in dates:
+                refresh_attendance_rollup(date, class_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the attendance rollup of {len(dates)} day(s)."))
@@ -0,0 +1,172 @@
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from myapp.models import (
+    Class, CustomUser, DailyAttendance, Exam, Student, StudentBill, StudentOverallResult, StudentResult, Teacher,
+)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the key endpoints in-process against the current database (see generate_school_data) and write "
+        "latency percentiles and query counts as JSON, for diffing between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='gen', help="Prefix the data was generated with.")
+        parser.add_argument('--password', default='password123', help="Password of the generated users (login).")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per endpoint first.")
+        parser.add_argument('--only', nargs='*', help="Only run these benchmarks (by name).")
+        parser.add_argument('--output', help="Write the JSON here instead of stdout.")
+
+    def handle(self, *args, **options):
+        benchmarks = self.benchmarks(options)
+        if options['only']:
+            unknown = set(options['only']) - {name for name, *_ in benchmarks}
+            if unknown:
+                raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+            benchmarks = [benchmark for benchmark in benchmarks if benchmark[0] in options['only']]
+
+        results = {}
+        for name, method, path, data, user, writes in benchmarks:
+            # Throttling off: the repeated logins and searches would otherwise be answered 429
+            with override_settings(THROTTLE_BUCKETS={}):
+                results[name] = self.measure(method, path, data, user, writes, options['iterations'], options['warmup'])
+            self.stderr.write(
+                f"{name:24} p50 {results[name]['p50_ms']:8.2f} ms  p99 {results[name]['p99_ms']:8.2f} ms  "
+                f"{results[name]['queries']:4} queries"
+            )
+
+        report = {
+            "environment": self.environment(),
+            "dataset": {
+                "students": Student.objects.count(),
+                "teachers": Teacher.objects.count(),
+                "attendance_records": DailyAttendance.objects.count(),
+                "bills": StudentBill.objects.count(),
+                "results": StudentResult.objects.count(),
+            },
+            "iterations": options['iterations'],
+            "benchmarks": results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def benchmarks(self, options):
+        """(name, method, path, data, user, writes) of every benchmark, resolved against the generated data"""
+        prefix = options['prefix']
+        try:
+            principal = CustomUser.objects.get(username=f"{prefix}_principal")
+            accountant = CustomUser.objects.get(username=f"{prefix}_accountant")
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No data with the prefix '{prefix}'; run generate_school_data first.")
+
+        result = (
+            StudentOverallResult.objects.filter(student__user__username__startswith=f"{prefix}_student_")
+            .select_related('student__user', 'student__class_code').order_by('exam_id', 'student_id').first()
+        )
+        if result is None:
+            raise CommandError("The generated data has no exam results; generate it with --exams 1 or more.")
+        student, exam = result.student, result.exam_id
+        school_class = student.class_code
+        teacher = Teacher.objects.filter(class_teacher=school_class).select_related('user').first() or \
+            Teacher.objects.filter(user__username__startswith=f"{prefix}_teacher_").select_related('user').first()
+        class_students = list(Student.objects.filter(class_code=school_class).values_list('id', flat=True))
+        today = timezone.now().date()
+
+        return [
+            ('login', 'post', '/api/login/', {'username': student.user.username, 'password': options['password']}, None, False),
+            ('marksheet', 'get', f'/api/marksheet/{student.id}/{exam}/', None, principal, False),
+            ('rankings', 'get', f'/api/rankings/{exam}/{school_class.id}/', None, principal, False),
+            ('subject_toppers', 'get', f'/api/rankings/{exam}/{school_class.id}/toppers/', None, principal, False),
+            ('transactions', 'get', f'/api/transactions/{student.id}/', None, accountant, False),
+            ('bills', 'get', f'/api/bills/{student.id}/', None, accountant, False),
+            ('students', 'get', '/api/students/', None, principal, False),
+            ('students_page', 'get', '/api/students/?page_size=50&fields=id,roll_no,user.first_name,user.last_name', None, principal, False),
+            ('teachers', 'get', '/api/teachers/', None, principal, False),
+            ('dashboard', 'get', '/api/dashboard/', None, principal, False),
+            ('dashboard_stats', 'get', '/api/dashboard-stats/', None, principal, False),
+            ('fee_summary', 'get', '/api/fee-summary/', None, accountant, False),
+            ('finance_summary', 'get', '/api/finance-summary/', None, accountant, False),
+            ('attendance_summary', 'get', f'/api/attendance-summary/{today - timezone.timedelta(days=1)}/', None, principal, False),
+            ('attendance_trend', 'get', '/api/attendance-trend/', None, principal, False),
+            ('attendance_register', 'get', f'/api/attendance/register/{school_class.id}/{today.year}/{today.month}/', None, teacher.user, False),
+            ('attendance_submit', 'post', '/api/attendance/',
+             {'attendance': [{'student': student_id, 'status': True} for student_id in class_students]}, teacher.user, True),
+        ]
+
+    def measure(self, method, path, data, user, writes, iterations, warmup):
+        client = APIClient(SERVER_NAME="localhost")
+        if user is not None:
+            client.force_authenticate(user)
+        request = getattr(client, method)
+
+        def call():
+            if writes:
+                # Roll every write back so each iteration sees the same data
+                with transaction.atomic():
+                    response = request(path, data, format='json')
+                    transaction.set_rollback(True)
+                return response
+            return request(path, data, format='json') if data is not None else request(path)
+
+        for _ in range(warmup):
+            call()
+
+        timings, query_counts, statuses = [], [], set()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = call()
+                timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len([query for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]))
+            statuses.add(response.status_code)
+
+        return {
+            "method": method.upper(),
+            "path": path,
+            "status": sorted(statuses),
+            "queries": int(statistics.median(query_counts)),
+            "p50_ms": round(percentile(timings, 0.50), 3),
+            "p90_ms": round(percentile(timings, 0.90), 3),
+            "p99_ms": round(percentile(timings, 0.99), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "max_ms": round(max(timings), 3),
+        }
+
+    def environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "platform": sys.platform,
+        }
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from myapp.bulk import run_bulk_job
+from myapp.models import BulkJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the pending bulk profile jobs (deactivate/archive/delete). Needed when "
+        "BULK_JOBS_IN_BACKGROUND is off, e.g. every minute from cron. --retry puts a failed "
+        "or interrupted job back in the queue first; its finished batches are not redone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry', type=int, metavar='JOB_ID', help="Re-queue this failed or interrupted job.")
+
+    def handle(self, *args, **options):
+        if options['retry']:
+            BulkJob.objects.filter(pk=options['retry'], status__in=['running', 'failed']).update(status='pending', error='')
+        for job_id in BulkJob.objects.filter(status='pending').order_by('id').values_list('id', flat=True):
+            run_bulk_job(job_id)
+            job = BulkJob.objects.get(pk=job_id)
+            self.stdout.write(f"Job {job.id}: {job.action} {job.processed}/{job.total} {job.kind} - {job.status}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from myapp.models import StudentAccount, StudentTransaction
+
+
+class Command(BaseCommand):
+    help = "Create the missing StudentAccount rows from each student's latest transaction (use --recompute to also reset existing ones)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recompute', action='store_true',
+            help="Also overwrite existing account balances with the latest transaction balance.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            before = StudentAccount.objects.count()
+            StudentAccount.ensure_for()
+            created = StudentAccount.objects.count() - before
+
+            updated = 0
+            if options['recompute']:
+                latest_balance = StudentTransaction.objects.filter(
+                    student=models.OuterRef('student')
+                ).order_by('-transaction_date', '-id').values('balance')[:1]
+                updated = StudentAccount.objects.update(
+                    balance=Coalesce(models.Subquery(latest_balance), models.Value(0), output_field=models.DecimalField())
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} account(s), recomputed {updated}."))
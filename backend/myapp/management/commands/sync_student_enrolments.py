@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import StudentEnrolment
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the StudentEnrolment table from the students' classes, sections and optional subjects. "
+        "Run once after migrating; afterwards signals keep it in sync."
+    )
+
+    def handle(self, *args, **options):
+        count = StudentEnrolment.sync_for()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} student enrolment(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.models import Teacher, TeachingAssignment
+from myapp.teaching import teaching_changed
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the TeachingAssignment matrix from the teachers' classes, sections and subjects. "
+        "Run once after migrating; afterwards signals keep it in sync."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            teaching_changed(Teacher.objects.values_list('id', flat=True))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {TeachingAssignment.objects.count()} teaching assignment(s)."))
@@ -0,0 +1,273 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('myapp.slow_requests')
+
+# Latency histogram buckets, in seconds (Prometheus `le` bounds)
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_CAPTURED_QUERIES = 200  # SQL statements kept per request for the slow-request log
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+COUNTERS = {}  # Extra counters: name -> help text (see register_counter)
+
+
+def metrics_setting(name, default):
+    return getattr(settings, 'METRICS', {}).get(name, default)
+
+
+def register_counter(name, help_text):
+    """Declare a counter other modules bump with metrics_registry.increment()"""
+    COUNTERS[name] = help_text
+
+
+class RequestMetrics:
+    """What one request spent: SQL queries, DB and serializer time, and the SQL it ran"""
+
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializing', 'captured')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: times every statement the request runs
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.captured) < MAX_CAPTURED_QUERIES:
+                self.captured.append((sql, elapsed))
+
+
+class EndpointStats:
+    __slots__ = ('statuses', 'buckets', 'latency_sum', 'count', 'queries', 'db_time', 'serializer_time', 'response_bytes')
+
+    def __init__(self, bucket_count):
+        self.statuses = defaultdict(int)  # (method, status) -> requests
+        self.buckets = [0] * bucket_count  # non-cumulative; the last slot is +Inf
+        self.latency_sum = 0.0
+        self.count = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    """
+    Per-worker, in-memory request metrics keyed by URL name, plus a bounded log
+    of the slowest recent requests with the SQL they ran. Each worker exposes
+    its own numbers; Prometheus sums them across scrape targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.buckets = tuple(metrics_setting('LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS))
+            self.endpoints = {}
+            self.counters = defaultdict(lambda: defaultdict(int))  # name -> label items -> value
+            self.slow_requests = deque(maxlen=metrics_setting('SLOW_REQUEST_LOG_SIZE', 100))
+
+    def record(self, view, method, status, latency, request_metrics, response_bytes):
+        bucket = next((index for index, bound in enumerate(self.buckets) if latency <= bound), len(self.buckets))
+        with self._lock:
+            stats = self.endpoints.get(view)
+            if stats is None:
+                stats = self.endpoints[view] = EndpointStats(len(self.buckets) + 1)
+            stats.statuses[(method, status)] += 1
+            stats.buckets[bucket] += 1
+            stats.latency_sum += latency
+            stats.count += 1
+            stats.queries += request_metrics.queries
+            stats.db_time += request_metrics.db_time
+            stats.serializer_time += request_metrics.serializer_time
+            stats.response_bytes += response_bytes
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[name][tuple(sorted(labels.items()))] += amount
+
+    def log_slow_request(self, entry):
+        with self._lock:
+            self.slow_requests.append(entry)
+
+    def slow_request_log(self):
+        with self._lock:
+            return list(reversed(self.slow_requests))
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = []
+
+            def family(name, kind, help_text, samples):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+
+            family('http_requests_total', 'counter', "Requests handled, by URL name, method and status.", [
+                f'http_requests_total{{view="{_escape(view)}",method="{method}",status="{status}"}} {count}'
+                for view, stats in endpoints
+                for (method, status), count in sorted(stats.statuses.items())
+            ])
+
+            histogram = []
+            for view, stats in endpoints:
+                label = _escape(view)
+                cumulative = 0
+                for bound, count in zip(self.buckets, stats.buckets):
+                    cumulative += count
+                    histogram.append(f'http_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+                histogram.append(f'http_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {stats.count}')
+                histogram.append(f'http_request_duration_seconds_sum{{view="{label}"}} {stats.latency_sum:.6f}')
+                histogram.append(f'http_request_duration_seconds_count{{view="{label}"}} {stats.count}')
+            family('http_request_duration_seconds', 'histogram', "Request latency, by URL name.", histogram)
+
+            for name, attribute, help_text, fmt in (
+                ('http_request_queries_total', 'queries', "SQL queries run, by URL name.", '{}'),
+                ('http_request_db_seconds_total', 'db_time', "Time spent in the database, by URL name.", '{:.6f}'),
+                ('http_request_serializer_seconds_total', 'serializer_time',
+                 "Time spent serializing response data (including the queries it triggers), by URL name.", '{:.6f}'),
+                ('http_response_bytes_total', 'response_bytes', "Response body bytes sent, by URL name.", '{}'),
+            ):
+                family(name, 'counter', help_text, [
+                    f'{name}{{view="{_escape(view)}"}} {fmt.format(getattr(stats, attribute))}'
+                    for view, stats in endpoints
+                ])
+
+            for name, help_text in sorted(COUNTERS.items()):
+                family(name, 'counter', help_text, [
+                    f'{name}{{{_labels(labels)}}} {count}'
+                    for labels, count in sorted(self.counters[name].items())
+                ])
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(items):
+    return ",".join(f'{label}="{_escape(str(value))}"' for label, value in items)
+
+
+metrics_registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL queries, DB time, serializer time and response size of
+    every request under its URL name. Requests slower than
+    ``METRICS['SLOW_REQUEST_MS']`` are kept in the slow-request log along with
+    the SQL they ran.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with _wrap_connections(request_metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        latency = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        response_bytes = 0 if response.streaming else len(response.content)
+        metrics_registry.record(view, request.method, response.status_code, latency, request_metrics, response_bytes)
+
+        threshold = metrics_setting('SLOW_REQUEST_MS', 500)
+        if threshold is not None and latency * 1000 >= threshold:
+            self.log_slow_request(request, view, response, latency, request_metrics)
+        return response
+
+    def log_slow_request(self, request, view, response, latency, request_metrics):
+        entry = {
+            "time": timezone.now().isoformat(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view,
+            "status": response.status_code,
+            "duration_ms": round(latency * 1000, 3),
+            "queries": request_metrics.queries,
+            "db_ms": round(request_metrics.db_time * 1000, 3),
+            "serializer_ms": round(request_metrics.serializer_time * 1000, 3),
+            "sql": [{"sql": sql, "ms": round(elapsed * 1000, 3)} for sql, elapsed in request_metrics.captured],
+        }
+        metrics_registry.log_slow_request(entry)
+        logger.warning(
+            "Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in the database",
+            entry["method"], entry["path"], view, entry["duration_ms"], entry["queries"], entry["db_ms"],
+        )
+
+
+class _wrap_connections:
+    """Install the request's execute wrapper on every configured database connection"""
+
+    def __init__(self, request_metrics):
+        self.request_metrics = request_metrics
+        self.contexts = []
+
+    def __enter__(self):
+        for alias in connections:
+            context = connections[alias].execute_wrapper(self.request_metrics)
+            context.__enter__()
+            self.contexts.append(context)
+
+    def __exit__(self, *exc_info):
+        while self.contexts:
+            self.contexts.pop().__exit__(*exc_info)
+
+
+def _timed_data(data_property):
+    def data(self):
+        request_metrics = _current.get()
+        if request_metrics is None or request_metrics.serializing:
+            # Outside a request, or a nested serializer already being timed
+            return data_property.fget(self)
+        request_metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return data_property.fget(self)
+        finally:
+            request_metrics.serializer_time += time.perf_counter() - started
+            request_metrics.serializing = False
+    data.__doc__ = data_property.__doc__
+    return property(data)
+
+
+def install_serializer_timing():
+    """Time `.data` of every serializer into the current request's metrics (called once, at startup)"""
+    from rest_framework import serializers
+
+    from .fast_serializers import ValuesSerializer
+
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer, ValuesSerializer):
+        data_property = serializer_class.__dict__['data']
+        if not getattr(data_property.fget, 'metrics_timed', False):
+            timed = _timed_data(data_property)
+            timed.fget.metrics_timed = True
+            serializer_class.data = timed
@@ -1,11 +1,14 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.utils.timezone import now
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 import os
+import threading
+from collections import defaultdict
 from django.contrib.auth.models import AbstractUser
+from .registry import settings_registry
 # Create your models here.
 
 class CustomUser(AbstractUser):
@@ -47,16 +50,36 @@ class DateSetting(models.Model):
         # Ensure only one instance exists
         self.pk = 1
         super(DateSetting, self).save(*args, **kwargs)
+        # Workers reload on their next check; only once committed, or one could cache the old row under the new stamp
+        transaction.on_commit(lambda: settings_registry.invalidate("date_setting"))
+
+    def delete(self, *args, **kwargs):
+        result = super(DateSetting, self).delete(*args, **kwargs)
+        transaction.on_commit(lambda: settings_registry.invalidate("date_setting"))
+        return result
 
     @classmethod
-    def get_instance(cls):
-        instance, _ = cls.objects.get_or_create(pk=1)
+    def load(cls):
+        instance = cls.objects.filter(pk=1).first()
+        if instance is None:
+            # Create the default row without save(): bumping the version here would
+            # make every worker (this one included) reload it for nothing
+            cls.objects.bulk_create([cls(pk=1)], ignore_conflicts=True)
+            instance = cls.objects.get(pk=1)
         return instance
 
+    @classmethod
+    def get_instance(cls):
+        # Served from the per-worker settings registry, no query per call
+        return settings_registry.get("date_setting")
+
     def __str__(self):
         return f"Date Format: {'AD' if self.is_ad else 'BS'}"
 
 
+settings_registry.register("date_setting", DateSetting.load)
+
+
 class Policies(models.Model):
     policies = models.CharField(max_length=2000, unique=True)
 
@@ -184,9 +207,65 @@ class DailyAttendance(models.Model):
     status = models.BooleanField(default=True)  # True = Present, False = Absent
     recorded_by = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True, blank=True)  # Who took attendance?
 
+    class Meta:
+        unique_together = ('student', 'date')  # One attendance record per student per day
+
     def __str__(self):
         return f"{self.student.user.username} - {self.date} - {'Present' if self.status else 'Absent'}"
 
+
+class MonthlyAttendance(models.Model):
+    """
+    One month of a student's DailyAttendance packed into two bitmasks: bit
+    ``day - 1`` of `recorded_mask` is set when attendance was taken that day,
+    the same bit of `present_mask` when the student was present.
+    Kept in step with DailyAttendance by the functions in myapp/attendance.py.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='monthly_attendance')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()  # 1-12 (AD, like DailyAttendance.date)
+    present_mask = models.IntegerField(default=0)
+    recorded_mask = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('student', 'year', 'month')
+
+    def __str__(self):
+        return f"{self.student} - {self.year}-{self.month:02d}: {self.present_days}/{self.recorded_days}"
+
+    @property
+    def present_days(self):
+        return self.present_mask.bit_count()
+
+    @property
+    def recorded_days(self):
+        return self.recorded_mask.bit_count()
+
+    @property
+    def absent_mask(self):
+        return self.recorded_mask & ~self.present_mask
+
+
+class AttendanceDailyRollup(models.Model):
+    """
+    Attendance counts of one class section on one day, refreshed by the
+    attendance write paths in myapp/attendance.py. `total` is the number of
+    students enrolled in the section when attendance was taken. Students
+    without a class are counted in rows with no class.
+    """
+    school_class = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, blank=True, related_name='attendance_rollups')
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, null=True, blank=True, related_name='attendance_rollups')
+    date = models.DateField()
+    total = models.PositiveIntegerField(default=0)
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['date', 'school_class'])]
+
+    def __str__(self):
+        return f"{self.section or self.school_class or 'No class'} - {self.date}: {self.present}/{self.total}"  # Section: "Class - A"
+
 from django.conf import settings
 
 class Event(models.Model):
@@ -329,6 +408,25 @@ class ExamDetail(models.Model):
     class Meta:
         unique_together = ('exam', 'subject', 'class_assigned')  # Prevent duplicate exam details
 
+
+def grade_for_percentage(percentage):
+    """Return the (gpa, grade) pair for a percentage"""
+    if percentage >= 90:
+        return 4.0, "A+"
+    elif percentage >= 80:
+        return 3.5, "A"
+    elif percentage >= 70:
+        return 3.0, "B+"
+    elif percentage >= 60:
+        return 2.5, "B"
+    elif percentage >= 50:
+        return 2.0, "C+"
+    elif percentage >= 40:
+        return 1.5, "C"
+    elif percentage >= 35:
+        return 1.0, "D"
+    return 0.0, "NG"  # Not Graded
+
 class StudentResult(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="results")
     exam_detail = models.ForeignKey(ExamDetail, on_delete=models.CASCADE, related_name="results")
@@ -341,7 +439,8 @@ class StudentResult(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    def save(self, *args, **kwargs):
+    def calculate_marks(self):
+        """Fill total_marks, percentage, gpa and grade from the entered marks (no save)"""
         # Calculate total_marks
         self.total_marks = (self.practical_marks or 0) + (self.theory_marks or 0)
 
@@ -358,31 +457,10 @@ class StudentResult(models.Model):
             self.percentage = 0
 
         # Assign GPA based on percentage
-        if self.percentage >= 90:
-            self.gpa = 4.0
-            self.grade = "A+"
-        elif self.percentage >= 80:
-            self.gpa = 3.5
-            self.grade = "A"
-        elif self.percentage >= 70:
-            self.gpa = 3.0
-            self.grade = "B+"
-        elif self.percentage >= 60:
-            self.gpa = 2.5
-            self.grade = "B"
-        elif self.percentage >= 50:
-            self.gpa = 2.0
-            self.grade = "C+"
-        elif self.percentage >= 40:
-            self.gpa = 1.5
-            self.grade = "C"
-        elif self.percentage >= 35:
-            self.gpa = 1.0
-            self.grade = "D"
-        else:
-            self.gpa = 0.0
-            self.grade = "NG"  # Not Graded
+        self.gpa, self.grade = grade_for_percentage(self.percentage)
 
+    def save(self, *args, **kwargs):
+        self.calculate_marks()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -399,7 +477,9 @@ class StudentOverallResult(models.Model):
     percentage = models.FloatField(default=0.0)
     gpa = models.FloatField(default=0.0)
     grade = models.CharField(max_length=3, default="NG")  # NG = Not Graded
-    rank = models.IntegerField(null=True, blank=True)  # This field will store the rank
+    rank = models.IntegerField(null=True, blank=True)  # This field will store the rank (within the class)
+    section_rank = models.IntegerField(null=True, blank=True)  # Rank within the student's section
+    school_rank = models.IntegerField(null=True, blank=True)  # Rank among every student who sat the exam
     updated_at = models.DateTimeField(auto_now=True)  # Auto update when changes happen
 
     class Meta:
@@ -476,6 +556,79 @@ class TransportationFee(models.Model):
     def __str__(self):
         return f"{self.place} - ${self.amount}"
 
+class NumberSequence(models.Model):
+    """
+    Counter of document numbers per prefix ("B" bills, "P" payments) and year.
+
+    `reserve()` hands out a range of numbers with a single UPDATE, so concurrent
+    savers never get the same number. `next_number()` reserves them in blocks of
+    NUMBER_SEQUENCE_BLOCK_SIZE per worker (hi-lo) and serves the block from memory;
+    numbers of a block a worker never uses are skipped. Set the block size to 1
+    for gapless numbering.
+    """
+    prefix = models.CharField(max_length=10)
+    year = models.PositiveIntegerField()
+    next_value = models.PositiveIntegerField(default=1)  # First number not handed out yet
+
+    class Meta:
+        unique_together = ('prefix', 'year')
+
+    def __str__(self):
+        return f"{self.year}{self.prefix} - next {self.next_value}"
+
+    _blocks = {}  # (prefix, year) -> [next, end) numbers reserved by this worker
+    _blocks_lock = threading.Lock()
+
+    @classmethod
+    def reserve(cls, prefix, year, count=1, initial=None):
+        """
+        Atomically reserve `count` consecutive numbers and return them as a range.
+        `initial` is called to find the first free number when the sequence of
+        this prefix and year does not exist yet (e.g. from already used numbers).
+        """
+        with transaction.atomic():
+            rows = cls.objects.filter(prefix=prefix, year=year)
+            if not rows.update(next_value=models.F('next_value') + count):
+                first = initial() if initial else 1
+                _, created = cls.objects.get_or_create(
+                    prefix=prefix, year=year, defaults={'next_value': first + count}
+                )
+                if created:
+                    return range(first, first + count)
+                rows.update(next_value=models.F('next_value') + count)  # Created concurrently
+            end = rows.values_list('next_value', flat=True).get()
+        return range(end - count, end)
+
+    @classmethod
+    def next_number(cls, prefix, year, initial=None):
+        """Next number of the sequence, served from this worker's reserved block"""
+        key = (prefix, year)
+        with cls._blocks_lock:
+            block = cls._blocks.get(key)
+            if block and block[0] < block[1]:
+                block[0] += 1
+                return block[0] - 1
+
+        size = max(getattr(settings, 'NUMBER_SEQUENCE_BLOCK_SIZE', 10), 1)
+        numbers = cls.reserve(prefix, year, size, initial=initial)
+
+        def keep_block():
+            with cls._blocks_lock:
+                cls._blocks[key] = [numbers.start + 1, numbers.stop]
+
+        # Only keep the rest of the block once the reservation is committed: a rolled
+        # back reservation would otherwise hand out numbers that get reserved again.
+        transaction.on_commit(keep_block)
+        return numbers.start
+
+
+def first_free_number(model, field, prefix, year):
+    """First number after the ones already used in `model.field`, formatted "<year><prefix><n>"."""
+    start = f"{year}{prefix}"
+    used = model.objects.filter(**{f"{field}__startswith": start}).values_list(field, flat=True)
+    return max((int(number[len(start):]) for number in used if number[len(start):].isdigit()), default=0) + 1
+
+
 class StudentBill(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="bills")
     month = models.CharField(max_length=20)  # e.g., "January" 
@@ -493,19 +646,11 @@ class StudentBill(models.Model):
             self.date = now()
 
         if not self.bill_number:
-            year = str(self.date.year)
-            attempt = 1  # Track retry attempts
-            
-            while True:
-                existing_bills_count = StudentBill.objects.count()
-                bill_number = f"{year}B{str(existing_bills_count + attempt).zfill(2)}"
-
-                # Ensure uniqueness
-                if not StudentBill.objects.filter(bill_number=bill_number).exists():
-                    self.bill_number = bill_number
-                    break
-                
-                attempt += 1  # Increment and retry if duplicate
+            year = self.date.year
+            number = NumberSequence.next_number(
+                "B", year, initial=lambda: first_free_number(StudentBill, 'bill_number', "B", year)
+            )
+            self.bill_number = f"{year}B{str(number).zfill(2)}"  # Format: 2025B01, 2025B02, etc.
 
         super().save(*args, **kwargs)
 
@@ -513,7 +658,7 @@ class StudentBill(models.Model):
         subtotal = 0
 
         # Calculate subtotal from fee categories
-        for fee_entry in self.studentbillfeecategory_set.all():
+        for fee_entry in self.studentbillfeecategory_set.select_related('fee_category'):
             fee_amount = fee_entry.fee_category.amount if not fee_entry.scholarship else 0
             subtotal += fee_amount
 
@@ -526,11 +671,8 @@ class StudentBill(models.Model):
         self.subtotal = subtotal
         self.total_amount = max(total, 0)  # Ensure total is not negative
 
-        # Debugging: Print the calculated values
-        print(f"Subtotal: {subtotal}, Discount: {self.discount}, Total Amount: {self.total_amount}")
-
         # Save the updated totals
-        self.save()
+        self.save(update_fields=['subtotal', 'total_amount'])
 
 class StudentBillFeeCategory(models.Model):
     student_bill = models.ForeignKey(StudentBill, on_delete=models.CASCADE)
@@ -554,18 +696,11 @@ class StudentPayment(models.Model):
         if not self.date:
             self.date = timezone.now()
         if not self.payment_number:  # Generate payment number only if not set
-            year = str(self.date.year)
-            attempt = 1  # Track retry attempts
-            # Find the next payment number for this student by counting existing payments
-            while True:
-                existing_payments_count = StudentPayment.objects.filter(student=self.student).count()
-                payment_number = f"{year}P{str(existing_payments_count + 1).zfill(2)}"  # Format: 2025P01, 2025P02, etc.
-
-                if not StudentPayment.objects.filter(payment_number=payment_number).exists():
-                    self.payment_number = payment_number  # Unique for each student 
-                    break  
-
-                attempt += 1  # Increment and retry if duplicate     
+            year = self.date.year
+            number = NumberSequence.next_number(
+                "P", year, initial=lambda: first_free_number(StudentPayment, 'payment_number', "P", year)
+            )
+            self.payment_number = f"{year}P{str(number).zfill(2)}"  # Format: 2025P01, 2025P02, etc.
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -583,6 +718,66 @@ class StudentTransaction(models.Model):
         return f"{self.transaction_type.capitalize()} - Balance: {self.balance}"
 
 
+class StudentAccount(models.Model):
+    """
+    Running balance of a student. Every bill adds to it and every payment takes
+    from it through `post()`, so the current balance is a single-row read instead
+    of a search for the latest StudentTransaction.
+    """
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name="account")
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.student.user.username} - Balance: {self.balance}"
+
+    @classmethod
+    def ensure_for(cls, student_ids=None):
+        """
+        Create the missing accounts of the given students (all students if None),
+        seeded with the balance of their latest transaction, in one bulk insert.
+        """
+        latest_balance = StudentTransaction.objects.filter(
+            student=models.OuterRef('pk')
+        ).order_by('-transaction_date', '-id').values('balance')[:1]
+        missing = Student.objects.filter(account__isnull=True)
+        if student_ids is not None:
+            missing = missing.filter(id__in=student_ids)
+        accounts = [
+            cls(student_id=student_id, balance=balance or Decimal('0.00'))
+            for student_id, balance in missing.annotate(
+                last_balance=models.Subquery(latest_balance)
+            ).values_list('id', 'last_balance')
+        ]
+        cls.objects.bulk_create(accounts, ignore_conflicts=True)
+
+    @classmethod
+    def post(cls, student, amount, transaction_type, bill=None, payment=None, transaction_date=None):
+        """
+        Add `amount` (negative for payments) to the student's balance and record the
+        matching StudentTransaction, atomically. The row is locked by the UPDATE
+        before the new balance is read back, so concurrent bills and payments of
+        the same student are applied one after the other.
+
+        Returns (pre_balance, post_balance, transaction).
+        """
+        amount = Decimal(str(amount))
+        with transaction.atomic():
+            cls.ensure_for([student.pk])
+            accounts = cls.objects.select_for_update().filter(student=student)
+            accounts.update(balance=models.F('balance') + amount, updated_at=now())
+            post_balance = accounts.values_list('balance', flat=True).get()
+            student_transaction = StudentTransaction.objects.create(
+                student=student,
+                transaction_type=transaction_type,
+                bill=bill,
+                payment=payment,
+                balance=post_balance,
+                transaction_date=transaction_date,
+            )
+        return post_balance - amount, post_balance, student_transaction
+
+
 
 class Communication(models.Model):
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sent_communications")
@@ -666,3 +861,185 @@ class Task(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class RevokedToken(models.Model):
+    """
+    A JWT revoked before it expired (logout, refresh token rotation). Checked via
+    myapp.revocation; rows past `expires_at` are dead anyway and get pruned
+    (prune_revoked_tokens).
+    """
+    jti = models.CharField(max_length=255, unique=True)  # The token's unique id claim
+    token_type = models.CharField(max_length=20)  # "access" or "refresh"
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.token_type} {self.jti} (revoked {self.revoked_at:%Y-%m-%d %H:%M})"
+
+
+class TeachingAssignment(models.Model):
+    """
+    One subject a teacher teaches in one class section: Teacher.classes x
+    Teacher.subjects, limited to the subjects of each class (Class.subjects).
+    `section` is the teacher's section of that class (Teacher.classes_section),
+    or null when they have none there and so teach every section. Derived data,
+    rebuilt by `sync_for()` whenever those many-to-manys change (myapp.teaching).
+    """
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name="teaching_assignments")
+    school_class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="teaching_assignments")
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, null=True, blank=True, related_name="teaching_assignments")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name="teaching_assignments")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'school_class', 'section', 'subject'], name='unique_teaching_assignment'),
+        ]
+        indexes = [models.Index(fields=['school_class', 'subject'])]
+
+    def __str__(self):
+        return f"{self.teacher} - {self.school_class} {self.section.section_name if self.section else ''} - {self.subject}"
+
+    @classmethod
+    def rows_for(cls, teacher_ids=None):
+        """The rows the many-to-manys call for, for the given teachers (all if None)"""
+        teacher_classes = Teacher.classes.through.objects.all()
+        teacher_subjects = Teacher.subjects.through.objects.all()
+        teacher_sections = Teacher.classes_section.through.objects.all()
+        if teacher_ids is not None:
+            teacher_classes = teacher_classes.filter(teacher_id__in=teacher_ids)
+            teacher_subjects = teacher_subjects.filter(teacher_id__in=teacher_ids)
+            teacher_sections = teacher_sections.filter(teacher_id__in=teacher_ids)
+
+        subjects_of_teacher = defaultdict(set)
+        for teacher_id, subject_id in teacher_subjects.values_list('teacher_id', 'subject_id'):
+            subjects_of_teacher[teacher_id].add(subject_id)
+        sections_of_teacher = defaultdict(list)
+        for teacher_id, section_id, class_id in teacher_sections.values_list(
+            'teacher_id', 'section_id', 'section__school_class_id'
+        ):
+            sections_of_teacher[(teacher_id, class_id)].append(section_id)
+        teacher_classes = list(teacher_classes.values_list('teacher_id', 'class_id'))
+        subjects_of_class = defaultdict(set)
+        for class_id, subject_id in Class.subjects.through.objects.filter(
+            class_id__in={class_id for _, class_id in teacher_classes}
+        ).values_list('class_id', 'subject_id'):
+            subjects_of_class[class_id].add(subject_id)
+
+        return [
+            cls(teacher_id=teacher_id, school_class_id=class_id, section_id=section_id, subject_id=subject_id)
+            for teacher_id, class_id in teacher_classes
+            for subject_id in subjects_of_teacher[teacher_id] & subjects_of_class[class_id]
+            for section_id in sections_of_teacher.get((teacher_id, class_id)) or [None]
+        ]
+
+    @classmethod
+    def sync_for(cls, teacher_ids=None):
+        """Rebuild the rows of the given teachers (all if None); returns how many there are now"""
+        with transaction.atomic():
+            rows = cls.rows_for(teacher_ids)
+            stale = cls.objects.all() if teacher_ids is None else cls.objects.filter(teacher_id__in=teacher_ids)
+            stale.delete()
+            cls.objects.bulk_create(rows)
+        return len(rows)
+
+
+class StudentEnrolment(models.Model):
+    """
+    One subject a student takes, with the student's class and section: the
+    compulsory subjects of their class (Class.subjects not in
+    Class.optional_subjects) and the optional subjects they chose
+    (Student.optional_subjects, `is_optional`). Derived data, rebuilt by
+    `sync_for()` whenever those change (myapp.enrolment).
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="enrolments")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name="enrolments")
+    school_class = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, blank=True, related_name="enrolments")
+    section = models.ForeignKey(Section, on_delete=models.SET_NULL, null=True, blank=True, related_name="enrolments")
+    is_optional = models.BooleanField(default=False)
+
+    SYNC_CHUNK = 500  # Students rebuilt per statement
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'subject'], name='unique_student_enrolment'),
+        ]
+        indexes = [models.Index(fields=['subject', 'school_class', 'section'])]
+
+    def __str__(self):
+        return f"{self.student} - {self.subject}"
+
+    @classmethod
+    def rows_for(cls, student_ids=None):
+        """The rows the many-to-manys call for, for the given students (all if None)"""
+        students = Student.objects.all()
+        chosen = Student.optional_subjects.through.objects.all()
+        if student_ids is not None:
+            students = students.filter(id__in=student_ids)
+            chosen = chosen.filter(student_id__in=student_ids)
+        students = list(students.values_list('id', 'class_code_id', 'class_code_section_id'))
+
+        class_ids = {class_id for _, class_id, _ in students if class_id is not None}
+        compulsory = defaultdict(set)
+        for class_id, subject_id in Class.subjects.through.objects.filter(class_id__in=class_ids).values_list('class_id', 'subject_id'):
+            compulsory[class_id].add(subject_id)
+        for class_id, subject_id in Class.optional_subjects.through.objects.filter(class_id__in=class_ids).values_list('class_id', 'subject_id'):
+            compulsory[class_id].discard(subject_id)
+        optional = defaultdict(set)
+        for student_id, subject_id in chosen.values_list('student_id', 'subject_id'):
+            optional[student_id].add(subject_id)
+
+        rows = []
+        for student_id, class_id, section_id in students:
+            subjects = [(subject_id, False) for subject_id in sorted(compulsory[class_id])]
+            subjects += [(subject_id, True) for subject_id in sorted(optional[student_id] - compulsory[class_id])]
+            rows += [
+                cls(student_id=student_id, subject_id=subject_id, school_class_id=class_id, section_id=section_id,
+                    is_optional=is_optional)
+                for subject_id, is_optional in subjects
+            ]
+        return rows
+
+    @classmethod
+    def sync_for(cls, student_ids=None):
+        """Rebuild the rows of the given students (all if None); returns how many rows that wrote"""
+        if student_ids is None:
+            with transaction.atomic():
+                rows = cls.rows_for()
+                cls.objects.all().delete()
+                cls.objects.bulk_create(rows, batch_size=cls.SYNC_CHUNK)
+            return len(rows)
+
+        student_ids = list(student_ids)
+        written = 0
+        with transaction.atomic():
+            for start in range(0, len(student_ids), cls.SYNC_CHUNK):
+                chunk = student_ids[start:start + cls.SYNC_CHUNK]
+                rows = cls.rows_for(chunk)
+                cls.objects.filter(student_id__in=chunk).delete()
+                cls.objects.bulk_create(rows, batch_size=cls.SYNC_CHUNK)
+                written += len(rows)
+        return written
+
+
+class BulkJob(models.Model):
+    """
+    A background deactivate, archive or delete of many student, teacher,
+    accountant or driver profiles at once (myapp.bulk). `processed` of `total`
+    profiles are done so far; `deleted` counts the rows removed per table.
+    """
+    kind = models.CharField(max_length=20)  # "students", "teachers", "accountants" or "drivers"
+    action = models.CharField(max_length=10, choices=[('deactivate', 'Deactivate'), ('archive', 'Archive'), ('delete', 'Delete')])
+    profile_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    deleted = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="bulk_jobs")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.action} {self.total} {self.kind} ({self.status})"
@@ -0,0 +1,42 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .serializers import parse_fields
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on the primary key: every page is a single indexed
+    `WHERE id > ... ORDER BY id LIMIT n` query, however deep the client pages.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    @staticmethod
+    def requested(request):
+        """Pagination is opt-in, so existing clients keep getting plain lists"""
+        return 'cursor' in request.query_params or 'page_size' in request.query_params
+
+
+def sparse_list_response(request, view, queryset, serializer_class, fast_serializer_class=None):
+    """
+    List `queryset` with `serializer_class` (a SparseFieldsMixin serializer),
+    honouring ``?fields=`` and, when asked for, ``?cursor=``/``?page_size=``.
+    Plain full lists use `fast_serializer_class` (a ValuesSerializer) if given.
+    """
+    fields = parse_fields(request.query_params.get('fields'))
+    if fast_serializer_class is not None and fields is None and not KeysetPagination.requested(request):
+        return Response(fast_serializer_class(queryset).data)
+    context = {'request': request}
+    queryset = serializer_class(fields=fields, context=context).plan_queryset(queryset)
+
+    if KeysetPagination.requested(request):
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=view)
+        serializer = serializer_class(page, many=True, fields=fields, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+    serializer = serializer_class(queryset, many=True, fields=fields, context=context)
+    return Response(serializer.data)
@@ -3,6 +3,7 @@ from rest_framework.permissions import BasePermission
 from .models import Post
 from .serializers import PostSerializer
 from django.core.exceptions import PermissionDenied
+from .roles import has_role
 
 
 # Custom permission to check if the user is a student or teacher
@@ -12,7 +13,7 @@ class IsStudentOrTeacher(BasePermission):
     """
 
     def has_permission(self, request, view):
-        return hasattr(request.user, 'student') or hasattr(request.user, 'teacher')
+        return has_role(request, 'student') or has_role(request, 'teacher')
 
 # Custom permission to check if the user is a principal
 class IsPrincipal(BasePermission):
@@ -21,7 +22,7 @@ class IsPrincipal(BasePermission):
     """
 
     def has_permission(self, request, view):
-        return hasattr(request.user, 'principal')
+        return has_role(request, 'principal')
 
 
 class IsPrincipalOrTeacher(BasePermission):
@@ -29,7 +30,7 @@ class IsPrincipalOrTeacher(BasePermission):
     Custom permission to allow only principals and teachers to create posts.
     """
     def has_permission(self, request, view):
-        return hasattr(request.user, 'principal') or hasattr(request.user, 'teacher')
+        return has_role(request, 'principal') or has_role(request, 'teacher')
 
 class IsTeacher(BasePermission):
     """
@@ -37,7 +38,7 @@ class IsTeacher(BasePermission):
     """
 
     def has_permission(self, request, view):
-        return hasattr(request.user, 'teacher')
+        return has_role(request, 'teacher')
 
 class IsStudent(BasePermission):
     """
@@ -46,4 +47,21 @@ class IsStudent(BasePermission):
 
     def has_permission(self, request, view):
         # Allow only students
-        return hasattr(request.user, 'student')
\ No newline at end of file
+        return has_role(request, 'student')
+
+class IsAccountant(BasePermission):
+    """
+    Allow only accountants (the fee desk).
+    """
+
+    def has_permission(self, request, view):
+        return has_role(request, 'accountant')
+
+class IsAdmin(BasePermission):
+    """
+    Allow only site administrators (staff or master users).
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_staff or getattr(user, 'is_master', False)))
@@ -0,0 +1,200 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Accountant, Class, CustomUser, Driver, Principal, Student, Subject, Teacher
+
+# Shared by every profile: bumped when a class or subject changes, since those
+# show up in the profiles of many users at once
+CATALOG_VERSION_KEY = "profile:catalog:version"
+
+
+def _version_key(user_id):
+    return f"profile:{user_id}:version"
+
+
+def _profile_key(user_id, version):
+    return f"profile:{user_id}:{version}"
+
+
+def profile_version(user_id):
+    """
+    Version of a user's cached profile: their own stamp plus the catalog stamp.
+    Missing stamps (never set, or evicted from the cache) are started afresh,
+    so a profile cached under an older version is never picked up again.
+    """
+    keys = [_version_key(user_id), CATALOG_VERSION_KEY]
+    stamps = cache.get_many(keys)
+    if len(stamps) < len(keys):
+        for key in keys:
+            if key not in stamps:
+                cache.add(key, time.time_ns(), timeout=None)
+        stamps = cache.get_many(keys)
+    return f"{stamps.get(keys[0], 0)}.{stamps.get(keys[1], 0)}"
+
+
+def _subjects(subjects):
+    return [{'id': subject.id, 'subject_code': subject.subject_code, 'subject_name': subject.subject_name} for subject in subjects]
+
+
+def _class(school_class):
+    if school_class is None:
+        return None
+    return {'id': school_class.id, 'class_code': school_class.class_code, 'class_name': school_class.class_name}
+
+
+def build_profile(user):
+    """
+    The role payload returned on login and by /api/me (without the per-request
+    tokens and date setting), or None if the user has no role.
+    """
+    user = (
+        CustomUser.objects.select_related(
+            'student__class_code', 'teacher__class_teacher', 'principal', 'accountant', 'driver'
+        ).get(pk=user.pk)
+    )
+
+    if hasattr(user, 'student'):
+        student = user.student
+        student_class = student.class_code
+        # Compulsory class subjects followed by the student's optional subjects
+        subjects = Subject.objects.filter(enrolments__student=student).order_by('enrolments__is_optional', 'id')
+        role_data = {
+            'id': student.id,
+            'role': 'student',
+            'phone': student.phone,
+            'address': student.address,
+            'date_of_birth': student.date_of_birth.strftime('%Y-%m-%d'),
+            'gender': student.gender,
+            'parents': student.parents,
+            'class': _class(student_class),
+            'subjects': _subjects(subjects),
+        }
+
+    elif hasattr(user, 'teacher'):
+        teacher = user.teacher
+        role_data = {
+            'id': teacher.id,
+            'role': 'teacher',
+            'phone': teacher.phone,
+            'address': teacher.address,
+            'date_of_joining': teacher.date_of_joining.strftime('%Y-%m-%d'),
+            'gender': teacher.gender,
+            'subjects': _subjects(teacher.subjects.all()),
+            'classes': [_class(cls) for cls in teacher.classes.all()],
+            'class_teacher': _class(teacher.class_teacher),
+        }
+
+    elif hasattr(user, 'principal'):
+        principal = user.principal
+        role_data = {
+            'id': principal.id,
+            'role': 'principal',
+            'phone': principal.phone,
+            'address': principal.address,
+            'gender': principal.gender,
+        }
+
+    elif hasattr(user, 'accountant'):
+        accountant = user.accountant
+        role_data = {
+            'id': accountant.id,
+            'role': 'accountant',
+            'phone': accountant.phone,
+            'address': accountant.address,
+            'gender': accountant.gender,
+            'date_of_joining': accountant.date_of_joining.strftime('%Y-%m-%d'),
+        }
+
+    elif hasattr(user, 'driver'):
+        driver = user.driver
+        role_data = {
+            'id': driver.id,
+            'role': 'driver',
+            'phone': driver.phone,
+            'address': driver.address,
+            'gender': driver.gender,
+            'date_of_joining': driver.date_of_joining.strftime('%Y-%m-%d'),
+        }
+
+    else:
+        return None
+
+    return {
+        'id': role_data.get('id'),
+        'role': 'master' if user.is_master else 'principal' if user.is_principal else 'teacher' if user.is_teacher else 'student' if user.is_student else 'accountant' if user.is_accountant else 'driver' if user.is_driver else None,
+        'username': user.username,
+        **role_data,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+    }
+
+
+def get_profile(user, version=None):
+    """The user's profile from the shared cache, built on a miss. Returns (version, profile)."""
+    if version is None:
+        version = profile_version(user.pk)
+    key = _profile_key(user.pk, version)
+    profile = cache.get(key)
+    if profile is None:
+        profile = build_profile(user)
+        if profile is not None:
+            cache.set(key, profile, getattr(settings, 'PROFILE_CACHE_TIMEOUT', 24 * 60 * 60))
+    return version, profile
+
+
+def profile_etag(version, is_ad):
+    return f'"{version}.{int(is_ad)}"'
+
+
+def invalidate_profiles(user_ids):
+    """Drop the cached profiles of these users once the current transaction commits"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: cache.set_many({_version_key(user_id): time.time_ns() for user_id in user_ids}, timeout=None))
+
+
+def invalidate_all_profiles():
+    """Drop every cached profile (a class or subject changed) once the current transaction commits"""
+    transaction.on_commit(lambda: cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None))
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    invalidate_profiles([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Teacher)
+@receiver([post_save, post_delete], sender=Principal)
+@receiver([post_save, post_delete], sender=Accountant)
+@receiver([post_save, post_delete], sender=Driver)
+def role_changed(sender, instance, **kwargs):
+    invalidate_profiles([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Class)
+@receiver([post_save, post_delete], sender=Subject)
+@receiver(m2m_changed, sender=Class.subjects.through)
+@receiver(m2m_changed, sender=Class.optional_subjects.through)
+def catalog_changed(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate_all_profiles()
+
+
+@receiver(m2m_changed, sender=Student.optional_subjects.through)
+@receiver(m2m_changed, sender=Teacher.subjects.through)
+@receiver(m2m_changed, sender=Teacher.classes.through)
+def role_subjects_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the subject/class side: any number of users affected
+        invalidate_all_profiles()
+    else:
+        invalidate_profiles([instance.user_id])
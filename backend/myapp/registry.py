@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class SettingsRegistry:
+    """
+    Per-worker, in-memory store for global singleton settings (DateSetting, ...).
+
+    Every entry carries a version stamp kept in the shared cache. Workers only
+    look at the stamp once per ``SETTINGS_REGISTRY_CHECK_INTERVAL`` seconds, so
+    reading a setting is a dict lookup; saving a setting bumps the stamp and
+    every worker reloads it on its next check.
+    """
+
+    key_prefix = "settings-registry"
+
+    def __init__(self):
+        self._loaders = {}
+        self._entries = {}  # name -> [version, value, checked_at]
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._entries.pop(name, None)
+
+    def _version_key(self, name):
+        return f"{self.key_prefix}:{name}:version"
+
+    @property
+    def check_interval(self):
+        return getattr(settings, "SETTINGS_REGISTRY_CHECK_INTERVAL", 1.0)
+
+    def get(self, name):
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None and now - entry[2] < self.check_interval:
+            return entry[1]
+
+        version = self._version(name)
+        if entry is not None and entry[0] == version:
+            entry[2] = now
+            return entry[1]
+
+        value = self._loaders[name]()
+        self._entries[name] = [version, value, now]
+        return value
+
+    def _version(self, name):
+        # A stamp gone from the cache (evicted, culled) starts over as a new one, so it never reads as unchanged
+        key = self._version_key(name)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        return version
+
+    def invalidate(self, name):
+        """Drop the local copy and tell every other worker to reload."""
+        cache.set(self._version_key(name), time.time_ns(), timeout=None)
+        self._entries.pop(name, None)
+
+
+settings_registry = SettingsRegistry()
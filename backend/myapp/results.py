@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db.models import F, Sum, Window
+from django.db.models.functions import DenseRank, Rank, RowNumber
+from django.utils import timezone
+
+from .models import StudentOverallResult, StudentResult, grade_for_percentage
+
+
+def recompute_overall_results(exam, student_ids):
+    """
+    Recompute the StudentOverallResult of the given students for one exam.
+
+    Totals are summed in the database for all students at once and written back
+    with one bulk_create and one bulk_update, whatever the number of students.
+    Ranks are not touched; recalculate them once afterwards.
+    """
+    totals = (
+        StudentResult.objects
+        .filter(exam_detail__exam=exam, student_id__in=student_ids)
+        .values('student_id')
+        .annotate(obtained=Sum('total_marks'), full=Sum('exam_detail__full_marks'))
+    )
+    existing = {
+        result.student_id: result
+        for result in StudentOverallResult.objects.filter(exam=exam, student_id__in=student_ids)
+    }
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for row in totals:
+        total_marks_obtained = float(row['obtained'] or 0)
+        total_full_marks = float(row['full'] or 0)
+        if total_full_marks > 0:
+            percentage = (total_marks_obtained / total_full_marks) * 100
+        else:
+            percentage = 0
+        gpa, grade = grade_for_percentage(percentage)
+
+        overall = existing.get(row['student_id'])
+        if overall is None:
+            overall = StudentOverallResult(student_id=row['student_id'], exam=exam)
+            to_create.append(overall)
+        else:
+            to_update.append(overall)
+        overall.total_marks_obtained = total_marks_obtained
+        overall.total_full_marks = total_full_marks
+        overall.percentage = percentage
+        overall.gpa = gpa
+        overall.grade = grade
+        overall.updated_at = now
+
+    StudentOverallResult.objects.bulk_create(to_create)
+    StudentOverallResult.objects.bulk_update(
+        to_update,
+        ['total_marks_obtained', 'total_full_marks', 'percentage', 'gpa', 'grade', 'updated_at'],
+    )
+    return to_create + to_update
+
+
+RANKING_METHODS = {
+    'rank': Rank,  # 1, 1, 3
+    'dense': DenseRank,  # 1, 1, 2
+    'row_number': RowNumber,  # 1, 2, 3 (ties broken by the ordering only)
+}
+
+
+def _ranking_policy(method=None, order_by=None):
+    config = getattr(settings, 'RANKING', {})
+    method = method or config.get('METHOD', 'rank')
+    if method not in RANKING_METHODS:
+        raise ValueError(f"Unknown ranking method '{method}'. Use one of: {', '.join(RANKING_METHODS)}.")
+    order_by = order_by or config.get('ORDER_BY', ['-total_marks_obtained'])
+    ordering = [
+        F(field[1:]).desc() if field.startswith('-') else F(field).asc()
+        for field in order_by
+    ]
+    return RANKING_METHODS[method], ordering
+
+
+def recalculate_rankings(exam, method=None, order_by=None):
+    """
+    Recompute the class, section and school-wide ranks of every overall result of an exam.
+
+    The three ranks are computed by the database with window functions in one
+    query, and only the rows whose ranks changed are written back with one
+    bulk_update. `method` and `order_by` override settings.RANKING.
+    """
+    function, ordering = _ranking_policy(method, order_by)
+    ranked = (
+        StudentOverallResult.objects
+        .filter(exam=exam)
+        .annotate(
+            new_rank=Window(function(), partition_by=[F('student__class_code')], order_by=ordering),
+            new_section_rank=Window(function(), partition_by=[F('student__class_code_section')], order_by=ordering),
+            new_school_rank=Window(function(), order_by=ordering),
+        )
+        .values_list(
+            'id', 'rank', 'section_rank', 'school_rank',
+            'new_rank', 'new_section_rank', 'new_school_rank', 'student__class_code_section',
+        )
+    )
+
+    changed = []
+    for pk, rank, section_rank, school_rank, new_rank, new_section_rank, new_school_rank, section_id in ranked:
+        if section_id is None:
+            new_section_rank = None  # Students without a section have no section rank
+        if (rank, section_rank, school_rank) != (new_rank, new_section_rank, new_school_rank):
+            changed.append(StudentOverallResult(
+                id=pk, rank=new_rank, section_rank=new_section_rank, school_rank=new_school_rank
+            ))
+
+    StudentOverallResult.objects.bulk_update(changed, ['rank', 'section_rank', 'school_rank'])
+    return len(changed)
+
+
+def subject_toppers(exam, class_instance=None, limit=1):
+    """
+    Return the top `limit` ranked results of every subject of an exam (ties included),
+    ordered by subject then rank, in a single query.
+    """
+    results = StudentResult.objects.filter(exam_detail__exam=exam)
+    if class_instance is not None:
+        results = results.filter(exam_detail__class_assigned=class_instance)
+    return (
+        results
+        .annotate(subject_rank=Window(
+            Rank(), partition_by=[F('exam_detail')], order_by=[F('total_marks').desc()]
+        ))
+        .filter(subject_rank__lte=limit)
+        .select_related('student__user', 'exam_detail__subject', 'exam_detail__class_assigned')
+        .order_by('exam_detail__subject__subject_name', 'exam_detail__class_assigned__class_name', 'subject_rank')
+    )
@@ -0,0 +1,153 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Set of strings answering "definitely not in" or "maybe in", in a fixed
+    number of bits: about `error_rate` false positives once `capacity` keys
+    were added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1024)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: the k positions come from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    Per-worker view of the RevokedToken table.
+
+    Token ids are kept in a Bloom filter, so checking a token that was never
+    revoked (nearly all of them) doesn't touch the database; only "maybe
+    revoked" answers are confirmed with a query. Revoking a token bumps a
+    version stamp in the shared cache; workers look at it at most once per
+    ``TOKEN_REVOCATION_CHECK_INTERVAL`` seconds and then load the newly revoked
+    ids. The filter is rebuilt from the unexpired rows when it fills up.
+    """
+
+    stamp_key = "revoked-tokens:version"
+    overlap = timezone.timedelta(minutes=1)  # Re-read margin for revocations committed late
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.filter = None
+        self.stamp = None
+        self.synced_at = None
+        self.checked_at = 0.0
+
+    @property
+    def check_interval(self):
+        return getattr(settings, 'TOKEN_REVOCATION_CHECK_INTERVAL', 1.0)
+
+    def _rebuild(self):
+        started = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=started).values_list('jti', flat=True))
+        bloom = BloomFilter(len(jtis) * 2, getattr(settings, 'TOKEN_REVOCATION_ERROR_RATE', 0.01))
+        for jti in jtis:
+            bloom.add(jti)
+        self.filter, self.synced_at = bloom, started
+
+    def _load_new(self):
+        started = timezone.now()
+        for jti in RevokedToken.objects.filter(revoked_at__gte=self.synced_at - self.overlap).values_list('jti', flat=True):
+            self.filter.add(jti)
+        self.synced_at = started
+
+    def sync(self):
+        now = time.monotonic()
+        if self.filter is not None and now - self.checked_at < self.check_interval:
+            return
+        stamp = cache.get(self.stamp_key)  # before loading, so a concurrent revocation always shows as a newer stamp
+        if stamp is None:
+            # Evicted (or never set): a fresh stamp, so the revocations it announced are loaded all the same
+            cache.add(self.stamp_key, time.time_ns(), timeout=None)
+            stamp = cache.get(self.stamp_key)
+        with self._lock:
+            if self.filter is None or self.filter.count > self.filter.capacity:
+                self._rebuild()
+            elif stamp != self.stamp:
+                self._load_new()
+            self.stamp, self.checked_at = stamp, now
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self.filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, token):
+        """Store the token as revoked and tell every worker, once the current transaction commits"""
+        jti = token[api_settings.JTI_CLAIM]
+        RevokedToken.objects.bulk_create([
+            RevokedToken(jti=jti, token_type=token.token_type, expires_at=datetime_from_epoch(token['exp']))
+        ], ignore_conflicts=True)
+
+        def broadcast():
+            with self._lock:
+                if self.filter is not None:
+                    self.filter.add(jti)
+            cache.set(self.stamp_key, time.time_ns(), timeout=None)
+
+        transaction.on_commit(broadcast)
+
+    def prune(self):
+        """Delete the rows of tokens that expired anyway; returns how many"""
+        deleted, _by_model = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+revocation_list = RevocationList()
+
+
+class RevocableTokenMixin:
+    """
+    Token refused once revoked. `blacklist()` revokes it, so simplejwt's refresh
+    serializer revokes rotated refresh tokens (BLACKLIST_AFTER_ROTATION) through it.
+    """
+
+    def verify(self):
+        super().verify()
+        if revocation_list.is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        revocation_list.revoke(self)
+
+
+class RevocableAccessToken(RevocableTokenMixin, AccessToken):
+    pass
@@ -0,0 +1,54 @@
+from .authentication import ROLES, load_auth_user, token_roles
+
+
+class Roles:
+    """The role rows (student, teacher, principal, accountant, driver) of a user; None for the ones they don't have"""
+
+    __slots__ = ROLES
+
+    def __init__(self, user=None):
+        for role in ROLES:
+            setattr(self, role, getattr(user, role, None) if user is not None else None)
+
+    def has(self, role):
+        return getattr(self, role) is not None
+
+
+def _roles_loaded(user):
+    """Whether every role row of the user is already cached on it (None counts: known to be missing)"""
+    fields_cache = user._state.fields_cache
+    return all(role in fields_cache for role in ROLES)
+
+
+def resolve_roles(request):
+    """
+    The role rows of the request's user, memoized on the request.
+
+    Fetched with one select_related query when the user doesn't already carry
+    them (ClaimsJWTAuthentication users do), and cached on request.user too, so
+    request.user.teacher and friends cost nothing afterwards either.
+    """
+    user = getattr(request, 'user', None)  # on a DRF request this runs authentication first
+    request = getattr(request, '_request', request)  # memoize on the Django request, shared by DRF's wrapper
+    roles = getattr(request, '_roles', None)
+    if roles is not None:
+        return roles
+
+    if user is None or not user.is_authenticated:
+        roles = Roles()
+    else:
+        if not _roles_loaded(user):
+            loaded = load_auth_user(user.pk)
+            for role in ROLES:
+                user._state.fields_cache[role] = loaded._state.fields_cache.get(role)
+        roles = Roles(user)
+    request._roles = roles
+    return roles
+
+
+def has_role(request, role):
+    """Whether the request's user has the role row `role` ('student', 'teacher', ...), trusting token claims"""
+    claims = token_roles(request)
+    if claims is not None:
+        return f'{role}_id' in claims
+    return resolve_roles(request).has(role)
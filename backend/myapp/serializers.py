@@ -2,56 +2,232 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import *
 from datetime import datetime, date
+from decimal import Decimal
+from django.db import transaction
+from django.core.exceptions import FieldDoesNotExist
 from django.shortcuts import get_object_or_404
+from . import bs_calendar
+
+def convert_date_columns(fields, rows):
+    """
+    Convert the date and datetime columns of already serialized rows to BS
+    (when DateSetting says so), one whole column at a time.
+    """
+    if not rows or DateSetting.get_instance().is_ad:
+        return
+
+    for field_name, field in fields.items():
+        is_datetime = isinstance(field, serializers.DateTimeField)
+        if not is_datetime and not isinstance(field, serializers.DateField):
+            continue
+
+        positions, values = [], []
+        for position, row in enumerate(rows):
+            value = row.get(field_name)
+            if not value:
+                continue
+            # Handle ISO 8601 or plain date/datetime format
+            if isinstance(value, str):
+                try:
+                    if is_datetime:
+                        value = datetime.fromisoformat(value.replace("Z", ""))
+                    else:
+                        value = date.fromisoformat(value.split("T")[0])  # Extract date part safely
+                except ValueError:
+                    continue  # Skip conversion if invalid format
+            if is_datetime and not isinstance(value, datetime):
+                continue
+            if isinstance(value, date):
+                positions.append(position)
+                values.append(value)
+
+        for position, value, bs_date in zip(positions, values, bs_calendar.convert_many(values)):
+            if is_datetime:
+                bs_date = f"{bs_date} {value.strftime('%H:%M:%S')}"
+            rows[position][field_name] = bs_date
+
+
+class PlannedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that applies the child's query plan (see SparseFieldsMixin)
+    to the queryset it is given, so list views get their select_related and
+    prefetch_related without having to spell them out.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, (models.QuerySet, models.Manager)) and isinstance(self.child, SparseFieldsMixin):
+            data = self.child.plan_queryset(data.all())
+        return super().to_representation(data)
+
+
+class DateFormatListSerializer(PlannedListSerializer):
+    """List serializer that converts the dates of the whole response in one pass"""
+
+    def to_representation(self, data):
+        rows = super().to_representation(data)
+        convert_date_columns(self.child.fields, rows)
+        return rows
+
 
 class DateFormatMixin:
     """Mixin to convert date and datetime fields based on DateSetting"""
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, 'Meta', None)
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = DateFormatListSerializer
+
     def to_representation(self, instance):
         """Modify representation of date and datetime fields"""
         data = super().to_representation(instance)
-        date_setting = DateSetting.get_instance()
+        if not isinstance(self.parent, DateFormatListSerializer):
+            # Rows of a list are converted by the list serializer, column by column
+            convert_date_columns(self.fields, [data])
+        return data
+
+def parse_fields(value):
+    """
+    Parse a ``fields=`` query parameter ("id,roll_no,user.first_name") into a
+    tree: {"id": None, "roll_no": None, "user": {"first_name": None}}.
+    None means "all fields"; an empty or missing parameter gives None.
+    """
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        names = [name.strip() for name in path.split('.') if name.strip()]
+        node = tree
+        for depth, name in enumerate(names):
+            if depth == len(names) - 1:
+                node.setdefault(name, None)
+            else:
+                node = node.get(name) if isinstance(node.get(name), dict) else node.setdefault(name, {})
+                if node is None:
+                    break
+    return tree or None
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets: ``fields=`` (a tree from parse_fields)
+    keeps only the requested fields, nested serializers included.
+
+    `plan_queryset()` then loads only what the kept fields read. Plain model
+    fields and nested serializers of a foreign key are planned automatically;
+    other fields (method fields, nested lists) declare their needs in
+    `query_plan`: {field: {"only": [...], "select": [...], "prefetch": [...]}}.
+    A field that is neither leaves all columns loaded. Columns are only
+    restricted (only()) when a fieldset was requested.
+
+    Lists of these serializers apply the plan themselves (PlannedListSerializer).
+    """
+    query_plan = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, 'Meta', None)
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = PlannedListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = False
+        if fields:
+            self.restrict_fields(fields)
+
+    def restrict_fields(self, tree):
+        self.sparse = True
+        for name in list(self.fields):
+            if name not in tree:
+                self.fields.pop(name)
+            elif tree[name] and isinstance(self.fields[name], SparseFieldsMixin):
+                self.fields[name].restrict_fields(tree[name])
+
+    def get_query_plan(self):
+        """Return (only, select_related, prefetch_related); `only` is None when all columns are needed."""
+        model = self.Meta.model
+        only, select, prefetch = [model._meta.pk.name], [], []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            plan = self.query_plan.get(name)
+            if plan is not None:
+                if only is not None and 'only' in plan:
+                    only += plan['only']
+                elif 'only' not in plan:
+                    only = None
+                select += plan.get('select', [])
+                prefetch += plan.get('prefetch', [])
+                continue
+
+            if len(field.source_attrs) > 1:
+                # Dotted source ("created_by.username"): follow the forward relations
+                relation = _relation_path(model, field.source_attrs)
+                if relation:
+                    select.append(relation)
+                only = None
+                continue
 
-        for field_name, field in self.fields.items():
-            if isinstance(field, serializers.DateField) and data.get(field_name):
-                # Convert AD to BS if `is_ad` is False
-                if not date_setting.is_ad:
-                    ad_date = data[field_name]
-
-                    # Handle ISO 8601 or plain date format
-                    if isinstance(ad_date, str):
-                        try:
-                            ad_date = date.fromisoformat(ad_date.split("T")[0])  # Extract date part safely
-                        except ValueError:
-                            continue  # Skip conversion if invalid format
-
-                    if isinstance(ad_date, date):
-                        bs_date = nepali_datetime.date.from_datetime_date(ad_date)
-                        data[field_name] = bs_date.strftime('%Y-%m-%d')  # Convert to BS format
-
-            elif isinstance(field, serializers.DateTimeField) and data.get(field_name):
-                # Convert AD datetime to BS if `is_ad` is False
-                if not date_setting.is_ad:
-                    ad_datetime = data[field_name]
-
-                    # Handle ISO 8601 datetime format
-                    if isinstance(ad_datetime, str):
-                        try:
-                            ad_datetime = datetime.fromisoformat(ad_datetime.replace("Z", ""))
-                        except ValueError:
-                            continue  # Skip conversion if invalid format
-
-                    if isinstance(ad_datetime, datetime):
-                        bs_datetime = nepali_datetime.date.from_datetime_date(ad_datetime.date())
-                        data[field_name] = bs_datetime.strftime('%Y-%m-%d %H:%M:%S')  # Convert to BS format
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                only = None  # Unknown needs: load every column
+                continue
+
+            if isinstance(field, SparseFieldsMixin) and (model_field.many_to_one or model_field.one_to_one):
+                nested_only, nested_select, nested_prefetch = field.get_query_plan()
+                select += [field.source] + [f"{field.source}__{path}" for path in nested_select]
+                prefetch += [f"{field.source}__{path}" for path in nested_prefetch]
+                if only is not None:
+                    if nested_only is None:
+                        only.append(field.source)
+                    else:
+                        only += [f"{field.source}__{column}" for column in nested_only]
+            elif model_field.many_to_many or model_field.one_to_many:
+                prefetch.append(field.source)
+            elif only is not None:
+                only.append(field.source)
+        return only, select, prefetch
+
+    def plan_queryset(self, queryset):
+        """Apply the query plan of the kept fields to `queryset` (left alone once evaluated or sliced)"""
+        if queryset._result_cache is not None or queryset.query.is_sliced:
+            return queryset
+        only, select, prefetch = self.get_query_plan()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None and self.sparse:
+            queryset = queryset.only(*only)
+        return queryset
+
+
+def _relation_path(model, attrs):
+    """select_related path of a dotted source through forward foreign keys, or None"""
+    path = []
+    for attr in attrs[:-1]:
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        if not (model_field.many_to_one or model_field.one_to_one) or not model_field.concrete:
+            return None
+        path.append(attr)
+        model = model_field.related_model
+    return '__'.join(path)
 
-        return data
 
 # Serializer for the CustomUser model
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Optionally include a derived role field
     role = serializers.SerializerMethodField()
 
+    query_plan = {
+        'role': {'only': ['is_master', 'is_principal', 'is_teacher', 'is_student', 'is_accountant']},
+    }
+
     class Meta:
         model = CustomUser
         fields = (
@@ -310,7 +486,7 @@ class TeacherSerializer(serializers.ModelSerializer):
         return instance
 
 
-class GetTeacherSerializer(DateFormatMixin, serializers.ModelSerializer):
+class GetTeacherSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     user = UserSerializer()
     subject_details = SubjectSerializer(source='subjects', many=True, read_only=True)
     class_details = ClassSerializer(source='classes', many=True, read_only=True)
@@ -318,6 +494,19 @@ class GetTeacherSerializer(DateFormatMixin, serializers.ModelSerializer):
     class_teacher_section_details = serializers.SerializerMethodField()
     classes_section_details = serializers.SerializerMethodField()
 
+    query_plan = {
+        'class_details': {'only': [], 'prefetch': ['classes__subjects', 'classes__optional_subjects']},
+        'class_teacher_details': {
+            'only': ['class_teacher__id', 'class_teacher__class_code', 'class_teacher__class_name'],
+            'select': ['class_teacher'],
+        },
+        'class_teacher_section_details': {
+            'only': ['class_teacher_section__id', 'class_teacher_section__section_name'],
+            'select': ['class_teacher_section'],
+        },
+        'classes_section_details': {'only': [], 'prefetch': ['classes_section']},
+    }
+
     class Meta:
         model = Teacher
         fields = [
@@ -358,7 +547,7 @@ class GetTeacherSerializer(DateFormatMixin, serializers.ModelSerializer):
 
 
 # Serializer for the Principal model
-class PrincipalSerializer(serializers.ModelSerializer):
+class PrincipalSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()  # Nested serializer for the user associated with the principal
 
     class Meta:
@@ -486,11 +675,19 @@ class StudentSerializer(serializers.ModelSerializer):
 
 
 
-class GetStudentSerializer(DateFormatMixin, serializers.ModelSerializer):
+class GetStudentSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     user = UserSerializer()
     class_details = serializers.SerializerMethodField()
     optional_subjects = serializers.SerializerMethodField()  # ✅ Add field for optional subjects
 
+    query_plan = {
+        'class_details': {
+            'only': ['class_code__id', 'class_code__class_code', 'class_code__class_name'],
+            'select': ['class_code'],
+        },
+        'optional_subjects': {'only': [], 'prefetch': ['optional_subjects']},
+    }
+
     class Meta:
         model = Student
         fields = ['id', 'user', 'phone', 'address', 'date_of_birth', 'parents', 'gender', 'class_details', 'roll_no', 'optional_subjects']
@@ -508,7 +705,7 @@ class GetStudentSerializer(DateFormatMixin, serializers.ModelSerializer):
         return [{"id": sub.id, "subject_code": sub.subject_code, "subject_name": sub.subject_name} for sub in obj.optional_subjects.all()]
 
 
-class AccountantSerializer(DateFormatMixin, serializers.ModelSerializer):
+class AccountantSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     user = UserSerializer()  # Nested serializer for the user associated with the staff
 
     class Meta:
@@ -574,7 +771,7 @@ class AccountantSerializer(DateFormatMixin, serializers.ModelSerializer):
 from rest_framework import serializers
 from .models import Driver, CustomUser
 
-class DriverSerializer(serializers.ModelSerializer):
+class DriverSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()  # Nested User Serializer
 
     class Meta:
@@ -710,7 +907,7 @@ from rest_framework import serializers
 from .models import Assignment, Subject, Class, Teacher
 import nepali_datetime
 
-class AssignmentSerializer(DateFormatMixin, serializers.ModelSerializer):
+class AssignmentSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     # For output, display teacher's username instead of its id.
     teacher = serializers.SlugRelatedField(
         read_only=True,
@@ -726,6 +923,12 @@ class AssignmentSerializer(DateFormatMixin, serializers.ModelSerializer):
         slug_field='class_name'
     )
 
+    query_plan = {
+        'teacher': {'select': ['teacher__user']},
+        'subject': {'select': ['subject']},
+        'class_assigned': {'select': ['class_assigned']},
+    }
+
     class Meta:
         model = Assignment
         fields = [
@@ -880,9 +1083,11 @@ class DiscussionPostSerializer(serializers.ModelSerializer):
         model = DiscussionPost
         fields = ['id', 'topic', 'content', 'created_by', 'created_at', 'updated_at']
 
-class GetDiscussionPostSerializer(serializers.ModelSerializer):
+class GetDiscussionPostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by = serializers.SerializerMethodField()
 
+    query_plan = {'created_by': {'select': ['created_by']}}
+
     class Meta:
         model = DiscussionPost
         fields = ['id', 'topic', 'content', 'created_by', 'created_at', 'updated_at']
@@ -1050,6 +1255,50 @@ class StudentResultSerializer(serializers.ModelSerializer):
             'total_marks', 'percentage', 'gpa', 'created_by', 'created_at'
         ]
 
+class StudentMarksEntrySerializer(serializers.Serializer):
+    """One student's marks in a bulk marks entry"""
+    student = serializers.IntegerField()
+    practical_marks = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('0'), required=False, allow_null=True)
+    theory_marks = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('0'), required=False, allow_null=True)
+
+
+class BulkStudentMarksSerializer(serializers.Serializer):
+    """
+    Marks of a whole class for one ExamDetail (passed as `exam_detail` in the context).
+    Errors are reported per row, keyed by the row index.
+    """
+    results = StudentMarksEntrySerializer(many=True, allow_empty=False)
+
+    def validate_results(self, results):
+        exam_detail = self.context['exam_detail']
+        full_marks = exam_detail.full_marks or 0
+        student_ids = [entry['student'] for entry in results]
+        # Students of the exam's class who take its subject (compulsory or chosen)
+        class_students = set(
+            StudentEnrolment.objects.filter(
+                subject_id=exam_detail.subject_id, school_class=exam_detail.class_assigned, student_id__in=student_ids
+            ).values_list('student_id', flat=True)
+        )
+
+        errors = {}
+        seen = set()
+        for index, entry in enumerate(results):
+            student_id = entry['student']
+            total = (entry.get('practical_marks') or 0) + (entry.get('theory_marks') or 0)
+            if student_id in seen:
+                errors[index] = {"student": "Duplicate entry for this student."}
+            elif student_id not in class_students:
+                errors[index] = {"student": "Student does not take this subject in the class of this exam."}
+            elif total > full_marks:
+                errors[index] = {
+                    "total_marks": f"Total marks ({total}) cannot be greater than the full marks ({full_marks}) of the subject."
+                }
+            seen.add(student_id)
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return results
+
 class GetStudentResultSerializer(DateFormatMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')  # Display the creator's username
     student_details = serializers.SerializerMethodField()  # Fetch student details
@@ -1070,8 +1319,7 @@ class GetStudentResultSerializer(DateFormatMixin, serializers.ModelSerializer):
         if date_setting.is_ad:
             formatted_dob = date_of_birth.strftime('%Y-%m-%d') if date_of_birth else None
         else:
-            bs_date = nepali_datetime.date.from_datetime_date(date_of_birth)
-            formatted_dob = bs_date.strftime('%Y-%m-%d') if bs_date else None
+            formatted_dob = bs_calendar.ad_to_bs(date_of_birth)
 
         return {
             "id": student.id,
@@ -1092,8 +1340,7 @@ class GetStudentResultSerializer(DateFormatMixin, serializers.ModelSerializer):
         if date_setting.is_ad:
             formatted_exam_date = exam_date.strftime('%Y-%m-%d') if exam_date else None
         else:
-            bs_date = nepali_datetime.date.from_datetime_date(exam_date)
-            formatted_exam_date = bs_date.strftime('%Y-%m-%d') if bs_date else None
+            formatted_exam_date = bs_calendar.ad_to_bs(exam_date)
 
         return {
             "id": exam_detail.id,
@@ -1146,11 +1393,16 @@ class NotesSerializer(serializers.ModelSerializer):
 
         return super().create(validated_data)
     
-class GetNotesSerializer(serializers.ModelSerializer):
+class GetNotesSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')  # Show teacher's username
     class_code = serializers.SerializerMethodField()  # Fetch class details
     subject = serializers.SerializerMethodField()  # Fetch subject details
 
+    query_plan = {
+        'class_code': {'select': ['class_code']},
+        'subject': {'select': ['subject']},
+    }
+
     class Meta:
         model = Notes
         fields = '__all__'
@@ -1214,13 +1466,11 @@ class StudentListAttendanceSerializer(DateFormatMixin, serializers.ModelSerializ
         return None
 
     def get_pre_balance(self, obj):
-        """ Fetch the last transaction balance of the student. """
-        last_transaction = (
-            StudentTransaction.objects.filter(student=obj)
-            .order_by('-transaction_date')
-            .first()
-        )
-        return last_transaction.balance if last_transaction else 0  # Default to 0 if no transaction
+        """ Current balance of the student, from their account (select_related('account')). """
+        try:
+            return obj.account.balance
+        except StudentAccount.DoesNotExist:
+            return 0  # Default to 0 if the student was never billed
 
 
     
@@ -1276,14 +1526,6 @@ class StudentBillSerializer(serializers.ModelSerializer):
     class Meta:
         model = StudentBill
         fields = ['id', 'student', 'month', 'date', 'bill_number', 'fee_categories', 'transportation_fee', 'remarks', 'subtotal', 'discount', 'total_amount']
-        extra_fields = ['pre_balance', 'post_balance']
-
-    def get_pre_balance(self, obj):
-        last_transaction = obj.student.transactions.order_by('-transaction_date').first()
-        return last_transaction.balance if last_transaction else 0
-
-    def get_post_balance(self, obj):
-        return self.get_pre_balance(obj) + obj.total_amount  # Adding the bill amount
 
     def create(self, validated_data):
         fee_categories_data = validated_data.pop('fee_categories', [])  # Extract fee categories
@@ -1302,38 +1544,46 @@ class StudentBillSerializer(serializers.ModelSerializer):
         # Calculate and save totals
         bill.calculate_totals()
 
-        # Fetch the last transaction for the student based on transaction_date
-        last_transaction = (
-            StudentTransaction.objects.filter(student=bill.student)
-            .order_by('-transaction_date')
-            .first()
+        # Add the bill amount to the student's account and record the transaction
+        StudentAccount.post(
+            bill.student, bill.total_amount, 'bill', bill=bill,
+            transaction_date=bill.date  # Set the transaction date to the bill's date
         )
 
-        # Default to 0 balance if no previous transaction exists
-        last_balance = last_transaction.balance if last_transaction else Decimal('0.00')
+        return bill
 
-        # Add bill amount to the last balance
-        new_balance = last_balance + Decimal(str(bill.total_amount))
 
-        # Create the corresponding StudentTransaction instance for the bill
-        StudentTransaction.objects.create(
-            student=bill.student,
-            transaction_type='bill',
-            bill=bill,
-            balance=new_balance,
-            transaction_date=bill.date  # Set the transaction date to the bill's date
-        )
+def _own_transaction(obj):
+    """The StudentTransaction recorded for a bill or payment (uses prefetched rows)"""
+    transactions = sorted(obj.transactions.all(), key=lambda txn: txn.id)
+    return transactions[0] if transactions else None
 
-        return bill
+
+class MonthlyBillingSerializer(serializers.Serializer):
+    """Input of the batch billing of a class (or of the whole school when class_id is omitted)"""
+    month = serializers.CharField(max_length=20)
+    class_id = serializers.PrimaryKeyRelatedField(queryset=Class.objects.all(), required=False, allow_null=True)
+    scholarships = serializers.DictField(
+        child=serializers.ListField(child=serializers.IntegerField()), required=False
+    )  # {student_id: [fee_category_id, ...]}
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
 
 
-class GetStudentBillSerializer(DateFormatMixin, serializers.ModelSerializer):
+class GetStudentBillSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     student = serializers.SerializerMethodField()
     fee_categories = serializers.SerializerMethodField()
     transportation_fee = serializers.SerializerMethodField()
     pre_balance = serializers.SerializerMethodField()
     post_balance = serializers.SerializerMethodField()
 
+    query_plan = {
+        'student': {'select': ['student__user', 'student__class_code']},
+        'fee_categories': {'prefetch': ['studentbillfeecategory_set__fee_category__fee_category_name']},
+        'transportation_fee': {'select': ['transportation_fee']},
+        'pre_balance': {'prefetch': ['transactions']},
+        'post_balance': {'prefetch': ['transactions']},
+    }
+
     class Meta:
         model = StudentBill
         fields = [
@@ -1349,8 +1599,7 @@ class GetStudentBillSerializer(DateFormatMixin, serializers.ModelSerializer):
         # Convert date_of_birth if BS is needed
         date_of_birth = student.date_of_birth
         if date_of_birth and not date_setting.is_ad:
-            bs_date = nepali_datetime.date.from_datetime_date(date_of_birth)
-            date_of_birth = bs_date.strftime('%Y-%m-%d')
+            date_of_birth = bs_calendar.ad_to_bs(date_of_birth)
 
         return {
             'id': student.id,
@@ -1387,14 +1636,12 @@ class GetStudentBillSerializer(DateFormatMixin, serializers.ModelSerializer):
         return None
 
     def get_pre_balance(self, obj):
-        last_transaction = StudentTransaction.objects.filter(
-            student=obj.student, transaction_date__lt=obj.date
-        ).order_by('-transaction_date').first()
-
-        return last_transaction.balance if last_transaction else 0
+        # Balance just before this bill, read from the bill's own transaction
+        return self.get_post_balance(obj) - obj.total_amount
 
     def get_post_balance(self, obj):
-        return self.get_pre_balance(obj) + obj.total_amount  # Adding the bill amount
+        bill_transaction = _own_transaction(obj)
+        return bill_transaction.balance if bill_transaction else obj.total_amount
 
 
 class StudentPaymentSerializer(serializers.ModelSerializer):
@@ -1409,18 +1656,13 @@ class StudentPaymentSerializer(serializers.ModelSerializer):
         fields = ('id', 'student', 'created_by', 'date', 'payment_number', 'amount_paid', 'remarks', 'pre_balance', 'post_balance')
 
     def get_pre_balance(self, obj):
-        """Fetch last transaction balance before this payment."""
-        last_transaction = (
-            StudentTransaction.objects.filter(student=obj.student)
-            .order_by('-transaction_date')
-            .only("balance")  # Fetch only balance field
-            .first()
-        )
-        return last_transaction.balance if last_transaction else Decimal('0.00')
+        """Balance just before this payment."""
+        return self.get_post_balance(obj) + obj.amount_paid
 
     def get_post_balance(self, obj):
-        """Calculate post balance dynamically."""
-        return self.get_pre_balance(obj) - obj.amount_paid
+        """Balance after this payment, read from the payment's own transaction."""
+        payment_transaction = _own_transaction(obj)
+        return payment_transaction.balance if payment_transaction else -obj.amount_paid
 
     def validate(self, data):
         """Ensure amount paid is non-negative."""
@@ -1431,31 +1673,33 @@ class StudentPaymentSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Process payment creation and update transactions."""
         request = self.context.get("request")
-        pre_balance = self.context.get("pre_balance", Decimal("0.00"))  # Pass from API view
         validated_data["created_by"] = request.user if request else None
 
-        # Create payment
-        payment = StudentPayment.objects.create(**validated_data)
-        post_balance = pre_balance - payment.amount_paid
-
-        # Create corresponding transaction
-        StudentTransaction.objects.create(
-            student=payment.student,
-            transaction_type="payment",
-            payment=payment,
-            balance=post_balance,
-            transaction_date=payment.date
-        )
+        with transaction.atomic():
+            # Create payment
+            payment = StudentPayment.objects.create(**validated_data)
+
+            # Take the payment off the student's account and record the transaction
+            StudentAccount.post(
+                payment.student, -payment.amount_paid, "payment", payment=payment,
+                transaction_date=payment.date
+            )
 
         return payment
 
 
-class GetStudentPaymentSerializer(DateFormatMixin, serializers.ModelSerializer):
+class GetStudentPaymentSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     student = serializers.SerializerMethodField()
     created_by = serializers.CharField(source="created_by.username", read_only=True)  # Show username
     pre_balance = serializers.SerializerMethodField()
     post_balance = serializers.SerializerMethodField()
 
+    query_plan = {
+        'student': {'select': ['student__user', 'student__class_code']},
+        'pre_balance': {'prefetch': ['transactions']},
+        'post_balance': {'prefetch': ['transactions']},
+    }
+
     class Meta:
         model = StudentPayment
         fields = [
@@ -1470,8 +1714,7 @@ class GetStudentPaymentSerializer(DateFormatMixin, serializers.ModelSerializer):
         # Convert date_of_birth if BS is needed
         date_of_birth = student.date_of_birth
         if date_of_birth and not date_setting.is_ad:
-            bs_date = nepali_datetime.date.from_datetime_date(date_of_birth)
-            date_of_birth = bs_date.strftime('%Y-%m-%d')
+            date_of_birth = bs_calendar.ad_to_bs(date_of_birth)
 
         return {
             'id': student.id,
@@ -1487,15 +1730,14 @@ class GetStudentPaymentSerializer(DateFormatMixin, serializers.ModelSerializer):
 
 
     def get_pre_balance(self, obj):
-        last_transaction = StudentTransaction.objects.filter(
-            student=obj.student, transaction_date__lt=obj.date
-        ).order_by('-transaction_date').first()
-        return last_transaction.balance if last_transaction else 0
+        # Balance just before this payment, read from the payment's own transaction
+        return self.get_post_balance(obj) + obj.amount_paid
 
     def get_post_balance(self, obj):
-        return self.get_pre_balance(obj) - obj.amount_paid
+        payment_transaction = _own_transaction(obj)
+        return payment_transaction.balance if payment_transaction else -obj.amount_paid
 
-class StudentTransactionSerializer(DateFormatMixin, serializers.ModelSerializer):
+class StudentTransactionSerializer(SparseFieldsMixin, DateFormatMixin, serializers.ModelSerializer):
     bill = serializers.SerializerMethodField()
     bill_number = serializers.SerializerMethodField()
     payment = serializers.SerializerMethodField()
@@ -1512,6 +1754,11 @@ class StudentTransactionSerializer(DateFormatMixin, serializers.ModelSerializer)
             "balance", "transaction_date", "total_amount", "paid_amount", "month", "remarks"
         ]
 
+    query_plan = {
+        name: {'select': ['bill', 'payment']}
+        for name in ['bill', 'bill_number', 'payment', 'payment_number', 'total_amount', 'paid_amount', 'month', 'remarks']
+    }
+
     def get_bill(self, obj):
         return obj.bill.id if obj.bill else None
 
@@ -1623,3 +1870,15 @@ class TaskSerializer(serializers.ModelSerializer):
         model = Task
         fields = '__all__'
         read_only_fields = ('user',)
+
+
+class BulkJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BulkJob
+        exclude = ['profile_ids']
+
+    def get_progress(self, obj):
+        # Percentage of the profiles done
+        return round(100 * obj.processed / obj.total, 1) if obj.total else 100.0
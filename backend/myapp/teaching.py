@@ -0,0 +1,134 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Class, Section, Teacher, TeachingAssignment
+
+TEACHING_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class TeachingScope:
+    """
+    What one teacher teaches, as sets: their classes and subjects (the plain
+    many-to-manys) and the (class, subject) pairs of their TeachingAssignment
+    rows with the sections of each (None: every section).
+    """
+
+    __slots__ = ('class_ids', 'subject_ids', 'sections')
+
+    def __init__(self, class_ids, subject_ids, rows):
+        self.class_ids = frozenset(class_ids)
+        self.subject_ids = frozenset(subject_ids)
+        self.sections = {}
+        for class_id, subject_id, section_id in rows:
+            key = (class_id, subject_id)
+            if section_id is None or self.sections.get(key, ()) is None:
+                self.sections[key] = None
+            else:
+                self.sections[key] = self.sections.get(key, frozenset()) | {section_id}
+
+    def teaches_class(self, class_id):
+        return _id(class_id) in self.class_ids
+
+    def teaches_subject(self, subject_id):
+        return _id(subject_id) in self.subject_ids
+
+    def teaches(self, class_id, subject_id, section_id=None):
+        """Whether the teacher teaches the subject in the class (and in that section, if given)"""
+        key = (_id(class_id), _id(subject_id))
+        if key not in self.sections:
+            return False
+        sections = self.sections[key]
+        return section_id is None or sections is None or _id(section_id) in sections
+
+    def subjects_in(self, class_id):
+        class_id = _id(class_id)
+        return {subject_id for pair_class_id, subject_id in self.sections if pair_class_id == class_id}
+
+
+def _id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _version_key(teacher_id):
+    return f"teaching:{teacher_id}:version"
+
+
+def teaching_scope(teacher):
+    """The TeachingScope of a teacher (or teacher id), from the shared cache when current"""
+    teacher_id = getattr(teacher, 'pk', teacher)
+    cache.add(_version_key(teacher_id), time.time_ns(), timeout=None)
+    key = f"teaching:{teacher_id}:{cache.get(_version_key(teacher_id))}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = (
+            list(Teacher.classes.through.objects.filter(teacher_id=teacher_id).values_list('class_id', flat=True)),
+            list(Teacher.subjects.through.objects.filter(teacher_id=teacher_id).values_list('subject_id', flat=True)),
+            list(TeachingAssignment.objects.filter(teacher_id=teacher_id).values_list('school_class_id', 'subject_id', 'section_id')),
+        )
+        cache.set(key, payload, timeout=TEACHING_CACHE_TIMEOUT)
+    return TeachingScope(*payload)
+
+
+def teaching_changed(teacher_ids):
+    """Rebuild the TeachingAssignment rows of these teachers now, and drop their cached scopes on commit"""
+    teacher_ids = {teacher_id for teacher_id in teacher_ids if teacher_id is not None}
+    if not teacher_ids:
+        return
+    TeachingAssignment.sync_for(teacher_ids)
+
+    def bump():
+        stamp = time.time_ns()
+        cache.set_many({_version_key(teacher_id): stamp for teacher_id in teacher_ids}, timeout=None)
+    transaction.on_commit(bump)
+
+
+def _teachers_of_classes(class_ids):
+    return Teacher.classes.through.objects.filter(class_id__in=class_ids).values_list('teacher_id', flat=True)
+
+
+@receiver(m2m_changed, sender=Teacher.subjects.through)
+@receiver(m2m_changed, sender=Teacher.classes.through)
+@receiver(m2m_changed, sender=Teacher.classes_section.through)
+def teacher_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            teaching_changed([instance.pk])
+    elif action == 'pre_clear':
+        # From the subject/class/section side: remember whose links are about to go
+        field = instance._meta.model_name  # The through model's other column: subject, class or section
+        instance._teaching_teachers = list(sender.objects.filter(**{field: instance.pk}).values_list('teacher_id', flat=True))
+    elif action == 'post_clear':
+        teaching_changed(instance.__dict__.pop('_teaching_teachers', ()))
+    elif action.startswith('post_'):
+        teaching_changed(pk_set)
+
+
+@receiver(m2m_changed, sender=Class.subjects.through)
+def class_subjects_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            teaching_changed(_teachers_of_classes([instance.pk]))
+    elif action == 'pre_clear':
+        instance._teaching_classes = list(sender.objects.filter(subject=instance.pk).values_list('class_id', flat=True))
+    elif action == 'post_clear':
+        teaching_changed(_teachers_of_classes(instance.__dict__.pop('_teaching_classes', ())))
+    elif action.startswith('post_'):
+        teaching_changed(_teachers_of_classes(pk_set))
+
+
+@receiver(pre_delete, sender=Section)
+def section_deleting(sender, instance, **kwargs):
+    instance._teaching_teachers = list(instance.teacher_sections.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Section)
+def section_deleted(sender, instance, **kwargs):
+    # A teacher left without a section of the class now teaches all of them
+    teaching_changed(instance.__dict__.pop('_teaching_teachers', ()))
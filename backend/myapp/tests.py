@@ -1,3 +1,1035 @@
-from django.test import TestCase
+import datetime
+import io
+import itertools
+import os
+import tempfile
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .attendance import record_daily_attendance
+from .bulk import deactivate_profiles, delete_profiles, run_bulk_job
+from .fast_serializers import (
+    FastClassAttendanceSerializer, FastStudentResultSerializer, FastStudentSerializer, FastStudentTransactionSerializer,
+)
+from .models import *
+from .registry import settings_registry
+from .revocation import RevocationList, revocation_list
+from .serializers import GetStudentResultSerializer, GetStudentSerializer, StudentTransactionSerializer
+from .teaching import teaching_scope
+from .typeahead import student_index
+
+_serial = itertools.count(1)
+# Not the project's file cache: entries keyed on row ids would outlive the test database
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def clear_cache():
+    """Empty the test cache, with the stamp of this worker's settings registry (or it reloads mid-test)"""
+    cache.clear()
+    settings_registry.invalidate("date_setting")
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CACHES=LOCAL_CACHES)
+class ListQueryCountTests(TestCase):
+    """
+    The list endpoints of students, staff, fees, results, attendance, notes,
+    assignments and the forum must run the same number of queries whatever the
+    number of rows they return: a count that grows with the rows is an N+1
+    regression.
+    """
+    sizes = (10, 100, 1000)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [
+            Subject.objects.create(subject_code=f"S{index}", subject_name=f"Subject {index}") for index in range(3)
+        ]
+        cls.school_class = Class.objects.create(class_code="C1", class_name="One")
+        cls.school_class.subjects.set(cls.subjects)
+        cls.school_class.optional_subjects.set(cls.subjects[2:])
+        cls.section = Section.objects.create(school_class=cls.school_class, section_name="A")
+        cls.fee_category = FeeCategory.objects.create(
+            class_assigned=cls.school_class,
+            fee_category_name=FeeCategoryName.objects.create(name="Tuition"),
+            amount=Decimal('1000.00'),
+        )
+        cls.transportation_fee = TransportationFee.objects.create(place="Town", amount=Decimal('300.00'))
+        cls.admin = CustomUser.objects.create(username="admin-user", is_principal=True)
+        cls.student = cls.make_students(1)[0]
+        teacher_user = CustomUser.objects.create(username="list-teacher", is_teacher=True)
+        cls.teacher = Teacher.objects.create(
+            user=teacher_user, phone="9700000000", address="Address", date_of_joining=datetime.date(2020, 1, 1),
+            gender="female",
+        )
+        cls.teacher.subjects.set(cls.subjects)
+        cls.teacher.classes.set([cls.school_class])
+        cls.exam_detail = ExamDetail.objects.create(
+            exam=Exam.objects.create(name="Terminal"), subject=cls.subjects[0], class_assigned=cls.school_class,
+            full_marks=100, pass_marks=40, exam_date=datetime.date(2024, 5, 1), created_by=cls.admin,
+        )
+
+    def setUp(self):
+        clear_cache()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    # Row factories (bulk inserts, so 1,000 rows stay quick)
+
+    @staticmethod
+    def make_users(count, **flags):
+        return CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f"user{serial}", password="!", first_name="First", last_name=f"Last{serial}", **flags
+            )
+            for serial in itertools.islice(_serial, count)
+        ])
+
+    @classmethod
+    def make_students(cls, count):
+        students = Student.objects.bulk_create([
+            Student(
+                user=user, phone=f"98{user.id:08d}", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                gender="male", parents="Parent", class_code=cls.school_class, class_code_section=cls.section,
+                roll_no=str(user.id),
+            )
+            for user in cls.make_users(count, is_student=True)
+        ])
+        Student.optional_subjects.through.objects.bulk_create([
+            Student.optional_subjects.through(student_id=student.id, subject_id=cls.subjects[2].id)
+            for student in students
+        ])
+        StudentEnrolment.sync_for([student.id for student in students])
+        return students
+
+    def make_teachers(self, count):
+        teachers = Teacher.objects.bulk_create([
+            Teacher(
+                user=user, phone=f"97{user.id:08d}", address="Address", date_of_joining=datetime.date(2020, 1, 1),
+                gender="female", class_teacher=self.school_class, class_teacher_section=self.section,
+            )
+            for user in self.make_users(count, is_teacher=True)
+        ])
+        for relation, target in [('subjects', self.subjects[0]), ('classes', self.school_class),
+                                 ('classes_section', self.section)]:
+            through = getattr(Teacher, relation).through
+            target_field = f"{target._meta.model_name}_id"
+            through.objects.bulk_create([
+                through(teacher_id=teacher.id, **{target_field: target.id}) for teacher in teachers
+            ])
+
+    def make_principals(self, count):
+        Principal.objects.bulk_create([
+            Principal(user=user, phone=f"96{user.id:08d}", address="Address", gender="male")
+            for user in self.make_users(count, is_principal=True)
+        ])
+
+    def make_accountants(self, count):
+        Accountant.objects.bulk_create([
+            Accountant(
+                user=user, phone=f"95{user.id:08d}", address="Address", date_of_joining=datetime.date(2020, 1, 1),
+                gender="male",
+            )
+            for user in self.make_users(count, is_accountant=True)
+        ])
+
+    def make_drivers(self, count):
+        Driver.objects.bulk_create([
+            Driver(
+                user=user, phone=f"94{user.id:08d}", address="Address", date_of_joining=datetime.date(2020, 1, 1),
+                gender="male",
+            )
+            for user in self.make_users(count)
+        ])
+
+    def make_bills(self, count):
+        bills = StudentBill.objects.bulk_create([
+            StudentBill(
+                student=self.student, month="Baisakh", bill_number=f"B{serial}",
+                transportation_fee=self.transportation_fee, subtotal=Decimal('1300.00'),
+                total_amount=Decimal('1300.00'),
+            )
+            for serial in itertools.islice(_serial, count)
+        ])
+        StudentBillFeeCategory.objects.bulk_create([
+            StudentBillFeeCategory(student_bill=bill, fee_category=self.fee_category) for bill in bills
+        ])
+        StudentTransaction.objects.bulk_create([
+            StudentTransaction(student=self.student, transaction_type='bill', bill=bill, balance=bill.total_amount)
+            for bill in bills
+        ])
+
+    def make_payments(self, count):
+        payments = StudentPayment.objects.bulk_create([
+            StudentPayment(
+                student=self.student, payment_number=f"P{serial}", amount_paid=Decimal('100.00'), created_by=self.admin
+            )
+            for serial in itertools.islice(_serial, count)
+        ])
+        StudentTransaction.objects.bulk_create([
+            StudentTransaction(student=self.student, transaction_type='payment', payment=payment, balance=0)
+            for payment in payments
+        ])
+
+    def make_notes(self, count):
+        Notes.objects.bulk_create([
+            Notes(
+                chapter="Chapter", title=f"Note {serial}", subject=self.subjects[0], class_code=self.school_class,
+                created_by=self.admin,
+            )
+            for serial in itertools.islice(_serial, count)
+        ])
+
+    def make_posts(self, count):
+        DiscussionPost.objects.bulk_create([
+            DiscussionPost(topic=f"Topic {serial}", content="Content", created_by=self.admin)
+            for serial in itertools.islice(_serial, count)
+        ])
+
+    def make_results(self, count):
+        StudentResult.objects.bulk_create([
+            StudentResult(student=student, exam_detail=self.exam_detail, created_by=self.admin)
+            for student in self.make_students(count)
+        ])
+
+    def make_attendance(self, count):
+        DailyAttendance.objects.bulk_create([
+            DailyAttendance(student=student, date=datetime.date(2024, 5, 1), status=True)
+            for student in self.make_students(count)
+        ])
+
+    def make_assignments(self, count):
+        assignments = Assignment.objects.bulk_create([
+            Assignment(
+                subject=self.subjects[0], class_assigned=self.school_class, teacher=self.teacher,
+                assignment_name=f"Homework {serial}",
+            )
+            for serial in itertools.islice(_serial, count)
+        ])
+        AssignmentSubmission.objects.bulk_create([
+            AssignmentSubmission(assignment=assignment, student=self.student.user, written_submission="Done")
+            for assignment in assignments
+        ])
+
+    def assertConstantQueries(self, url, make_rows):
+        """Grow the rows behind `url` through `sizes` and compare the query counts"""
+        counts = []
+        created = 0
+        for size in self.sizes:
+            make_rows(size - created)
+            if not created:
+                self.client.get(url)  # Warm up the per-worker caches (DateSetting, ...)
+            created = size
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts.append(len(queries))
+
+        self.assertEqual(len(set(counts)), 1, f"{url} ran {counts} queries for {list(self.sizes)} rows")
+
+    def test_students(self):
+        self.assertConstantQueries('/api/students/', self.make_students)
+
+    def test_students_sparse_paginated(self):
+        self.assertConstantQueries(
+            '/api/students/?fields=id,roll_no,user.first_name,class_details&page_size=500',
+            self.make_students,
+        )
+
+    def test_teachers(self):
+        self.assertConstantQueries('/api/teachers/', self.make_teachers)
+
+    def test_principals(self):
+        self.assertConstantQueries('/api/principals/', self.make_principals)
+
+    def test_accountants(self):
+        self.assertConstantQueries('/api/accountant/', self.make_accountants)
+
+    def test_drivers(self):
+        self.assertConstantQueries('/api/drivers/', self.make_drivers)
+
+    def test_bills(self):
+        self.assertConstantQueries(f'/api/bills/{self.student.id}/', self.make_bills)
+
+    def test_payments(self):
+        self.assertConstantQueries(f'/api/payments/{self.student.id}/', self.make_payments)
+
+    def test_transactions(self):
+        self.assertConstantQueries(f'/api/transactions/{self.student.id}/', self.make_bills)
+
+    def test_notes(self):
+        self.assertConstantQueries(f'/api/notes/subject/{self.subjects[0].id}/', self.make_notes)
+
+    def test_discussion_posts(self):
+        self.assertConstantQueries('/api/forum/posts/', self.make_posts)
+
+    def test_results(self):
+        self.assertConstantQueries('/api/results/', self.make_results)
+
+    def test_students_by_class(self):
+        self.assertConstantQueries(f'/api/students/class/{self.school_class.id}/', self.make_students)
+
+    def test_students_by_subject(self):
+        self.assertConstantQueries(f'/api/students/subject/{self.subjects[0].id}/', self.make_students)
+
+    def test_class_attendance(self):
+        self.assertConstantQueries(f'/api/attendance/{self.school_class.id}/2024-05-01/', self.make_attendance)
+
+    def test_class_attendance_students(self):
+        self.assertConstantQueries(f'/api/attendance/student/{self.school_class.id}/', self.make_students)
+
+    def test_assignments_by_subject(self):
+        self.assertConstantQueries(f'/api/assignments/subject/?subject_id={self.subjects[0].id}', self.make_assignments)
+
+    def test_teacher_assignments(self):
+        self.client.force_authenticate(self.teacher.user)
+        self.assertConstantQueries('/api/teacher/assignments/', self.make_assignments)
+
+    def test_assignment_reviews(self):
+        self.client.force_authenticate(self.teacher.user)
+        self.assertConstantQueries('/api/assignments/reviews/', self.make_assignments)
+
+    def test_student_assignments(self):
+        self.client.force_authenticate(self.student.user)
+        self.assertConstantQueries('/api/student/assignments/', self.make_assignments)
+
+    def test_student_assignments_by_subject(self):
+        self.client.force_authenticate(self.student.user)
+        self.assertConstantQueries(
+            f'/api/student/assignments/subject/?subject_id={self.subjects[0].id}', self.make_assignments
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FastSerializerParityTests(TestCase):
+    """The fast_serializers give byte-for-byte the JSON of the DRF serializers they stand in for"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [
+            Subject.objects.create(subject_code=f"P{index}", subject_name=f"Subject {index}") for index in range(3)
+        ]
+        cls.school_class = Class.objects.create(class_code="C1", class_name="One")
+        cls.section = Section.objects.create(school_class=cls.school_class, section_name="A")
+        cls.admin = CustomUser.objects.create(username="parity-admin", is_principal=True)
+        users = ListQueryCountTests.make_users(3, is_student=True)
+        users[2].is_accountant = True  # Role precedence
+        users[2].save()
+        cls.students = [
+            Student.objects.create(
+                user=users[0], phone="9800000001", address="Address", date_of_birth=datetime.date(2010, 4, 14),
+                gender="male", parents="9800000000", class_code=cls.school_class, class_code_section=cls.section,
+                roll_no="1",
+            ),
+            Student.objects.create(
+                user=users[1], phone="9800000002", address="", date_of_birth=datetime.date(2011, 12, 31),
+                gender="female", parents="9800000000",
+            ),
+            Student.objects.create(
+                user=users[2], phone="9800000003", address="Address", date_of_birth=datetime.date(2009, 1, 1),
+                gender="other", parents="", class_code=cls.school_class, roll_no="3",
+            ),
+        ]
+        cls.students[0].optional_subjects.set(cls.subjects[1:])
+        cls.students[2].optional_subjects.set(cls.subjects[:1])
+
+        student = cls.students[0]
+        bill = StudentBill.objects.create(
+            student=student, month="Baisakh", bill_number="B1", subtotal=Decimal('1300.5'),
+            total_amount=Decimal('1300.5'), remarks="Bill remarks",
+        )
+        payment = StudentPayment.objects.create(
+            student=student, payment_number="P1", amount_paid=Decimal('100'), created_by=cls.admin, remarks="Cash",
+        )
+        StudentTransaction.objects.bulk_create([
+            StudentTransaction(student=student, transaction_type='bill', bill=bill, balance=Decimal('1300.5'),
+                               transaction_date=datetime.datetime(2024, 4, 13, 18, 30, tzinfo=datetime.timezone.utc)),
+            StudentTransaction(student=student, transaction_type='payment', payment=payment, balance=Decimal('1200'),
+                               transaction_date=datetime.datetime(2024, 4, 14, 9, 5, 1, 250, tzinfo=datetime.timezone.utc)),
+            StudentTransaction(student=student, transaction_type='payment', balance=Decimal('-3.1')),
+        ])
+
+        exam = Exam.objects.create(name="Terminal")
+        details = ExamDetail.objects.bulk_create([
+            ExamDetail(exam=exam, subject=cls.subjects[0], class_assigned=cls.school_class, full_marks=100,
+                       pass_marks=40, exam_date=datetime.date(2024, 5, 1), created_by=cls.admin),
+            ExamDetail(exam=exam, subject=cls.subjects[1], class_assigned=cls.school_class, full_marks=None, pass_marks=None,
+                       exam_date=datetime.date(2024, 5, 2), created_by=cls.admin),
+        ])
+        StudentResult.objects.bulk_create([
+            StudentResult(student=student, exam_detail=details[0], practical_marks=Decimal('20'),
+                          theory_marks=Decimal('55.5'), total_marks=Decimal('75.5'), percentage=Decimal('75.5'),
+                          gpa=Decimal('3.2'), created_by=cls.admin),
+            StudentResult(student=cls.students[1], exam_detail=details[1], created_by=cls.admin),
+        ])
+
+        DailyAttendance.objects.bulk_create([
+            DailyAttendance(student=cls.students[0], date=datetime.date(2024, 5, 1), status=True),
+            DailyAttendance(student=cls.students[2], date=datetime.date(2024, 5, 1), status=False),
+        ])
+
+    def setUp(self):
+        clear_cache()
+
+    def assertSameJSON(self, fast, slow):
+        self.assertEqual(JSONRenderer().render(fast.data), JSONRenderer().render(slow.data))
+
+    def check_all(self):
+        self.assertSameJSON(FastStudentSerializer(Student.objects.all()),
+                            GetStudentSerializer(Student.objects.all(), many=True))
+        transactions = StudentTransaction.objects.filter(student=self.students[0])
+        self.assertSameJSON(FastStudentTransactionSerializer(transactions),
+                            StudentTransactionSerializer(transactions, many=True))
+        self.assertSameJSON(FastStudentResultSerializer(StudentResult.objects.all()),
+                            GetStudentResultSerializer(StudentResult.objects.all(), many=True))
+
+        records = DailyAttendance.objects.filter(student__class_code=self.school_class, date=datetime.date(2024, 5, 1))
+        self.assertEqual(FastClassAttendanceSerializer(records).data, [
+            {
+                "student_id": record.student.id,
+                "full_name": f"{record.student.user.first_name} {record.student.user.last_name}".strip(),
+                "roll_no": record.student.roll_no,
+                "status": record.status,
+            }
+            for record in records
+        ])
+
+    def test_ad_dates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DateSetting(is_ad=True).save()
+        self.check_all()
+
+    def test_bs_dates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DateSetting(is_ad=False).save()
+        self.check_all()
+
+    def test_empty(self):
+        for fast_serializer_class, queryset in [(FastStudentSerializer, Student.objects.none()),
+                                                (FastStudentResultSerializer, StudentResult.objects.none())]:
+            self.assertEqual(fast_serializer_class(queryset).data, [])
+
+
+@override_settings(
+    ALLOWED_HOSTS=['*'],
+    CACHES=LOCAL_CACHES,
+    THROTTLE_BUCKETS={'login': [{'key': 'ip', 'rate': '1/min', 'burst': 3}]},
+)
+class LoginThrottleTests(TestCase):
+    """Token-bucket throttling of the login endpoint"""
+
+    def setUp(self):
+        self.store = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        self.addCleanup(os.remove, self.store)
+        store_override = override_settings(THROTTLE_STORE=self.store)
+        store_override.enable()
+        self.addCleanup(store_override.disable)
+        clear_cache()
+        self.client = APIClient()
+
+    def login(self, **extra):
+        return self.client.post('/api/login/', {'username': "nobody", 'password': "wrong"}, format='json', **extra)
+
+    def test_rejects_with_retry_after_once_empty(self):
+        statuses = [self.login().status_code for _ in range(3)]
+        self.assertNotIn(429, statuses)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_forwarded_for_does_not_pick_the_bucket(self):
+        statuses = [self.login(HTTP_X_FORWARDED_FOR=f"10.0.0.{index}").status_code for index in range(6)]
+        self.assertEqual(statuses[3:], [429] * 3)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_forwarded_for_behind_a_proxy(self):
+        statuses = [self.login(HTTP_X_FORWARDED_FOR=f"10.0.0.{index}").status_code for index in range(6)]
+        self.assertNotIn(429, statuses)
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CACHES=LOCAL_CACHES)
+class AttendanceRollupTests(TestCase):
+    """The attendance summary and trend, read from AttendanceDailyRollup, count every DailyAttendance record"""
+
+    date = datetime.date(2024, 5, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(class_code="R1", class_name="Rollup")
+        section = Section.objects.create(school_class=cls.school_class, section_name="A")
+        cls.students = [
+            Student.objects.create(
+                user=user, phone=f"97{user.id:08d}", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                gender="male", parents="Parent", class_code=cls.school_class if index < 3 else None,
+                class_code_section=section if index < 3 else None,
+            )
+            for index, user in enumerate(ListQueryCountTests.make_users(5, is_student=True))
+        ]
+        cls.admin = CustomUser.objects.create(username="rollup-admin", is_principal=True)
+
+    def setUp(self):
+        clear_cache()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        record_daily_attendance(
+            [{'student': student.id, 'status': index % 2 == 0} for index, student in enumerate(self.students)],
+            self.date, None,
+        )
+
+    def test_summary_counts_students_without_a_class(self):
+        data = self.client.get(f'/api/attendance-summary/{self.date}/').json()
+        self.assertEqual((data['total_present'], data['total_absent']), (3, 2))
+        self.assertEqual(data['class_wise_attendance'], {"Rollup": {"total": 3, "present": 2, "absent": 1}})
+
+    def test_trend(self):
+        trend = self.client.get(f'/api/attendance-trend/?start={self.date}&end={self.date}').json()['trend']
+        self.assertEqual([(row['present'], row['absent']) for row in trend], [(3, 2)])
+        trend = self.client.get(
+            f'/api/attendance-trend/?start={self.date}&end={self.date}&class_id={self.school_class.id}'
+        ).json()['trend']
+        self.assertEqual([(row['present'], row['absent']) for row in trend], [(2, 1)])
+
+    def test_trend_rejects_non_integer_ids(self):
+        for query in ('class_id=x', 'section_id=1.5'):
+            self.assertEqual(self.client.get(f'/api/attendance-trend/?{query}').status_code, 400)
+
+    def summary(self):
+        data = self.client.get(f'/api/attendance-summary/{self.date}/').json()
+        return (data['total_present'], data['total_absent']), data['class_wise_attendance']
+
+    def test_deletes_are_recounted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[0].delete()
+        self.assertEqual(self.summary(), ((2, 2), {"Rollup": {"total": 2, "present": 1, "absent": 1}}))
+        with self.captureOnCommitCallbacks(execute=True):
+            DailyAttendance.objects.filter(student=self.students[3]).delete()
+        self.assertEqual(self.summary(), ((2, 1), {"Rollup": {"total": 2, "present": 1, "absent": 1}}))
+
+    def test_section_and_class_deletes_are_recounted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Section.objects.filter(school_class=self.school_class).delete()
+        self.assertEqual(self.summary(), ((3, 2), {"Rollup": {"total": 3, "present": 2, "absent": 1}}))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.school_class.delete()
+        self.assertEqual(self.summary(), ((3, 2), {}))
+
+    def test_rebuild_command_keeps_the_rows_without_a_class(self):
+        call_command('rebuild_attendance_rollup', stdout=io.StringIO())
+        self.assertEqual(
+            AttendanceDailyRollup.objects.filter(date=self.date, school_class=None).values_list('present', 'absent').get(),
+            (1, 1),
+        )
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CACHES=LOCAL_CACHES, THROTTLE_BUCKETS={}, BULK_JOBS_IN_BACKGROUND=False)
+class BulkProfileTests(TestCase):
+    """The bulk deactivate, archive and delete of myapp.bulk, and the jobs running them"""
+
+    password = "pass12345"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [
+            Subject.objects.create(subject_code=f"K{index}", subject_name=f"Subject {index}") for index in range(3)
+        ]
+        cls.school_class = Class.objects.create(class_code="K1", class_name="Bulk")
+        cls.school_class.subjects.set(cls.subjects)
+        cls.school_class.optional_subjects.set(cls.subjects[2:])
+        section = Section.objects.create(school_class=cls.school_class, section_name="A")
+
+        users = ListQueryCountTests.make_users(5, is_student=True)
+        for user in users:
+            user.set_password(cls.password)
+            user.save()
+        cls.students = [
+            Student.objects.create(
+                user=user, phone=f"93{user.id:08d}", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                gender="male", parents="Parent", class_code=cls.school_class, class_code_section=section,
+                roll_no=str(index),
+            )
+            for index, user in enumerate(users)
+        ]
+        cls.students[0].optional_subjects.set(cls.subjects[2:])
+
+        teacher_user = ListQueryCountTests.make_users(1, is_teacher=True)[0]
+        cls.teacher = Teacher.objects.create(
+            user=teacher_user, phone=f"92{teacher_user.id:08d}", address="Address",
+            date_of_joining=datetime.date(2020, 1, 1), gender="female", class_teacher=cls.school_class,
+        )
+        cls.teacher.subjects.set(cls.subjects[:2])
+        cls.teacher.classes.set([cls.school_class])
+        cls.teacher.classes_section.set([section])
+
+        # Rows on every side of the users, some linking a student to the teacher
+        syllabus = Syllabus.objects.create(class_assigned=cls.school_class, subject=cls.subjects[0], teacher=cls.teacher)
+        Topic.objects.create(chapter=Chapter.objects.create(syllabus=syllabus, name="Chapter"), name="Topic")
+        assignment = Assignment.objects.create(
+            subject=cls.subjects[0], class_assigned=cls.school_class, teacher=cls.teacher, assignment_name="Homework",
+        )
+        exam_detail = ExamDetail.objects.create(
+            exam=Exam.objects.create(name="Bulk"), subject=cls.subjects[0], class_assigned=cls.school_class,
+            full_marks=100, pass_marks=40, exam_date=datetime.date(2024, 5, 1), created_by=teacher_user,
+        )
+        for student in cls.students[:2]:
+            bill = StudentBill.objects.create(
+                student=student, month="Baisakh", bill_number=f"K{student.id}", subtotal=Decimal('100'),
+                total_amount=Decimal('100'),
+            )
+            payment = StudentPayment.objects.create(
+                student=student, payment_number=f"K{student.id}", amount_paid=Decimal('50'), created_by=teacher_user,
+            )
+            StudentTransaction.objects.create(student=student, transaction_type='bill', bill=bill, balance=Decimal('100'))
+            StudentTransaction.objects.create(student=student, transaction_type='payment', payment=payment, balance=Decimal('50'))
+            StudentResult.objects.create(student=student, exam_detail=exam_detail, created_by=teacher_user)
+            DailyAttendance.objects.create(student=student, date=datetime.date(2024, 5, 1), status=True,
+                                           recorded_by=cls.teacher)
+            AssignmentSubmission.objects.create(assignment=assignment, student=student.user, written_submission="Done")
+            Message.objects.create(sender=student.user, receiver=teacher_user, message="Hello")
+            Task.objects.create(user=student.user, title="Task", due_date=datetime.date(2024, 5, 1))
+            post = DiscussionPost.objects.create(topic="Topic", content="Content", created_by=teacher_user)
+            comment = DiscussionComment.objects.create(post=post, content="Question", created_by=student.user)
+            DiscussionComment.objects.create(post=post, parent=comment, content="Answer", created_by=teacher_user)
+
+    def setUp(self):
+        clear_cache()
+
+    def deleted_rows(self, delete):
+        """The rows `delete()` deletes per model label, rolled back afterwards"""
+        with transaction.atomic():
+            counts = delete()
+            transaction.set_rollback(True)
+        return {label: count for label, count in counts.items() if count}
+
+    def assertDeletesLikeTheORM(self, model, profiles):
+        profile_ids = [profile.id for profile in profiles]
+        user_ids = [profile.user_id for profile in profiles]
+        expected = self.deleted_rows(lambda: CustomUser.objects.filter(id__in=user_ids).delete()[1])
+        counts = Counter()
+        self.assertEqual(self.deleted_rows(lambda: delete_profiles(model, profile_ids, counts) or counts), expected)
+        self.assertGreater(len(expected), 5)
+
+    def test_delete_students_like_the_orm(self):
+        self.assertDeletesLikeTheORM(Student, self.students[:2])
+
+    def test_delete_teacher_like_the_orm(self):
+        self.assertDeletesLikeTheORM(Teacher, [self.teacher])
+
+    def test_delete_students_recounts_attendance(self):
+        date = datetime.date(2024, 6, 1)
+        record_daily_attendance([{'student': student.id, 'status': True} for student in self.students], date, None)
+        delete_profiles(Student, [student.id for student in self.students[:2]], Counter())
+        rollup = AttendanceDailyRollup.objects.filter(date=date).aggregate(present=Sum('present'), total=Sum('total'))
+        self.assertEqual(rollup, {'present': 3, 'total': 3})
+
+    def login(self, user):
+        return APIClient().post('/api/login/', {'username': user.username, 'password': self.password}, format='json')
+
+    def test_deactivate_refuses_login(self):
+        student = self.students[0]
+        self.assertEqual(self.login(student.user).status_code, 200)
+        deactivate_profiles(Student, [student.id])
+        self.assertEqual(self.login(student.user).status_code, 401)
+        self.assertTrue(StudentEnrolment.objects.filter(student=student).exists())  # Records kept
+
+    def test_archive_students_rebuilds_enrolments(self):
+        archived = self.students[:2]
+        deactivate_profiles(Student, [student.id for student in archived], archive=True)
+        self.assertFalse(StudentEnrolment.objects.filter(student__in=archived).exists())
+        self.assertEqual(StudentEnrolment.objects.filter(student=self.students[2]).count(), 2)
+        self.assertEqual(
+            set(StudentEnrolment.objects.values_list('student_id', 'subject_id', 'school_class_id', 'is_optional')),
+            {(row.student_id, row.subject_id, row.school_class_id, row.is_optional) for row in StudentEnrolment.rows_for()},
+        )
+
+    def test_archive_teacher_rebuilds_teaching(self):
+        self.assertTrue(teaching_scope(self.teacher).teaches(self.school_class.id, self.subjects[0].id))
+        with self.captureOnCommitCallbacks(execute=True):
+            deactivate_profiles(Teacher, [self.teacher.id], archive=True)
+        self.assertFalse(TeachingAssignment.objects.filter(teacher=self.teacher).exists())
+        self.assertFalse(teaching_scope(self.teacher).teaches(self.school_class.id, self.subjects[0].id))
+
+    def make_job(self, action):
+        profile_ids = [student.id for student in self.students]
+        return BulkJob.objects.create(kind='students', action=action, profile_ids=profile_ids, total=len(profile_ids))
+
+    @override_settings(BULK_JOB_BATCH_SIZE=2)
+    def test_job_progress(self):
+        job = self.make_job('deactivate')
+        run_bulk_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('done', 5))
+        self.assertFalse(CustomUser.objects.filter(student__in=self.students, is_active=True).exists())
+
+    @override_settings(BULK_JOB_BATCH_SIZE=2)
+    def test_job_resumes_after_a_failed_batch(self):
+        job = self.make_job('delete')
+        batches = []
+
+        def fail_second_batch(model, profile_ids, counts):
+            batches.append(profile_ids)
+            if len(batches) == 2:
+                raise RuntimeError("Database went away")
+            return delete_profiles(model, profile_ids, counts)
+
+        with mock.patch('myapp.bulk.delete_profiles', fail_second_batch), self.assertLogs('myapp.bulk', 'ERROR'):
+            run_bulk_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.error), ('failed', 2, "Database went away"))
+        self.assertEqual(Student.objects.filter(id__in=job.profile_ids).count(), 3)  # The failed batch rolled back
+
+        BulkJob.objects.filter(pk=job.id).update(status='pending')
+        run_bulk_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('done', 5))
+        self.assertFalse(Student.objects.filter(id__in=job.profile_ids).exists())
+        self.assertEqual(job.deleted['myapp.Student'], 5)
+        self.assertEqual(job.deleted['myapp.StudentBill'], 2)
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CACHES=LOCAL_CACHES, THROTTLE_BUCKETS={})
+class TokenRevocationTests(TestCase):
+    """Tokens revoked on logout are refused, by this worker and by the others"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="revoke-principal", is_principal=True)
+        cls.user.set_password("pass12345")
+        cls.user.save()
+        Principal.objects.create(user=cls.user, phone="9100000001", address="Address", gender="male")
+
+    def setUp(self):
+        clear_cache()
+        revocation_list.reset()
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/login/', {'username': self.user.username, 'password': "pass12345"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def me(self, access):
+        return self.client.get('/api/me/', HTTP_AUTHORIZATION=f"Bearer {access}").status_code
+
+    def refresh(self, refresh):
+        return self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json').status_code
+
+    def test_logout_revokes_both_tokens(self):
+        tokens, other_session = self.login(), self.login()
+        self.assertEqual(self.me(tokens['access']), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/logout/', {'refresh': tokens['refresh']}, format='json',
+                                        HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.me(tokens['access']), 401)
+        self.assertEqual(self.refresh(tokens['refresh']), 401)
+        revocation_list.reset()  # A worker starting afresh loads them from the table
+        self.assertEqual(self.me(tokens['access']), 401)
+        self.assertEqual(self.refresh(tokens['refresh']), 401)
+
+        self.assertEqual(self.me(other_session['access']), 200)
+        self.assertEqual(self.refresh(other_session['refresh']), 200)
+
+    @override_settings(TOKEN_REVOCATION_CHECK_INTERVAL=0)
+    def test_revoked_while_the_stamp_was_evicted(self):
+        tokens = self.login()
+        self.assertEqual(self.me(tokens['access']), 200)
+        with self.captureOnCommitCallbacks(execute=False):  # Revoked by another worker...
+            self.client.post('/api/logout/', {'refresh': tokens['refresh']}, format='json',
+                             HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        cache.delete(RevocationList.stamp_key)  # ...whose new stamp was then evicted
+        self.assertEqual(self.me(tokens['access']), 401)
+
+    def test_rotated_refresh_token_is_revoked(self):
+        tokens = self.login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.refresh(tokens['refresh']), 200)
+        self.assertEqual(self.refresh(tokens['refresh']), 401)
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CACHES=LOCAL_CACHES, TYPEAHEAD_CHECK_INTERVAL=3600)
+class StudentTypeaheadTests(TestCase):
+    """This worker's typeahead index follows saves and deletes without a rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(class_code="T1", class_name="Typeahead")
+        cls.students = [
+            Student.objects.create(
+                user=user, phone=f"90{user.id:08d}", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                gender="male", parents="Parent", class_code=cls.school_class,
+            )
+            for user in ListQueryCountTests.make_users(2, is_student=True)
+        ]
+
+    def setUp(self):
+        clear_cache()
+        student_index.rebuild()
+
+    def found(self, query):
+        return [result['id'] for result in student_index.search(query)]
+
+    def test_user_rename(self):
+        user = self.students[0].user
+        user.first_name = "Zebedee"
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.found("zebe"), [self.students[0].id])
+
+    def test_student_save(self):
+        student = self.students[1]
+        student.phone = "9812345678"
+        student.class_code = None
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+        self.assertEqual(self.found("98123"), [student.id])
+        self.assertEqual(self.found("typeahead"), [self.students[0].id])
+
+    def test_new_student(self):
+        user = ListQueryCountTests.make_users(1, is_student=True)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(
+                user=user, phone="9700000123", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                gender="male", parents="Parent",
+            )
+        self.assertEqual(self.found("9700000123"), [student.id])
+
+    @override_settings(TYPEAHEAD_CHECK_INTERVAL=0)
+    def test_own_changes_need_no_rebuild(self):
+        student = self.students[0]
+        student.roll_no = "4242"
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+        with mock.patch.object(student_index, 'rebuild', wraps=student_index.rebuild) as rebuild:
+            self.assertEqual(self.found("4242"), [student.id])
+            rebuild.assert_not_called()
+
+            Student.objects.filter(pk=student.pk).update(roll_no="4343")  # Changed in another worker
+            student_index._bump_stamp()
+            self.assertEqual(self.found("4343"), [student.id])
+            cache.delete(student_index.stamp_key)  # Evicted
+            self.found("4343")
+            self.assertEqual(rebuild.call_count, 2)
+
+    def test_delete_and_deactivate(self):
+        deleted, deactivated = self.students
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        deactivated.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            deactivated.user.save()
+        self.assertEqual(self.found("typeahead"), [])
+
+
+@override_settings(ALLOWED_HOSTS=['*'], CACHES=LOCAL_CACHES)
+class TeachingAssignmentSyncTests(TestCase):
+    """TeachingAssignment follows every change of the many-to-manys it is derived from, from either side"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [
+            Subject.objects.create(subject_code=f"M{index}", subject_name=f"Subject {index}") for index in range(3)
+        ]
+        cls.classes = [Class.objects.create(class_code=f"M{index}", class_name=f"Matrix {index}") for index in range(2)]
+        for school_class in cls.classes:
+            school_class.subjects.set(cls.subjects[:2])
+        cls.sections = [Section.objects.create(school_class=cls.classes[0], section_name=name) for name in "AB"]
+        cls.teachers = [
+            Teacher.objects.create(
+                user=user, phone=f"91{user.id:08d}", address="Address", date_of_joining=datetime.date(2020, 1, 1),
+                gender="female",
+            )
+            for user in ListQueryCountTests.make_users(2, is_teacher=True)
+        ]
+        for teacher in cls.teachers:
+            teacher.subjects.set(cls.subjects)
+            teacher.classes.set(cls.classes)
+
+    def setUp(self):
+        clear_cache()
+
+    def assertInSync(self, step):
+        fields = ('teacher_id', 'school_class_id', 'section_id', 'subject_id')
+        expected = {tuple(getattr(row, field) for field in fields) for row in TeachingAssignment.rows_for()}
+        self.assertEqual(set(TeachingAssignment.objects.values_list(*fields)), expected, step)
+
+    def run_steps(self, steps):
+        self.assertInSync("initial")
+        for step, change in steps:
+            change()
+            self.assertInSync(step)
+
+    def test_from_the_teacher_side(self):
+        teacher = self.teachers[0]
+        self.run_steps([
+            ("add section", lambda: teacher.classes_section.add(self.sections[0])),
+            ("remove subject", lambda: teacher.subjects.remove(self.subjects[0])),
+            ("remove class", lambda: teacher.classes.remove(self.classes[1])),
+            ("clear sections", lambda: teacher.classes_section.clear()),
+            ("clear subjects", lambda: teacher.subjects.clear()),
+            ("add subjects", lambda: teacher.subjects.add(*self.subjects)),
+            ("clear classes", lambda: teacher.classes.clear()),
+        ])
+        self.assertFalse(TeachingAssignment.objects.filter(teacher=teacher).exists())
+
+    def test_from_the_other_side(self):
+        subject, school_class, section = self.subjects[1], self.classes[0], self.sections[1]
+        self.run_steps([
+            ("section add", lambda: section.teacher_sections.add(*self.teachers)),
+            ("subject remove", lambda: subject.teachers.remove(self.teachers[0])),
+            ("class remove", lambda: school_class.teachers.remove(self.teachers[1])),
+            ("section clear", lambda: section.teacher_sections.clear()),
+            ("subject clear", lambda: subject.teachers.clear()),
+            ("subject add", lambda: subject.teachers.add(self.teachers[0])),
+            ("class clear", lambda: school_class.teachers.clear()),
+            ("class add", lambda: school_class.teachers.add(*self.teachers)),
+        ])
+        self.assertTrue(TeachingAssignment.objects.filter(school_class=school_class, subject=subject).exists())
+
+    def test_class_subjects_and_sections(self):
+        school_class, subject = self.classes[0], self.subjects[2]
+        self.teachers[0].classes_section.add(*self.sections)
+        self.run_steps([
+            ("class subject add", lambda: school_class.subjects.add(subject)),
+            ("class subject remove", lambda: school_class.subjects.remove(self.subjects[0])),
+            ("subject classes add", lambda: self.subjects[0].classes.add(*self.classes)),
+            ("subject classes remove", lambda: subject.classes.remove(school_class)),
+            ("subject classes clear", lambda: self.subjects[1].classes.clear()),
+            ("class subjects clear", lambda: school_class.subjects.clear()),
+            ("class subjects set", lambda: school_class.subjects.set(self.subjects)),
+            ("section delete", lambda: self.sections[0].delete()),
+        ])
+        self.assertEqual(  # Left with one section of the class
+            set(TeachingAssignment.objects.filter(teacher=self.teachers[0], school_class=school_class)
+                .values_list('section_id', flat=True)),
+            {self.sections[1].id},
+        )
+
+    def test_filter_subjects_of_a_teacher_outside_the_class(self):
+        teacher, school_class = self.teachers[0], self.classes[1]
+        teacher.classes.remove(school_class)
+        response = APIClient().get(f'/api/filter-subjects/?teacher={teacher.id}&class_assigned={school_class.class_name}')
+        self.assertEqual(
+            [subject['id'] for subject in response.json()['subjects']], [subject.id for subject in self.subjects[:2]]
+        )
+
+    def test_scope_follows_on_commit(self):
+        teacher, school_class, subject = self.teachers[0], self.classes[0], self.subjects[0]
+        self.assertTrue(teaching_scope(teacher).teaches(school_class.id, subject.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            subject.teachers.remove(teacher)
+        self.assertFalse(teaching_scope(teacher).teaches(school_class.id, subject.id))
+        self.assertFalse(teaching_scope(teacher).teaches(school_class.id, self.subjects[2].id))  # Not a class subject
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class StudentEnrolmentSyncTests(TestCase):
+    """StudentEnrolment follows every change of the many-to-manys and fields it is derived from, from either side"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [
+            Subject.objects.create(subject_code=f"E{index}", subject_name=f"Subject {index}") for index in range(4)
+        ]
+        cls.classes = [Class.objects.create(class_code=f"E{index}", class_name=f"Enrol {index}") for index in range(2)]
+        for school_class in cls.classes:
+            school_class.subjects.set(cls.subjects[:3])
+            school_class.optional_subjects.set(cls.subjects[2:3])
+        cls.section = Section.objects.create(school_class=cls.classes[0], section_name="A")
+        cls.students = [
+            Student.objects.create(
+                user=user, phone=f"89{user.id:08d}", address="Address", date_of_birth=datetime.date(2010, 1, 1),
+                gender="male", parents="Parent", class_code=cls.classes[0], class_code_section=cls.section,
+            )
+            for user in ListQueryCountTests.make_users(3, is_student=True)
+        ]
+        for student in cls.students[:2]:
+            student.optional_subjects.set(cls.subjects[2:])
+
+    def assertInSync(self, step):
+        fields = ('student_id', 'subject_id', 'school_class_id', 'section_id', 'is_optional')
+        expected = {tuple(getattr(row, field) for field in fields) for row in StudentEnrolment.rows_for()}
+        self.assertEqual(set(StudentEnrolment.objects.values_list(*fields)), expected, step)
+
+    def run_steps(self, steps):
+        self.assertInSync("initial")
+        for step, change in steps:
+            change()
+            self.assertInSync(step)
+
+    def test_optional_subjects_from_both_sides(self):
+        student, subject = self.students[0], self.subjects[3]
+        self.run_steps([
+            ("student remove", lambda: student.optional_subjects.remove(subject)),
+            ("student add", lambda: student.optional_subjects.add(subject)),
+            ("student clear", lambda: student.optional_subjects.clear()),
+            ("subject add", lambda: subject.student_set.add(*self.students)),
+            ("subject remove", lambda: subject.student_set.remove(self.students[1])),
+            ("subject clear", lambda: subject.student_set.clear()),
+        ])
+        self.assertFalse(StudentEnrolment.objects.filter(subject=subject).exists())
+
+    def test_class_subjects_from_both_sides(self):
+        school_class, subject = self.classes[0], self.subjects[3]
+        self.run_steps([
+            ("class subject add", lambda: school_class.subjects.add(subject)),
+            ("class optional add", lambda: school_class.optional_subjects.add(subject)),
+            ("class optional clear", lambda: school_class.optional_subjects.clear()),
+            ("class subject remove", lambda: school_class.subjects.remove(self.subjects[0])),
+            ("subject optional classes add", lambda: self.subjects[1].optional_classes.add(*self.classes)),
+            ("subject optional classes clear", lambda: self.subjects[1].optional_classes.clear()),
+            ("subject classes remove", lambda: subject.classes.remove(school_class)),
+            ("subject classes clear", lambda: self.subjects[2].classes.clear()),
+            ("subject classes add", lambda: self.subjects[0].classes.add(school_class)),
+            ("class subjects clear", lambda: school_class.subjects.clear()),
+        ])
+
+    def test_class_and_section_changes(self):
+        student = self.students[2]
+
+        def move():
+            student.class_code, student.class_code_section = self.classes[1], None
+            student.save()
+
+        self.run_steps([
+            ("student moved", move),
+            ("section deleted", lambda: self.section.delete()),
+            ("class deleted", lambda: self.classes[0].delete()),
+        ])
+        self.assertEqual(StudentEnrolment.objects.filter(student=student, school_class=self.classes[1]).count(), 2)
+        self.assertEqual(  # Only their chosen subjects are left to the others
+            set(StudentEnrolment.objects.filter(student=self.students[0]).values_list('subject_id', 'school_class_id')),
+            {(self.subjects[2].id, None), (self.subjects[3].id, None)},
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHES, SETTINGS_REGISTRY_CHECK_INTERVAL=0)
+class SettingsRegistryTests(TestCase):
+    """Workers reload a setting whose version stamp moved, or went missing from the cache"""
+
+    def setUp(self):
+        clear_cache()
+
+    def test_reloads_after_a_save(self):
+        self.assertTrue(DateSetting.get_instance().is_ad)
+        with self.captureOnCommitCallbacks(execute=True):
+            DateSetting(is_ad=False).save()
+        self.assertFalse(DateSetting.get_instance().is_ad)
+
+    def test_reloads_when_the_stamp_is_gone(self):
+        self.assertTrue(DateSetting.get_instance().is_ad)
+        DateSetting.objects.update(is_ad=False)  # Saved by another worker, whose new stamp was then evicted
+        cache.delete(settings_registry._version_key("date_setting"))
+        self.assertFalse(DateSetting.get_instance().is_ad)
+        self.assertFalse(DateSetting.get_instance().is_ad)
@@ -0,0 +1,170 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import metrics_registry, register_counter
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+PRUNE_EVERY = 1000  # Roughly one call in this many also deletes long-idle buckets
+
+register_counter('throttle_requests_total', "Requests checked by a token-bucket throttle, by scope and result.")
+register_counter('throttle_rejections_total', "Requests rejected by a token-bucket throttle, by scope and the bucket key that ran out.")
+register_counter('throttle_errors_total', "Throttle checks that failed open because the bucket store was unavailable, by scope.")
+
+
+def parse_rate(rate):
+    """"10/min" -> tokens added per second"""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period.strip().lower()]
+
+
+class BucketStore:
+    """
+    Token buckets in a small SQLite database (THROTTLE_STORE), shared by every
+    worker process on the host. `take()` updates all the buckets of a request in
+    one write transaction, so concurrent workers never hand out the same token.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def path(self):
+        return str(getattr(settings, 'THROTTLE_STORE', settings.BASE_DIR / 'throttle.sqlite3'))
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.path != self.path:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.connection, self._local.path = connection, self.path
+        return connection
+
+    def take(self, buckets):
+        """
+        Take one token from every bucket of `buckets` [(key, rate per second,
+        capacity)], or from none of them if any is empty. Returns (None, 0) when
+        allowed, else (the key of the emptiest bucket, seconds until it has a token).
+        """
+        connection = self.connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            stored = {
+                key: (tokens, updated) for key, tokens, updated in connection.execute(
+                    f"SELECT key, tokens, updated FROM bucket WHERE key IN ({','.join('?' * len(buckets))})",
+                    [key for key, _, _ in buckets],
+                )
+            }
+            levels, wait, empty = [], 0.0, None
+            for key, rate, capacity in buckets:
+                tokens, updated = stored.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                levels.append((key, tokens))
+                if tokens < 1 and (1 - tokens) / rate > wait:
+                    wait, empty = (1 - tokens) / rate, key
+
+            spent = 0 if empty else 1
+            connection.executemany(
+                "INSERT INTO bucket (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(key, tokens - spent, now) for key, tokens in levels],
+            )
+            if random.randrange(PRUNE_EVERY) == 0:
+                # A bucket idle for a day is full again; dropping its row changes nothing
+                connection.execute("DELETE FROM bucket WHERE updated < ?", [now - 86400])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return empty, wait
+
+    def clear(self):
+        self.connection().execute("DELETE FROM bucket")
+
+
+bucket_store = BucketStore()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttling of the views that set `throttle_scope` (and, if
+    they set `throttle_methods`, only those methods).
+
+    THROTTLE_BUCKETS maps a scope to its buckets; a request takes a token from
+    each and is refused with 429 and Retry-After when any is empty. A bucket
+    holds `burst` tokens (default: the rate's count) refilled at `rate`
+    ("10/min"), and is kept per `key`:
+
+    - "ip": client address (REMOTE_ADDR, or X-Forwarded-For behind NUM_PROXIES proxies)
+    - "user": authenticated user, or the address for anonymous requests
+    - "username": the username posted (login), or the address without one
+    - "scope": one bucket for the whole endpoint group
+
+    Bucket state lives in the host-wide BucketStore. Checks and rejections are
+    counted in the request metrics (api/metrics/).
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def bucket_key(self, kind, scope, request):
+        if kind == 'scope':
+            return f"{scope}:scope"
+        if kind == 'user' and request.user and request.user.is_authenticated:
+            return f"{scope}:user:{request.user.pk}"
+        if kind == 'username':
+            username = request.data.get('username') if hasattr(request.data, 'get') else None
+            if username:
+                return f"{scope}:username:{str(username).lower()[:150]}"
+        return f"{scope}:ip:{self.client_address(request)}"
+
+    def client_address(self, request):
+        # get_ident() trusts X-Forwarded-For only as far as NUM_PROXIES says; with it unset it takes
+        # the header as is, and a client could then dodge its buckets (or drain the scope one) at will
+        if api_settings.NUM_PROXIES is None:
+            return request.META.get('REMOTE_ADDR')
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        methods = getattr(view, 'throttle_methods', None)
+        config = getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope)
+        if not config or (methods and request.method not in methods):
+            return True
+
+        buckets = []
+        for bucket in config:
+            rate = parse_rate(bucket['rate'])
+            capacity = bucket.get('burst', int(bucket['rate'].split('/')[0]))
+            buckets.append((self.bucket_key(bucket.get('key', 'ip'), scope, request), rate, capacity))
+
+        try:
+            empty, wait = bucket_store.take(buckets)
+        except sqlite3.Error:
+            # Never lock everyone out because the store is busy or broken
+            logger.exception("Token-bucket store unavailable, not throttling %s", scope)
+            metrics_registry.increment('throttle_errors_total', {'scope': scope})
+            return True
+
+        metrics_registry.increment('throttle_requests_total', {'scope': scope, 'result': 'rejected' if empty else 'allowed'})
+        if empty is None:
+            return True
+        metrics_registry.increment('throttle_rejections_total', {'scope': scope, 'key': empty.split(':')[1]})
+        self.wait_seconds = wait
+        return False
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,229 @@
+import heapq
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Class, CustomUser, Section, Student
+
+TYPEAHEAD_MAX_RESULTS = 50
+TOKEN = re.compile(r'[0-9a-z]+')
+FIELDS = (
+    'id', 'user__first_name', 'user__last_name', 'user__username', 'phone', 'parents', 'roll_no',
+    'class_code_id', 'class_code__class_code', 'class_code__class_name', 'class_code_section__section_name',
+)
+
+
+def tokenize(text):
+    return TOKEN.findall(str(text or '').lower())
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = set()  # Students with a token starting with this node's prefix
+
+
+class StudentIndex:
+    """
+    Per-worker prefix trie over active students for the fee desk typeahead:
+    name tokens, username, phone, parents' phone, roll number, class and section.
+
+    Built from one query on first use. Saves and deletes of students and users
+    update this worker's trie right away (signals below) and bump a version
+    stamp in the shared cache; every other worker rebuilds its trie when it sees
+    the stamp moved (checked at most once per TYPEAHEAD_CHECK_INTERVAL seconds).
+    """
+
+    stamp_key = "typeahead:students:version"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.root = None
+        self.docs = {}  # student id -> result dict
+        self.tokens = {}  # student id -> its tokens
+        self.stamp = None
+        self.checked_at = 0.0
+
+    @property
+    def check_interval(self):
+        return getattr(settings, 'TYPEAHEAD_CHECK_INTERVAL', 5.0)
+
+    @staticmethod
+    def document(row):
+        name = f"{row['user__first_name']} {row['user__last_name']}".strip()
+        doc = {
+            'id': row['id'],
+            'name': name,
+            'username': row['user__username'],
+            'phone': row['phone'],
+            'parents': row['parents'],
+            'roll_no': row['roll_no'],
+            'class': {
+                'id': row['class_code_id'],
+                'class_code': row['class_code__class_code'],
+                'class_name': row['class_code__class_name'],
+            } if row['class_code_id'] else None,
+            'section': row['class_code_section__section_name'],
+        }
+        tokens = set(tokenize(name)) | set(tokenize(row['user__username'])) | set(tokenize(row['roll_no']))
+        tokens |= set(tokenize(row['class_code__class_code'])) | set(tokenize(row['class_code__class_name']))
+        tokens |= set(tokenize(row['class_code_section__section_name']))
+        for phone in (row['phone'], row['parents']):
+            tokens |= set(tokenize(phone))
+            tokens.add(re.sub(r'\D', '', phone or ''))  # "98-1234 567" is found as 981234567 too
+        tokens.discard('')
+        return doc, (0 if name else 1, name.lower(), row['id']), frozenset(tokens)
+
+    def _insert(self, student_id, tokens):
+        for token in tokens:
+            node = self.root
+            for char in token:
+                node = node.children.setdefault(char, TrieNode())
+                node.ids.add(student_id)
+
+    def _remove(self, student_id):
+        for token in self.tokens.pop(student_id, ()):
+            path, node = [], self.root
+            for char in token:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                path.append((node, char, child))
+                child.ids.discard(student_id)
+                node = child
+            for parent, char, child in reversed(path):
+                if child.ids or child.children:
+                    break
+                del parent.children[char]
+        self.docs.pop(student_id, None)
+
+    def _add(self, row):
+        doc, sort_key, tokens = self.document(row)
+        self.docs[row['id']] = (sort_key, doc)
+        self.tokens[row['id']] = tokens
+        self._insert(row['id'], tokens)
+
+    def rebuild(self):
+        stamp = self._stamp()  # before loading, so a concurrent change always shows as a newer stamp
+        rows = list(Student.objects.filter(user__is_active=True).values(*FIELDS))
+        with self._lock:
+            self.root, self.docs, self.tokens = TrieNode(), {}, {}
+            for row in rows:
+                self._add(row)
+            self.stamp, self.checked_at = stamp, time.monotonic()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self.root is not None and now - self.checked_at < self.check_interval:
+            return
+        if self.root is None or self._stamp() != self.stamp:
+            self.rebuild()
+        else:
+            self.checked_at = now
+
+    def search(self, query, limit=10, class_id=None):
+        """The `limit` best students matching every term of `query` as a token prefix"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            sets = []
+            for term in set(terms):
+                node = self.root
+                for char in term:
+                    node = node.children.get(char)
+                    if node is None:
+                        return []
+                sets.append(node.ids)
+            sets.sort(key=len)
+            candidates = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+            if class_id is not None:
+                candidates = [sid for sid in candidates if (self.docs[sid][1]['class'] or {}).get('id') == class_id]
+
+            # Students with a token equal to a whole term come first, then by name
+            def rank(student_id):
+                return (not any(term in self.tokens[student_id] for term in terms), self.docs[student_id][0])
+
+            return [self.docs[student_id][1] for student_id in heapq.nsmallest(limit, candidates, key=rank)]
+
+    def students_changed(self, student_ids=(), user_ids=()):
+        """Re-read these students into this worker's trie and make the other workers rebuild theirs"""
+        if self.root is not None:
+            if not student_ids:
+                student_ids = list(Student.objects.filter(user_id__in=user_ids).values_list('id', flat=True))
+            rows = list(Student.objects.filter(id__in=student_ids, user__is_active=True).values(*FIELDS))
+            with self._lock:
+                for student_id in student_ids:
+                    self._remove(student_id)
+                for row in rows:
+                    self._add(row)
+        self._bump_stamp(applied=True)
+
+    def student_deleted(self, student_id):
+        if self.root is not None:
+            with self._lock:
+                self._remove(student_id)
+        self._bump_stamp(applied=True)
+
+    def invalidate(self):
+        """Make every worker, this one included, rebuild its trie (after bulk changes that send no signals)"""
+        self._bump_stamp()
+        self.checked_at = 0.0
+
+    def _stamp(self):
+        # A stamp gone from the cache (evicted) starts over as a new one, so it never reads as unchanged
+        stamp = cache.get(self.stamp_key)
+        if stamp is None:
+            cache.add(self.stamp_key, time.time_ns(), timeout=None)
+            stamp = cache.get(self.stamp_key)
+        return stamp
+
+    def _bump_stamp(self, applied=False):
+        """
+        New stamp for the other workers. With `applied`, the change is already in
+        this worker's trie: if it was current, it keeps the new stamp as its own
+        rather than rebuilding for its own change.
+        """
+        stamp = time.time_ns()
+        with self._lock:
+            current = applied and self.root is not None and cache.get(self.stamp_key) == self.stamp
+            cache.set(self.stamp_key, stamp, timeout=None)
+            if current:
+                self.stamp = stamp
+
+
+student_index = StudentIndex()
+
+
+@receiver(post_save, sender=Student)
+def typeahead_student_saved(sender, instance, **kwargs):
+    student_id = instance.pk
+    transaction.on_commit(lambda: student_index.students_changed(student_ids=[student_id]))
+
+
+@receiver(post_delete, sender=Student)
+def typeahead_student_deleted(sender, instance, **kwargs):
+    student_id = instance.pk  # The deletion sets instance.pk to None before the commit
+    transaction.on_commit(lambda: student_index.student_deleted(student_id))
+
+
+@receiver(post_save, sender=CustomUser)
+def typeahead_user_saved(sender, instance, **kwargs):
+    if instance.is_student or hasattr(instance, 'student'):
+        user_id = instance.pk
+        transaction.on_commit(lambda: student_index.students_changed(user_ids=[user_id]))
+
+
+@receiver([post_save, post_delete], sender=Class)
+@receiver([post_save, post_delete], sender=Section)
+def typeahead_class_changed(sender, **kwargs):
+    transaction.on_commit(student_index.invalidate)
@@ -27,6 +27,7 @@ urlpatterns = [
     # path('dashboard/', admin.site.urls),  # URL for the Django admin dashboard
     path('api/login/', LoginAPIView.as_view(), name='api-login'),
     path('api/logout/', LogoutAPIView.as_view(), name='api-logout'),
+    path('api/me/', MeAPIView.as_view(), name='api-me'),  # Cached login profile, revalidate with If-None-Match
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
     # API endpoint for posts
@@ -39,6 +40,9 @@ urlpatterns = [
     path('api/register/principal/', RegisterPrincipalView.as_view(), name='register-principal'),  # URL for principal registration API
     path('api/register/student/', RegisterStudentView.as_view(), name='register-student'),  # URL for student registration API
     path('api/register/accountant/', RegisterAccountantView.as_view(), name='register_accountant'), # URL for accountant registration API
+    path('api/import/<str:kind>/', ImportPeopleAPIView.as_view(), name='import-people'),  # Bulk register "students" or "teachers" from a .csv/.xlsx file
+    path('api/bulk/<str:kind>/', BulkProfileJobAPIView.as_view(), name='bulk-profile-job'),  # Deactivate/archive/delete many "students", "teachers", "accountants" or "drivers" in the background
+    path('api/bulk-jobs/<int:pk>/', BulkJobAPIView.as_view(), name='bulk-job'),  # Progress of a bulk job
     
     # API endpoints for user lists
     path('api/teachers/', TeacherListView.as_view(), name='teacher-list'),  # Endpoint for listing teachers
@@ -138,12 +142,14 @@ urlpatterns = [
 
     # API endpoints for student results
     path('api/results/', StudentResultAPIView.as_view(), name='student-result-list-create'),  # Endpoint to list all student results and create new results.
+    path('api/results/bulk/<int:exam_detail_id>/', BulkStudentResultAPIView.as_view(), name='bulk-student-results'),  # Endpoint to enter the marks of a whole class for one exam detail (`exam_detail_id`) at once.
     path('api/results/<int:result_id>/', SingleStudentResultAPIView.as_view(), name='single-student-result'),  # Endpoint to retrieve, update, or delete a specific student result by its ID (`result_id`).
     path('api/results/<int:exam_id>/<int:subject_id>/', SubjectWiseExamResultsView.as_view(), name='subject-wise-exam-results'),  # Endpoint to retrieve subject-wise exam results for a specific exam (`exam_id`) and subject (`subject_id`).
 
     path('api/marksheet/<int:student_id>/<int:exam_id>/', MarksheetView.as_view(), name='marksheet'),  # Endpoint to retrieve a student's marksheet for a specific exam (`exam_id`).
     path("api/students/update-roll-numbers/<int:class_id>/", BulkUpdateRollNumbersAPIView.as_view(), name="bulk_update_roll_numbers"),
     path('api/rankings/<int:exam_id>/<int:class_id>/', StudentRankingView.as_view(), name='student_rankings'),
+    path('api/rankings/<int:exam_id>/<int:class_id>/toppers/', SubjectToppersView.as_view(), name='subject_toppers'),  # Subject-wise toppers of a class (`?limit=` for top N)
 
     # Syllabus and related endpoints
     path('api/syllabus/', SyllabusView.as_view(), name='syllabus-list'),
@@ -162,6 +168,8 @@ urlpatterns = [
     path('api/attendance/', DailyAttendanceAPIView.as_view(), name='daily-attendance'),
     path('api/attendance/<int:classid>/<str:date>/', AttendanceByClassAPIView.as_view(), name='attendance-by-class'),
     path('api/attendance/student/<int:class_id>/', StudentsByClassAttendanceAPIView.as_view(), name='students-by-class'),
+    path('api/attendance/register/<int:class_id>/<int:year>/<int:month>/', MonthlyAttendanceRegisterAPIView.as_view(), name='attendance-register'),  # Monthly register from the bitmaps
+    path('api/attendance/yearly/<int:class_id>/<int:year>/', YearlyAttendanceAPIView.as_view(), name='attendance-yearly'),
     path('api/students/subject/<int:subject_id>/', SubjectWiseStudentListAPIView.as_view(), name='subject-wise-students'),
    
     # API endpoints for fees management 
@@ -172,6 +180,7 @@ urlpatterns = [
     path('api/transportation-fees/', TransportationFeeListCreateAPIView.as_view(), name='transportation-fee-list-create'),
     path('api/transportation-fees/<int:pk>/', TransportationFeeDetailAPIView.as_view(), name='transportation-fee-detail'),
     path("api/bills/<int:student_id>/", StudentBillAPIView.as_view(), name="bill-list"),
+    path("api/bills/generate/", GenerateMonthlyBillsAPIView.as_view(), name="bill-generate"),  # Bill a whole class (or school) for a month
     path("api/bills/detail/<str:bill_number>/", StudentBillDetailAPIView.as_view(), name="bill-detail"),
     path("api/payments/<int:student_id>/", StudentPaymentAPIView.as_view(), name="payment-list"),
     path("api/payments/detail/<str:payment_number>/", StudentPaymentDetailAPIView.as_view(), name="payment-detail"),
@@ -179,6 +188,7 @@ urlpatterns = [
 
     path('api/dashboard/', DashboardAPIView.as_view(), name='dashboard-api'),
     path('api/attendance-summary/<str:date>/', AttendanceSummaryAPIView.as_view(), name='attendance-summary'),
+    path('api/attendance-trend/', AttendanceTrendAPIView.as_view(), name='attendance-trend'),  # ?start=&end=&class_id=&section_id=
     path('api/syllabus-summary/<int:teacher_id>/', SyllabusSummaryAPIView.as_view(), name='assignment-syllabus'),
     path('api/fee-summary/', FeeDashboardAPIView.as_view(), name='fee-summary'),
     path('api/payments/search/', PaymentSearchAPIView.as_view(), name='payment-search'),
@@ -191,10 +201,14 @@ urlpatterns = [
     path('api/messages/role-based/', RoleBasedMessageListAPIView.as_view(), name='role-based-messages'),
 
     path('api/users/search/', UserSearchAPIView.as_view(), name='user-search'),
+    path('api/students/typeahead/', StudentTypeaheadAPIView.as_view(), name='student-typeahead'),  # Fee desk student lookup: ?q=<prefixes>&limit=&class_id=
     path('api/finance-summary/', FinanceSummaryAPIView.as_view(), name='finance-summary'),
 
     path('api/dashboard-stats/', dashboard_stats, name='dashboard-stats'),
 
+    path('api/metrics/', MetricsAPIView.as_view(), name='metrics'),  # Prometheus scrape endpoint (admin only)
+    path('api/metrics/slow-requests/', SlowRequestLogAPIView.as_view(), name='slow-requests'),  # Slow requests with their SQL (admin only)
+
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 
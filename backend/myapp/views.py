@@ -8,11 +8,21 @@ from .models import *
 from .serializers import * 
 from rest_framework.permissions import IsAuthenticated
 from .permissions import *
+from .profiles import get_profile, profile_etag, profile_version
+from .authentication import ClaimsRefreshToken
+from .revocation import RevocableAccessToken
+from .importer import ImportFileError, PeopleImport, read_rows
+from .bulk import PROFILE_MODELS, start_bulk_job
+from .typeahead import TYPEAHEAD_MAX_RESULTS, student_index
+from .teaching import teaching_scope
+import csv
+from .roles import has_role, resolve_roles
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+import calendar
 import json
 from django.db import transaction
 from django.utils.dateparse import parse_date
@@ -28,6 +38,17 @@ from rest_framework_simplejwt.tokens import RefreshToken
 # from rest_framework_simplejwt.views import TokenRefreshView
 from django.utils.decorators import method_decorator
 import nepali_datetime as ndt
+from . import bs_calendar
+from .attendance import (
+    attendance_summary, clear_monthly_attendance, month_register, percentage, record_daily_attendance,
+    refresh_attendance_rollup, update_class_attendance,
+)
+from .billing import generate_monthly_bills
+from .fast_serializers import (
+    FastClassAttendanceSerializer, FastStudentResultSerializer, FastStudentSerializer, FastStudentTransactionSerializer,
+)
+from .pagination import sparse_list_response
+from .results import recalculate_rankings, recompute_overall_results, subject_toppers
 from .serializers import FinanceSummarySerializer
 from rest_framework.pagination import PageNumberPagination
 
@@ -38,6 +59,8 @@ class CustomPagination(PageNumberPagination):
 
 @method_decorator(csrf_exempt, name='dispatch')
 class LoginAPIView(APIView):
+    throttle_scope = 'login'  # One PBKDF2 hash per attempt
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -48,118 +71,51 @@ class LoginAPIView(APIView):
             if user is None:
                 return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-            refresh = RefreshToken.for_user(user)
-            setting = DateSetting.get_instance()
-            is_ad = setting.is_ad  
-
-            role_data = {}
-
-            if hasattr(user, 'student'):
-                student = user.student
-                student_class = student.class_code
-
-                # Fetch class subjects
-                class_subjects = student_class.subjects.all() if student_class else []
-                
-                # Fetch optional subjects for the student
-                optional_subjects = student.optional_subjects.all()
-
-                # Combine class subjects and optional subjects
-                subjects = list(class_subjects) + list(optional_subjects)
-
-                # Format subjects data
-                subjects_data = [
-                    {'id': subject.id, 'subject_code': subject.subject_code, 'subject_name': subject.subject_name}
-                    for subject in subjects
-                ]
-
-                role_data = {
-                    'id': student.id,
-                    'role': 'student',
-                    'phone': student.phone,
-                    'address': student.address,
-                    'date_of_birth': student.date_of_birth.strftime('%Y-%m-%d'),
-                    'gender': student.gender,
-                    'parents': student.parents,
-                    'class': {
-                        'id': student_class.id if student_class else None,
-                        'class_code': student_class.class_code if student_class else None,
-                        'class_name': student_class.class_name if student_class else None,
-                    } if student_class else None,
-                    'subjects': subjects_data,  # Include both class subjects and optional subjects
-                }
-
-            elif hasattr(user, 'teacher'):
-                teacher = user.teacher
-                role_data = {
-                    'id': teacher.id,
-                    'role': 'teacher',
-                    'phone': teacher.phone,
-                    'address': teacher.address,
-                    'date_of_joining': teacher.date_of_joining.strftime('%Y-%m-%d'),
-                    'gender': teacher.gender,
-                    'subjects': [{'id': subject.id, 'subject_code': subject.subject_code, 'subject_name': subject.subject_name} for subject in teacher.subjects.all()],
-                    'classes': [{'id': cls.id, 'class_code': cls.class_code, 'class_name': cls.class_name} for cls in teacher.classes.all()],
-                    'class_teacher': {
-                        'id': teacher.class_teacher.id if teacher.class_teacher else None,
-                        'class_code': teacher.class_teacher.class_code if teacher.class_teacher else None,
-                        'class_name': teacher.class_teacher.class_name if teacher.class_teacher else None,
-                    } if teacher.class_teacher else None,
-                }
-
-            elif hasattr(user, 'principal'):
-                principal = user.principal
-                role_data = {
-                    'id': principal.id, 
-                    'role': 'principal',
-                    'phone': principal.phone,
-                    'address': principal.address,
-                    'gender': principal.gender,
-                }
-
-            elif hasattr(user, 'accountant'):
-                accountant = user.accountant
-                role_data = {
-                    'id': accountant.id, 
-                    'role': 'accountant',
-                    'phone': accountant.phone,
-                    'address': accountant.address,
-                    'gender': accountant.gender,
-                    'date_of_joining': accountant.date_of_joining.strftime('%Y-%m-%d'),
-                }
-
-            elif hasattr(user, 'driver'):
-                driver = user.driver
-                role_data = {
-                    'id': driver.id, 
-                    'role': 'driver',
-                    'phone': driver.phone,
-                    'address': driver.address,
-                    'gender': driver.gender,
-                    'date_of_joining': driver.date_of_joining.strftime('%Y-%m-%d'),
-                }
-
-            else:
+            # Role payload from the shared profile cache, built once per profile version
+            version, profile = get_profile(user)
+            if profile is None:
                 return Response({'error': 'User has no role assigned'}, status=status.HTTP_403_FORBIDDEN)
 
+            refresh = ClaimsRefreshToken.for_user(user)
+            is_ad = DateSetting.get_instance().is_ad
+
             response_data = {
-                'id': role_data.get('id'),
+                'id': profile['id'],
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
-                'role': 'master' if user.is_master else 'principal' if user.is_principal else 'teacher' if user.is_teacher else 'student' if user.is_student else 'accountant' if user.is_accountant else 'driver' if user.is_driver else None,
-                'username': username,
-                **role_data,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
+                **profile,
                 'is_ad': is_ad,
             }
 
-            return Response(response_data, status=status.HTTP_200_OK)
+            # Same ETag as /api/me, so the client can revalidate its copy from here on
+            return Response(response_data, status=status.HTTP_200_OK, headers={'ETag': profile_etag(version, is_ad)})
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MeAPIView(APIView):
+    """
+    The logged-in user's profile (the role payload of the login response, without
+    tokens), with an ETag: a client sending it back in If-None-Match gets a 304
+    until the profile changes.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        is_ad = DateSetting.get_instance().is_ad
+        version = profile_version(request.user.pk)
+        etag = profile_etag(version, is_ad)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        version, profile = get_profile(request.user, version)
+        if profile is None:
+            return Response({'error': 'User has no role assigned'}, status=status.HTTP_403_FORBIDDEN)
+        return Response({**profile, 'is_ad': is_ad}, headers=headers)
+
  
 
 # View for handling user logout
@@ -173,12 +129,16 @@ class LogoutAPIView(APIView):
         if serializer.is_valid():
             refresh_token = serializer.validated_data['refresh']
             try:
-                # Blacklist the refresh token
-                token = RefreshToken(refresh_token)
+                # Revoke the refresh token, on every worker
+                token = ClaimsRefreshToken(refresh_token)
                 token.blacklist()
             except Exception as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+            # The access token of this request goes with it (others expire on their own)
+            if isinstance(request.auth, RevocableAccessToken):
+                request.auth.blacklist()
+
             # Log the user out
             logout(request)
 
@@ -203,7 +163,7 @@ class PostListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         user = self.request.user
         # Only principals and teachers are allowed to create posts
-        if hasattr(user, 'principal') or hasattr(user, 'teacher'):
+        if has_role(self.request, 'principal') or has_role(self.request, 'teacher'):
             serializer.save(creator=user)
         else:
             raise PermissionDenied("You do not have permission to create posts.")
@@ -374,6 +334,90 @@ class RegisterStudentView(APIView):
             return Response(student_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class ImportPeopleAPIView(APIView):
+    """
+    Register students or teachers in bulk from an uploaded .csv/.xlsx `file`
+    (see myapp.importer for the columns). `dry_run=true` only validates;
+    `partial=true` imports the valid rows even if others have errors.
+    Answers with a per-row error report.
+    """
+    permission_classes = [IsAuthenticated, IsPrincipal | IsAdmin]
+    throttle_scope = 'import'
+
+    def post(self, request, kind):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload the spreadsheet as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        def flag(name):
+            return str(request.data.get(name, request.query_params.get(name, ''))).lower() in ('1', 'true', 'yes')
+
+        try:
+            report = PeopleImport(kind, dry_run=flag('dry_run'), partial=flag('partial')).run(
+                read_rows(upload, upload.name)
+            )
+        except ImportFileError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return Response({"error": f"Could not read the file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['errors'] and not report['created'] and not report['dry_run']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
+
+class BulkProfileJobAPIView(APIView):
+    """
+    Deactivate, archive or delete many students, teachers, accountants or
+    drivers at once, e.g. a graduating class. Takes `action` and either `ids`
+    (profile ids) or, for students, `class_id`; answers 202 with the BulkJob,
+    which runs in the background (see myapp.bulk). Poll api/bulk-jobs/<id>/.
+    """
+    permission_classes = [IsAuthenticated, IsPrincipal | IsAdmin]
+
+    def post(self, request, kind):
+        model = PROFILE_MODELS.get(kind)
+        if model is None:
+            return Response({"error": f"Unknown kind '{kind}'; use one of: {', '.join(PROFILE_MODELS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        action = request.data.get('action')
+        if action not in dict(BulkJob._meta.get_field('action').choices):
+            return Response({"error": "action must be 'deactivate', 'archive' or 'delete'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        profiles = model.objects.all()
+        ids, class_id = request.data.get('ids'), request.data.get('class_id')
+        try:
+            if ids is not None:
+                profiles = profiles.filter(id__in=[int(profile_id) for profile_id in ids])
+            elif class_id is not None and model is Student:
+                profiles = profiles.filter(class_code_id=int(class_id))
+            else:
+                return Response({"error": "Give the profile 'ids' (or a 'class_id' for students)."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({"error": "ids and class_id must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        profile_ids = sorted(profiles.values_list('id', flat=True))
+        if not profile_ids:
+            return Response({"error": f"No matching {kind}."}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            job = BulkJob.objects.create(
+                kind=kind, action=action, profile_ids=profile_ids, total=len(profile_ids), created_by=request.user
+            )
+            start_bulk_job(job.id)
+        return Response(BulkJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class BulkJobAPIView(APIView):
+    """Status and progress of a bulk job"""
+    permission_classes = [IsAuthenticated, IsPrincipal | IsAdmin]
+
+    def get(self, request, pk):
+        job = get_object_or_404(BulkJob, pk=pk)
+        return Response(BulkJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
 # View for handling staff registration
 @method_decorator(csrf_exempt, name='dispatch')
 class RegisterAccountantView(APIView):
@@ -423,22 +467,20 @@ class RegisterAccountantView(APIView):
 class TeacherListView(APIView):
     def get(self, request, format=None):
         teachers = Teacher.objects.all()  # Retrieve all teacher instances
-        serializer = GetTeacherSerializer(teachers, many=True)  # Serialize the teacher data
-        return Response(serializer.data, status=status.HTTP_200_OK)  # Return serialized data with 200 OK status
+        # Supports ?fields= and opt-in ?cursor=/?page_size= keyset pagination
+        return sparse_list_response(request, self, teachers, GetTeacherSerializer)
 
 # API view to list all principals
 class PrincipalListView(APIView):
     def get(self, request, format=None):
         principals = Principal.objects.all()  # Retrieve all principal instances
-        serializer = PrincipalSerializer(principals, many=True)  # Serialize the principal data
-        return Response(serializer.data, status=status.HTTP_200_OK)  # Return serialized data with 200 OK status
+        return sparse_list_response(request, self, principals, PrincipalSerializer)
 
 # API view to list all students
 class StudentListView(APIView):
     def get(self, request, format=None):
         students = Student.objects.all()  # Retrieve all student instances
-        serializer = GetStudentSerializer(students, many=True)  # Serialize the student data
-        return Response(serializer.data, status=status.HTTP_200_OK)  # Return serialized data with 200 OK status
+        return sparse_list_response(request, self, students, GetStudentSerializer, FastStudentSerializer)
 
 # List all staff members
 class AccountantListView(APIView):
@@ -447,8 +489,7 @@ class AccountantListView(APIView):
     """
     def get(self, request, format=None):
         accountant = Accountant.objects.all()  # Retrieve all accountant records
-        serializer = AccountantSerializer(accountant, many=True)  # Serialize the data for multiple accountant records
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return sparse_list_response(request, self, accountant, AccountantSerializer)
 
 # API view to see specific teacher
 class TeacherDetailView(APIView):
@@ -628,7 +669,7 @@ class StudentListByClassAPIView(APIView):
         if not students.exists():
             return Response({"detail": "No students found for this class."}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = GetStudentSerializer(students, many=True)
+        serializer = FastStudentSerializer(students)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 
@@ -714,8 +755,7 @@ class RegisterDriverView(APIView):
 class DriverListView(APIView):
     def get(self, request, format=None):
         drivers = Driver.objects.all()
-        serializer = DriverSerializer(drivers, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return sparse_list_response(request, self, drivers, DriverSerializer)
 
 
 class DriverDetailView(APIView):
@@ -770,8 +810,9 @@ class TotalLeaveApplicationListView(APIView):
 
     def get(self, request):
         user = request.user
+        roles = resolve_roles(request)
         # Determine user role
-        role = self.get_user_role(user)
+        role = self.get_user_role(user, roles)
         # Default assignment of leave_applications to an empty queryset
         leave_applications = LeaveApplication.objects.none()
         if role == 'Principal':
@@ -779,7 +820,7 @@ class TotalLeaveApplicationListView(APIView):
             leave_applications = LeaveApplication.objects.all()
         elif role == 'Teacher':
             # Teachers can view leave applications from their class
-            teacher = getattr(user, 'teacher', None)
+            teacher = roles.teacher
             if not teacher or not teacher.class_teacher:
                 return Response(
                     {"error": "Teacher does not have a class assigned."},
@@ -794,9 +835,8 @@ class TotalLeaveApplicationListView(APIView):
             )
            
         elif role == 'Student':
-            try:
-                student = Student.objects.get(user=user)
-            except Student.DoesNotExist:
+            student = roles.student
+            if student is None:
                 return Response(
                     {"error": "No student profile associated with the current user."},
                     status=status.HTTP_404_NOT_FOUND
@@ -810,13 +850,13 @@ class TotalLeaveApplicationListView(APIView):
         return Response(serializer.data)
 
     @staticmethod
-    def get_user_role(user):
+    def get_user_role(user, roles):
         """
         Determine the role of the user.
         """
         if getattr(user, 'is_principal', False):
             return 'Principal'
-        if hasattr(user, 'teacher'):
+        if roles.teacher is not None:
             return 'Teacher'
         if getattr(user, 'is_student', False):
             return 'Student'
@@ -1210,9 +1250,8 @@ class TeacherAssignmentsView(APIView):
 
     def get(self, request, format=None):
         # Ensure the user is a teacher
-        try:
-            teacher = request.user.teacher  # Assuming a OneToOneField relationship exists between Teacher and AUTH_USER_MODEL
-        except Teacher.DoesNotExist:
+        teacher = resolve_roles(request).teacher  # Assuming a OneToOneField relationship exists between Teacher and AUTH_USER_MODEL
+        if teacher is None:
             return Response(
                 {"error": "You are not authorized to view this content."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1239,9 +1278,8 @@ class StudentAssignmentsBySubjectView(APIView):
 
     def get(self, request, format=None):
         # Ensure the user is a student
-        try:
-            student = request.user.student  # Assuming a OneToOneField relationship exists between Student and AUTH_USER_MODEL
-        except Student.DoesNotExist:
+        student = resolve_roles(request).student  # Assuming a OneToOneField relationship exists between Student and AUTH_USER_MODEL
+        if student is None:
             return Response(
                 {"error": "You are not authorized to view this content."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1281,9 +1319,9 @@ class AssignHomeworkView(APIView):
         if not request.user.is_authenticated:
             return Response({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
         # Check if the user is a teacher
-        if not hasattr(request.user, 'teacher'):
+        teacher = resolve_roles(request).teacher # Get the associated teacher instance
+        if teacher is None:
             return Response({"error": "Only teachers can assign homework."}, status=status.HTTP_403_FORBIDDEN)
-        teacher = request.user.teacher # Get the associated teacher instance
         print (teacher)
         # Use the serializer for validation and creation
         serializer = AssignmentSerializer(data=request.data, context={'teacher': teacher})
@@ -1291,16 +1329,22 @@ class AssignHomeworkView(APIView):
             # Validate teacher's authorization for class and subject
             subject_instance = serializer.validated_data['subject']
             class_instance = serializer.validated_data['class_assigned']
-            # Ensure subject belongs to the class
-            if not class_instance.subjects.filter(id=subject_instance.id).exists():
-                return Response(
-                    {"error": f"The subject '{subject_instance.subject_name}' is not part of the class '{class_instance.class_name}'."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            if not teacher.classes.filter(id=class_instance.id).exists():
+            scope = teaching_scope(teacher)
+            # One lookup in the teaching matrix: the teacher teaches this subject of this class
+            if not scope.teaches(class_instance.id, subject_instance.id):
+                # Ensure subject belongs to the class
+                if not class_instance.subjects.filter(id=subject_instance.id).exists():
+                    return Response(
+                        {"error": f"The subject '{subject_instance.subject_name}' is not part of the class '{class_instance.class_name}'."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if not scope.teaches_class(class_instance.id):
+                    return Response(
+                        {"error": f"You are not authorized to assign homework for the class '{class_instance.class_name}'."},
+                        status=status.HTTP_403_FORBIDDEN
+                    )
                 return Response(
-                    {"error": f"You are not authorized to assign homework for the class '{class_instance.class_name}'."},
+                    {"error": f"You do not teach the subject '{subject_instance.subject_name}' in the class '{class_instance.class_name}'."},
                     status=status.HTTP_403_FORBIDDEN
                 )
             # Save the assignment
@@ -1319,11 +1363,10 @@ class DeleteAssignmentView(APIView):
             return Response({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
         
         # Check if the user is a teacher
-        if not hasattr(request.user, 'teacher'):
+        teacher = resolve_roles(request).teacher  # Get the associated teacher instance
+        if teacher is None:
             return Response({"error": "Only teachers can delete assignments."}, status=status.HTTP_403_FORBIDDEN)
         
-        teacher = request.user.teacher  # Get the associated teacher instance
-        
         try:
             assignment = Assignment.objects.get(id=assignment_id, teacher=teacher)
         except Assignment.DoesNotExist:
@@ -1342,11 +1385,10 @@ class UpdateAssignmentView(APIView):
             return Response({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
         
         # Check if the user is a teacher
-        if not hasattr(request.user, 'teacher'):
+        teacher = resolve_roles(request).teacher  # Get the associated teacher instance
+        if teacher is None:
             return Response({"error": "Only teachers can update assignments."}, status=status.HTTP_403_FORBIDDEN)
         
-        teacher = request.user.teacher  # Get the associated teacher instance
-        
         try:
             assignment = Assignment.objects.get(id=assignment_id, teacher=teacher)
         except Assignment.DoesNotExist:
@@ -1388,8 +1430,9 @@ class FilterSubjectsView(APIView):
         except Class.DoesNotExist:
             return JsonResponse({"error": f"Class '{class_assigned}' not found."}, status=404)
 
-        # Filter subjects for the given teacher and class
-        subjects = Subject.objects.filter(teachers=teacher, classes=assigned_class).values(
+        # Filter subjects for the given teacher and class: the teacher's subjects (cached scope) that the
+        # class has, whether or not the teacher is one of the class's teachers
+        subjects = Subject.objects.filter(id__in=teaching_scope(teacher).subject_ids, classes=assigned_class).values(
             "id", "subject_code", "subject_name", "is_credit", "credit_hours", "is_optional"
         )
 
@@ -1407,16 +1450,17 @@ class StudentAssignmentsView(APIView):
         """
         Retrieve all assignments assigned to the student's class.
         """
-        try:
-            student = request.user.student  # Assuming a OneToOneField relationship
-        except Student.DoesNotExist:
+        student = resolve_roles(request).student  # Assuming a OneToOneField relationship
+        if student is None:
             return Response(
                 {"error": "You are not authorized to view this content."},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Fetch all assignments for the student's class
-        assignments = Assignment.objects.filter(class_assigned=student.class_code)
+        # Fetch the assignments of the student's class in the subjects they take
+        assignments = Assignment.objects.filter(class_assigned=student.class_code).filter(
+            Q(subject__isnull=True) | Q(subject__in=StudentEnrolment.objects.filter(student=student).values('subject_id'))
+        )
 
         if not assignments.exists():
             return Response(
@@ -1471,6 +1515,10 @@ class SubmitStudentAssignmentView(APIView):
             return Response(
                 {"error": "This assignment is not for your class."}, 
                 status=status.HTTP_403_FORBIDDEN)
+        if assignment.subject_id and not StudentEnrolment.objects.filter(student=student, subject_id=assignment.subject_id).exists():
+            return Response(
+                {"error": "This assignment is for a subject you do not take."},
+                status=status.HTTP_403_FORBIDDEN)
 
         # Check if the student has already submitted
         if AssignmentSubmission.objects.filter(
@@ -1499,9 +1547,8 @@ class CheckSubmissionStatusView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, assignment_id, format=None):
-        try:
-            student = Student.objects.get(user=request.user)
-        except Student.DoesNotExist:
+        student = resolve_roles(request).student
+        if student is None:
             return Response(
                 {"error": "Only students can check submission status."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1530,9 +1577,8 @@ class DeleteStudentSubmissionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, submission_id, format=None):
-        try:
-            student = request.user.student  # Ensure the user is a student
-        except Student.DoesNotExist:
+        student = resolve_roles(request).student  # Ensure the user is a student
+        if student is None:
             return Response(
                 {"error": "Only students can delete their submissions."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1564,18 +1610,18 @@ class ReviewAssignmentsView(APIView):
         """
         Fetch assignments and their submissions for the teacher's assigned classes and subjects.
         """
-        try:
-            teacher = request.user.teacher  # Ensure the request user is a teacher
-        except Teacher.DoesNotExist:
+        teacher = resolve_roles(request).teacher  # Ensure the request user is a teacher
+        if teacher is None:
             return Response(
                 {"error": "You are not authorized to view this content."},
                 status=status.HTTP_403_FORBIDDEN
             )
 
         # Fetch assignments for the teacher's classes and subjects
+        scope = teaching_scope(teacher)
         assignments = Assignment.objects.filter(
-            class_assigned__in=teacher.classes.all(),
-            subject__in=teacher.subjects.all()
+            class_assigned__in=scope.class_ids,
+            subject__in=scope.subject_ids
         )
 
         if not assignments.exists():
@@ -1584,16 +1630,17 @@ class ReviewAssignmentsView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Prepare detailed response for each assignment
+        # Prepare detailed response for each assignment (related rows and submissions loaded up front)
         data = []
+        assignments = AssignmentSerializer().plan_queryset(assignments).prefetch_related('submissions')
         for assignment in assignments:
-            submissions = AssignmentSubmission.objects.filter(assignment=assignment)
+            submissions = assignment.submissions.all()
             
             # If there is no `status` field, we will not include the breakdown
             data.append({
                 "assignment": AssignmentSerializer(assignment).data,
                 "submissions": AssignmentSubmissionSerializer(submissions, many=True).data,
-                "total_submissions": submissions.count(),
+                "total_submissions": len(submissions),
             })
 
         return Response(data, status=status.HTTP_200_OK)
@@ -1609,10 +1656,9 @@ class ReviewAssignmentSubmissionView(APIView):
         """
         Allow a teacher to review a student's assignment submission.
         """
-        try:
-            teacher = request.user.teacher  # Ensure the user is a teacher
-            print(teacher)
-        except Teacher.DoesNotExist:
+        teacher = resolve_roles(request).teacher  # Ensure the user is a teacher
+        print(teacher)
+        if teacher is None:
             return Response(
                 {"error": "You are not authorized to review assignmentss."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1678,6 +1724,8 @@ class AssignmentsBySubjectView(APIView):
 @method_decorator(csrf_exempt, name='dispatch')
 class SyllabusView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'heavy'
+    throttle_methods = ('GET',)
 
     def get(self, request, *args, **kwargs):
         syllabus = Syllabus.objects.all()
@@ -1685,10 +1733,10 @@ class SyllabusView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
-        if not hasattr(request.user, 'teacher'):
+        teacher = resolve_roles(request).teacher
+        if teacher is None:
             return Response({"error": "Only teachers can create a syllabus."}, status=status.HTTP_403_FORBIDDEN)
 
-        teacher = request.user.teacher
         data = request.data.copy()
         data['teacher'] = teacher.id    # Ensure teacher ID is included
 
@@ -1696,7 +1744,7 @@ class SyllabusView(APIView):
         subject_id = data.get('subject')
 
         # Check if teacher is assigned to the subject
-        if not teacher.subjects.filter(id=subject_id).exists():
+        if not teaching_scope(teacher).teaches_subject(subject_id):
             return Response(
                 {"error": "You can only add a syllabus for subjects you teach."},
                 status=status.HTTP_403_FORBIDDEN
@@ -1712,10 +1760,10 @@ class SyllabusView(APIView):
 
     def patch(self, request, *args, **kwargs):
         """ Allows teachers to update the completion status of topics and subtopics """
-        if not hasattr(request.user, 'teacher'):
+        teacher = resolve_roles(request).teacher
+        if teacher is None:
             return Response({"error": "Only teachers can update the syllabus."}, status=status.HTTP_403_FORBIDDEN)
 
-        teacher = request.user.teacher
         syllabus_id = kwargs.get("pk")  # Get the syllabus ID from URL
 
         try:
@@ -1748,10 +1796,10 @@ class SyllabusView(APIView):
 
     def delete(self, request, *args, **kwargs):
         """ Allows teachers to delete a syllabus """
-        if not hasattr(request.user, 'teacher'):
+        teacher = resolve_roles(request).teacher
+        if teacher is None:
             return Response({"error": "Only teachers can delete a syllabus."}, status=status.HTTP_403_FORBIDDEN)
 
-        teacher = request.user.teacher
         syllabus_id = kwargs.get("pk")  # Get the syllabus ID from URL
 
         try:
@@ -1977,7 +2025,7 @@ class ExamDetailAPIView(APIView):
 class StudentResultAPIView(APIView):
     def get(self, request):
         results = StudentResult.objects.all()
-        serializer = GetStudentResultSerializer(results, many=True)
+        serializer = FastStudentResultSerializer(results)
         return Response(serializer.data)
 
     def post(self, request, *args, **kwargs):
@@ -1987,6 +2035,72 @@ class StudentResultAPIView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkStudentResultAPIView(APIView):
+    """
+    Enter the marks of a whole class for one ExamDetail in a single request.
+    Results are written with bulk create/update and the overall results and
+    rankings are recomputed once at the end, not once per student.
+    """
+    permission_classes = [IsAuthenticated, IsPrincipalOrTeacher]
+
+    def post(self, request, exam_detail_id):
+        exam_detail = get_object_or_404(
+            ExamDetail.objects.select_related('exam', 'class_assigned'), id=exam_detail_id
+        )
+        serializer = BulkStudentMarksSerializer(data=request.data, context={'exam_detail': exam_detail})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = serializer.validated_data['results']
+        student_ids = [entry['student'] for entry in entries]
+
+        with transaction.atomic():
+            existing = {
+                result.student_id: result
+                for result in StudentResult.objects.filter(exam_detail=exam_detail, student_id__in=student_ids)
+            }
+            to_create, to_update = [], []
+            for entry in entries:
+                result = existing.get(entry['student'])
+                if result is None:
+                    result = StudentResult(
+                        student_id=entry['student'], exam_detail=exam_detail, created_by=request.user
+                    )
+                    to_create.append(result)
+                else:
+                    result.exam_detail = exam_detail  # Reuse the loaded row, no query per result
+                    to_update.append(result)
+                result.practical_marks = entry.get('practical_marks')
+                result.theory_marks = entry.get('theory_marks')
+                result.calculate_marks()
+
+            # bulk_create/bulk_update skip the per-row post_save signal on purpose
+            StudentResult.objects.bulk_create(to_create)
+            StudentResult.objects.bulk_update(
+                to_update, ['practical_marks', 'theory_marks', 'total_marks', 'percentage', 'gpa', 'grade']
+            )
+
+            recompute_overall_results(exam_detail.exam, student_ids)
+            recalculate_rankings(exam_detail.exam)
+
+        return Response({
+            "message": "Marks saved successfully.",
+            "created": len(to_create),
+            "updated": len(to_update),
+            "results": [
+                {
+                    "student": result.student_id,
+                    "practical_marks": result.practical_marks,
+                    "theory_marks": result.theory_marks,
+                    "total_marks": result.total_marks,
+                    "percentage": result.percentage,
+                    "gpa": result.gpa,
+                    "grade": result.grade,
+                }
+                for result in to_create + to_update
+            ],
+        }, status=status.HTTP_200_OK)
+
 # Single Exam APIView
 class SingleExamAPIView(APIView):
     def get_object(self, exam_id):
@@ -2174,14 +2288,14 @@ class ExamDetailsByExamView(APIView):
             
             # Fetch the related exam details
             exam_details = []
-            for detail in exam.exam_details.all():
-                exam_date = detail.exam_date
+            details = list(exam.exam_details.select_related('class_assigned', 'subject'))
+            exam_dates = [detail.exam_date for detail in details]
 
-                # Convert exam_date to BS if needed
-                if exam_date and not date_setting.is_ad:
-                    bs_date = nepali_datetime.date.from_datetime_date(exam_date)
-                    exam_date = bs_date.strftime('%Y-%m-%d')
+            # Convert the exam_date column to BS if needed
+            if not date_setting.is_ad:
+                exam_dates = bs_calendar.convert_many(exam_dates)
 
+            for detail, exam_date in zip(details, exam_dates):
                 exam_details.append({
                     "id": detail.id,
                     "class_details": {
@@ -2243,8 +2357,7 @@ class SubjectWiseExamResultsView(APIView):
             exam_date = exam_detail.exam_date
             date_setting = DateSetting.get_instance()  # Get global date setting
             if exam_date and not date_setting.is_ad:
-                bs_date = nepali_datetime.date.from_datetime_date(exam_date)
-                exam_date = bs_date.strftime('%Y-%m-%d')
+                exam_date = bs_calendar.ad_to_bs(exam_date)
 
             # Prepare exam and subject details
             exam_details = {
@@ -2310,7 +2423,7 @@ class ExamDetailsByTeacherView(APIView):
             raise NotFound("Teacher not found.")
 
         # Get subjects taught by the teacher
-        teacher_subjects = teacher.subjects.all()
+        teacher_subjects = teaching_scope(teacher).subject_ids
 
         # Fetch exam details for the given exam ID and teacher's subjects
         exam_details = ExamDetail.objects.filter(
@@ -2324,15 +2437,14 @@ class ExamDetailsByTeacherView(APIView):
         # Check date format setting (BS or AD)
         date_setting = DateSetting.get_instance()
 
+        # Convert the exam_date column to BS if needed
+        exam_dates = [detail.exam_date for detail in exam_details]
+        if not date_setting.is_ad:
+            exam_dates = bs_calendar.convert_many(exam_dates)
+
         # Prepare the response with the desired structure
         response_data = []
-        for detail in exam_details:
-            # Convert exam_date to BS if needed
-            exam_date = detail.exam_date
-            if exam_date and not date_setting.is_ad:
-                bs_date = nepali_datetime.date.from_datetime_date(exam_date)
-                exam_date = bs_date.strftime('%Y-%m-%d')
-
+        for detail, exam_date in zip(exam_details, exam_dates):
             response_data.append({
                 "exam_details": {
                     "id": detail.id,  # Exam detail ID
@@ -2374,15 +2486,15 @@ class ExamTimetableView(APIView):
             # Check date format setting (BS or AD)
             date_setting = DateSetting.get_instance()
 
+            # Convert the exam_date column to BS if needed
+            exam_details = list(exam_details.select_related('class_assigned', 'subject'))
+            exam_dates = [detail.exam_date for detail in exam_details]
+            if not date_setting.is_ad:
+                exam_dates = bs_calendar.convert_many(exam_dates)
+
             # Prepare response data with date conversion
             exam_details_data = []
-            for detail in exam_details:
-                # Convert exam_date to BS if needed
-                exam_date = detail.exam_date
-                if exam_date and not date_setting.is_ad:
-                    bs_date = nepali_datetime.date.from_datetime_date(exam_date)
-                    exam_date = bs_date.strftime('%Y-%m-%d')
-
+            for detail, exam_date in zip(exam_details, exam_dates):
                 exam_details_data.append({
                     "id": detail.id,
                     "class_details": {
@@ -2522,79 +2634,12 @@ def update_student_overall_result(sender, instance, **kwargs):
     with transaction.atomic():
         student = instance.student
         exam = instance.exam_detail.exam
-        class_instance = student.class_code
 
-        # Calculate the total marks and GPA for the student in this exam
-        results = StudentResult.objects.filter(student=student, exam_detail__exam=exam)
-        total_marks_obtained = sum(result.total_marks or 0 for result in results)
-        total_full_marks = sum(result.exam_detail.full_marks or 0 for result in results)
-
-        if total_full_marks > 0:
-            percentage = (total_marks_obtained / total_full_marks) * 100
-        else:
-            percentage = 0
-
-        # Calculate GPA based on percentage
-        if percentage >= 90:
-            gpa = 4.0
-            grade = 'A+'
-        elif percentage >= 80:
-            gpa = 3.5
-            grade = 'A'
-        elif percentage >= 70:
-            gpa = 3.0
-            grade = 'B+'
-        elif percentage >= 60:
-            gpa = 2.5
-            grade = 'B'
-        elif percentage >= 50:
-            gpa = 2.0
-            grade = 'C+'
-        elif percentage >= 40:
-            gpa = 1.5
-            grade = 'C'
-        elif percentage >= 35:
-            gpa = 1.0
-            grade = 'D'
-        else:
-            gpa = 0.0
-            grade = 'NG'
-
-        # Update or create the overall result
-        student_overall_result, created = StudentOverallResult.objects.update_or_create(
-            student=student, 
-            exam=exam, 
-            defaults={
-                'total_marks_obtained': total_marks_obtained,
-                'total_full_marks': total_full_marks,
-                'percentage': percentage,
-                'gpa': gpa,
-                'grade': grade
-            }
-        )
+        # Recalculate the total marks and GPA for the student in this exam
+        recompute_overall_results(exam, [student.id])
 
         # Now that the overall result is updated, recalculate rankings
-        recalculate_rankings(exam, class_instance)
-
-def recalculate_rankings(exam, class_instance):
-    # Fetch all student results for this exam and class
-    student_results = StudentOverallResult.objects.filter(
-        exam=exam, student__class_code=class_instance
-    ).select_related('student')
-
-    # Order by total marks obtained, then by student name (for tie-breaking)
-    ranked_results = student_results.order_by('-total_marks_obtained', 'student__user__username')
-
-    # Recalculate the ranks
-    rank = 1
-    for idx, result in enumerate(ranked_results):
-        # If marks are different from the previous result, increment the rank
-        if idx > 0 and ranked_results[idx-1].total_marks_obtained != result.total_marks_obtained:
-            rank = idx + 1
-
-        # Update the rank in the StudentOverallResult
-        result.rank = rank
-        result.save()
+        recalculate_rankings(exam)
 
 
 class StudentRankingView(APIView):
@@ -2616,7 +2661,7 @@ class StudentRankingView(APIView):
             # Fetch all students' overall results for this exam and class
             student_results = StudentOverallResult.objects.filter(
                 exam=exam, student__class_code=class_instance
-            ).select_related('student')
+            ).select_related('student__user').order_by('rank', 'student__user__username')
 
             # Create the rankings list with the stored rank and result data
             results_with_ranks = [
@@ -2624,6 +2669,8 @@ class StudentRankingView(APIView):
                     'student': result.student.user.username,
                     'total_marks_obtained': result.total_marks_obtained,
                     'rank': result.rank,  # Get the rank directly from the model
+                    'section_rank': result.section_rank,
+                    'school_rank': result.school_rank,
                     'gpa': result.gpa,
                     'grade': result.grade,
                 }
@@ -2654,13 +2701,54 @@ class StudentRankingView(APIView):
             )
 
 
+class SubjectToppersView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, exam_id, class_id):
+        exam = get_object_or_404(Exam, id=exam_id)
+        class_instance = get_object_or_404(Class, id=class_id)
+
+        if not exam.is_result_published:
+            return Response(
+                {"detail": "Results for this exam are not published yet."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            limit = max(int(request.query_params.get('limit', 1)), 1)
+        except ValueError:
+            return Response({"detail": "limit must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Group the ranked rows by subject
+        toppers = {}
+        for result in subject_toppers(exam, class_instance, limit=limit):
+            subject = result.exam_detail.subject
+            entry = toppers.setdefault(subject.id, {
+                "subject": {"id": subject.id, "subject_code": subject.subject_code, "subject_name": subject.subject_name},
+                "toppers": [],
+            })
+            entry["toppers"].append({
+                "rank": result.subject_rank,
+                "student_id": result.student.id,
+                "student": result.student.user.username,
+                "full_name": f"{result.student.user.first_name} {result.student.user.last_name}",
+                "total_marks": result.total_marks,
+                "grade": result.grade,
+            })
+
+        return Response({
+            "exam": {"id": exam.id, "name": exam.name},
+            "class": {"id": class_instance.id, "name": class_instance.class_name, "code": class_instance.class_code},
+            "subjects": list(toppers.values()),
+        }, status=status.HTTP_200_OK)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class NotesCreateView(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def post(self, request):
         """Create a new note (Only teachers can post)."""
-        if not hasattr(request.user, 'teacher'):
+        if not has_role(request, 'teacher'):
             return Response({"error": "Only teachers can upload notes."}, status=status.HTTP_403_FORBIDDEN)
 
         serializer = NotesSerializer(data=request.data, context={'request': request})  # Pass request context
@@ -2753,37 +2841,13 @@ class DailyAttendanceAPIView(APIView):
         if not attendance_data:
             return Response({"detail": "No attendance data provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # To track the students whose attendance is already recorded
-        already_recorded_students = []
-        new_attendance_students = []
-
-        # Flag to check if all attendance records are already taken
-        all_records_taken = True
-
         try:
             with transaction.atomic():  # Wrap the entire operation in a transaction
-                for attendance in attendance_data:
-                    student = attendance.get('student')
-                    status_value = attendance.get('status')
-
-                    # Check if the record exists for the student on the given day
-                    existing_record = DailyAttendance.objects.filter(student_id=student, date=today).first()
-
-                    if existing_record:
-                        # If record already exists, skip this student
-                        already_recorded_students.append(student)
-                    else:
-                        # Create a new record for students without today's attendance
-                        DailyAttendance.objects.create(
-                            student_id=student,
-                            date=today,
-                            status=status_value,
-                            recorded_by=teacher
-                        )
-                        new_attendance_students.append(student)
-                        all_records_taken = False  # Mark as False if there are new records
-
-            if all_records_taken:
+                already_recorded_students, new_attendance_students = record_daily_attendance(
+                    attendance_data, today, teacher
+                )
+
+            if not new_attendance_students:
                 return Response({"detail": "Attendance already taken for the day."}, status=status.HTTP_400_BAD_REQUEST)
 
             response_data = {
@@ -2823,15 +2887,7 @@ class AttendanceByClassAPIView(APIView):
         }
 
         # Serialize attendance data
-        attendance_list = [
-            {
-                "student_id": record.student.id,
-                "full_name": f"{record.student.user.first_name} {record.student.user.last_name}".strip(),
-                "roll_no": record.student.roll_no,
-                "status": record.status
-            }
-            for record in attendance_records
-        ]
+        attendance_list = FastClassAttendanceSerializer(attendance_records).data
 
         return Response({
             "date": date_obj,
@@ -2858,22 +2914,13 @@ class AttendanceByClassAPIView(APIView):
 
         try:
             with transaction.atomic():
-                for record in attendance_data:
-                    student_id = record.get('student')
-                    status_value = record.get('status')
-
-                    attendance_record = DailyAttendance.objects.filter(
-                        student_id=student_id, date=date_obj, student__class_code=class_obj
-                    ).first()
-
-                    if attendance_record:
-                        attendance_record.status = status_value
-                        attendance_record.save()
-                    else:
-                        return Response(
-                            {"detail": f"Attendance record for student {student_id} does not exist."},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+                missing_students = update_class_attendance(class_obj, date_obj, attendance_data)
+
+            if missing_students:
+                return Response(
+                    {"detail": f"Attendance record for student {missing_students[0]} does not exist."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
             return Response({"detail": "Class attendance updated successfully."}, status=status.HTTP_200_OK)
 
@@ -2900,7 +2947,10 @@ class AttendanceByClassAPIView(APIView):
                     return Response({"detail": "No attendance records found for the specified class and date."},
                                     status=status.HTTP_400_BAD_REQUEST)
 
+                student_ids = list(attendance_records.values_list('student_id', flat=True))
                 attendance_records.delete()
+                clear_monthly_attendance(date_obj, student_ids)
+                refresh_attendance_rollup(date_obj, [class_obj.id])
 
             return Response({"detail": "Class attendance records deleted successfully."}, status=status.HTTP_200_OK)
 
@@ -2909,22 +2959,96 @@ class AttendanceByClassAPIView(APIView):
 
     
 
-class StudentsByClassAttendanceAPIView(APIView):
-    def get(self, request, class_id):
-        students = Student.objects.filter(class_code_id=class_id).prefetch_related('user')
+class MonthlyAttendanceRegisterAPIView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        # Get student IDs to fetch last transactions in bulk (optimized)
-        student_ids = students.values_list('id', flat=True)
+    def get(self, request, class_id, year, month):
+        """Attendance register of a class for one month, from the monthly bitmaps."""
+        if not 1 <= month <= 12:
+            return Response({"detail": "Invalid month. Use 1-12."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Fetch last transaction for each student in bulk (avoiding N+1 queries)
-        last_transactions = {
-            txn.student_id: txn.balance
-            for txn in StudentTransaction.objects.filter(student_id__in=student_ids).order_by('student_id', '-transaction_date')
+        try:
+            class_obj = Class.objects.get(id=class_id)
+        except Class.DoesNotExist:
+            return Response({"detail": "Class not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        days = calendar.monthrange(year, month)[1]
+        students = Student.objects.filter(class_code=class_obj).select_related('user')
+        rows = {
+            row.student_id: row
+            for row in MonthlyAttendance.objects.filter(student__class_code=class_obj, year=year, month=month)
         }
 
-        # Attach balance to each student instance
+        register = []
+        for student in students:
+            row = rows.get(student.id)
+            present_days = row.present_days if row else 0
+            recorded_days = row.recorded_days if row else 0
+            register.append({
+                "student_id": student.id,
+                "full_name": f"{student.user.first_name} {student.user.last_name}".strip(),
+                "roll_no": student.roll_no,
+                "attendance": month_register(row, days),  # One entry per day: true/false/null (not taken)
+                "present_days": present_days,
+                "recorded_days": recorded_days,
+                "percentage": percentage(present_days, recorded_days),
+            })
+
+        return Response({
+            "class": {"id": class_obj.id, "name": class_obj.class_name, "code": class_obj.class_code},
+            "year": year,
+            "month": month,
+            "days": days,
+            "students": register,
+        }, status=status.HTTP_200_OK)
+
+
+class YearlyAttendanceAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, class_id, year):
+        """Yearly attendance percentages and streaks of every student of a class."""
+        try:
+            class_obj = Class.objects.get(id=class_id)
+        except Class.DoesNotExist:
+            return Response({"detail": "Class not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        students = Student.objects.filter(class_code=class_obj).select_related('user')
+        rows_by_student = defaultdict(list)
+        for row in MonthlyAttendance.objects.filter(
+            student__class_code=class_obj, year=year
+        ).order_by('student_id', 'month'):
+            rows_by_student[row.student_id].append(row)
+
+        results = []
+        class_present = class_recorded = 0
         for student in students:
-            student.pre_balance = last_transactions.get(student.id, 0)  # Default to 0 if no transaction
+            rows = rows_by_student.get(student.id, [])
+            summary = attendance_summary(rows)
+            class_present += summary["present_days"]
+            class_recorded += summary["recorded_days"]
+            results.append({
+                "student_id": student.id,
+                "full_name": f"{student.user.first_name} {student.user.last_name}".strip(),
+                "roll_no": student.roll_no,
+                **summary,
+                "monthly_percentage": {
+                    row.month: percentage(row.present_days, row.recorded_days) for row in rows
+                },
+            })
+
+        return Response({
+            "class": {"id": class_obj.id, "name": class_obj.class_name, "code": class_obj.class_code},
+            "year": year,
+            "percentage": percentage(class_present, class_recorded),
+            "students": results,
+        }, status=status.HTTP_200_OK)
+
+
+class StudentsByClassAttendanceAPIView(APIView):
+    def get(self, request, class_id):
+        # Balances are read from the account rows, joined in the same query
+        students = Student.objects.filter(class_code_id=class_id).select_related('user', 'class_code', 'account')
 
         serializer = StudentListAttendanceSerializer(students, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -2939,8 +3063,9 @@ class SubjectWiseStudentListAPIView(APIView):
         except Subject.DoesNotExist:
             return Response({"detail": "Subject not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        students = Student.objects.filter(class_code__subjects=subject).distinct()
-        serializer = GetStudentSerializer(students, many=True)
+        # Class and optional subjects alike, one indexed lookup on the enrolment table
+        students = Student.objects.filter(enrolments__subject=subject).order_by('id')
+        serializer = FastStudentSerializer(students)
 
         return Response({
             "subject": {
@@ -3132,10 +3257,6 @@ class StudentBillAPIView(APIView):
         if StudentBill.objects.filter(student=student, month=month).exists():
             return Response({"error": "Bill already generated for this month."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Calculate pre_balance (last transaction balance)
-        last_transaction = StudentTransaction.objects.filter(student=student).order_by('-transaction_date').first()
-        pre_balance = last_transaction.balance if last_transaction else 0
-
         # Prepare request data
         request.data["student"] = student.id
         serializer = StudentBillSerializer(data=request.data)
@@ -3143,27 +3264,11 @@ class StudentBillAPIView(APIView):
         if serializer.is_valid():
             # Start atomic transaction block
             with transaction.atomic():
-                # Create the bill
+                # Create the bill (also posts it to the student's account)
                 student_bill = serializer.save()
 
-                # Calculate post_balance (pre_balance + bill amount)
-                post_balance = pre_balance + student_bill.total_amount
-
-                # Create the transaction for the bill
-                StudentTransaction.objects.create(
-                    student=student_bill.student,
-                    transaction_type='bill',
-                    bill=student_bill,
-                    balance=post_balance,
-                    transaction_date=student_bill.date
-                )
-
-                # Commit the transaction
+                # pre_balance and post_balance come from the bill's own transaction
                 bill_data = GetStudentBillSerializer(student_bill).data
-                bill_data.update({
-                    "pre_balance": pre_balance,
-                    "post_balance": post_balance
-                })
 
                 return Response({
                     'message': f'Student Bill generated successfully with Bill Number: {student_bill.bill_number}',
@@ -3174,6 +3279,30 @@ class StudentBillAPIView(APIView):
 
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class GenerateMonthlyBillsAPIView(APIView):
+    """Bill every student of a class (or of the whole school) for a month in one batch."""
+    permission_classes = [IsAuthenticated, IsAccountant | IsPrincipal]
+
+    def post(self, request):
+        serializer = MonthlyBillingSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        school_class = data.get('class_id')
+        summary = generate_monthly_bills(
+            data['month'],
+            class_ids=[school_class.id] if school_class else None,
+            scholarships=data.get('scholarships'),
+            remarks=data.get('remarks'),
+        )
+        return Response({
+            'message': f"Generated {summary['students_billed']} bill(s) for {summary['month']}.",
+            **summary,
+        }, status=status.HTTP_201_CREATED)
+
+
 class StudentBillDetailAPIView(APIView):
     def get(self, request, bill_number=None):
         try:
@@ -3204,11 +3333,6 @@ class StudentPaymentAPIView(APIView):
         except Student.DoesNotExist:
             return Response({"error": "Student not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        
-
-        last_transaction = StudentTransaction.objects.filter(student=student).order_by('-transaction_date').first()
-        pre_balance = last_transaction.balance if last_transaction else 0
-
         data = request.data
         data['student'] = student_id
 
@@ -3217,34 +3341,11 @@ class StudentPaymentAPIView(APIView):
         if serializer.is_valid():
             # Begin atomic transaction
             with transaction.atomic():
-                # Create the payment object
+                # Create the payment object (also posts it to the student's account)
                 payment = serializer.save()
 
-                # Update the balances
-                post_balance = pre_balance - payment.amount_paid
-
-                # Create the transaction for the payment
-                last_transaction = StudentTransaction.objects.filter(student=student).order_by('-transaction_date').first()
-                last_balance = last_transaction.balance if last_transaction else Decimal('0.00')
-                new_balance = last_balance - Decimal(str(payment.amount_paid))
-
-                # Save the new transaction entry
-                StudentTransaction.objects.create(
-                    student=payment.student,
-                    transaction_type='payment',
-                    payment=payment,
-                    balance=new_balance,
-                    transaction_date=payment.date
-                )
-
-                # Commit the transaction
-                post_balance = pre_balance - payment.amount_paid
-
+                # pre_balance and post_balance come from the payment's own transaction
                 payment_data = GetStudentPaymentSerializer(payment).data
-                payment_data.update({
-                    "pre_balance": pre_balance,
-                    "post_balance": post_balance
-                })
 
                 return Response({
                     'message': f'Payment done successfully with Payment Number: {payment.payment_number}',
@@ -3279,18 +3380,17 @@ class StudentTransactionsAPIView(APIView):
         date_setting = DateSetting.get_instance()
 
         # Serialize transactions
-        transaction_serializer = StudentTransactionSerializer(transactions, many=True)
+        transaction_serializer = FastStudentTransactionSerializer(transactions)
         transaction_data = transaction_serializer.data
 
         # Extract student details from the first transaction manually
-        first_transaction = transactions.first()
+        first_transaction = transactions.select_related('student__user', 'student__class_code').first()
         student = first_transaction.student
 
         # Convert date_of_birth to BS if needed
         date_of_birth = student.date_of_birth
         if date_of_birth and not date_setting.is_ad:
-            bs_dob = nepali_datetime.date.from_datetime_date(date_of_birth)
-            date_of_birth = bs_dob.strftime('%Y-%m-%d')
+            date_of_birth = bs_calendar.ad_to_bs(date_of_birth)
 
         student_data = {
             "id": student.id,
@@ -3304,14 +3404,8 @@ class StudentTransactionsAPIView(APIView):
             "class_name": student.class_code.class_name if student.class_code else None
         }
 
-        # Convert transaction dates to BS if needed
+        # Transaction dates are already converted to BS (if needed) by the serializer
         for transaction in transaction_data:
-            transaction_date = transaction.get("transaction_date")
-            if transaction_date and not date_setting.is_ad:
-                ad_date = datetime.strptime(transaction_date, "%Y-%m-%d")  # Assuming AD format in DB
-                bs_date = nepali_datetime.date.from_datetime_date(ad_date)
-                transaction["transaction_date"] = bs_date.strftime('%Y-%m-%d')
-
             # Remove student data from each transaction
             transaction.pop("student", None)
 
@@ -3370,29 +3464,24 @@ class AttendanceSummaryAPIView(APIView):
             except ValueError:
                 return Response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get all students
-        total_students = Student.objects.count()
-
-        # Get attendance records for the given date
-        attendance_records = DailyAttendance.objects.filter(date=date)
-
-        # Count present and absent students
-        present_count = attendance_records.filter(status=True).count()
-        absent_count = attendance_records.filter(status=False).count()
-
-        # Get class-wise statistics
+        # Enrolled students per class (students without a class only count towards the school total)
         class_wise_stats = defaultdict(lambda: {"total": 0, "present": 0, "absent": 0})
-
-        for student in Student.objects.all():
-            class_name = student.class_code.class_name  # Assuming class_code is related to Class model
-            class_wise_stats[class_name]["total"] += 1
-
-        for record in attendance_records:
-            class_name = record.student.class_code.class_name
-            if record.status:
-                class_wise_stats[class_name]["present"] += 1
-            else:
-                class_wise_stats[class_name]["absent"] += 1
+        total_students = 0
+        for row in Student.objects.values('class_code__class_name').annotate(total=Count('id')):
+            total_students += row['total']
+            if row['class_code__class_name'] is not None:
+                class_wise_stats[row['class_code__class_name']]["total"] += row['total']
+
+        # Present/absent counts per class from the daily rollup (the rows without a class only count towards the totals)
+        present_count = absent_count = 0
+        for row in AttendanceDailyRollup.objects.filter(date=date).values('school_class__class_name').annotate(
+            present=Sum('present'), absent=Sum('absent')
+        ):
+            present_count += row['present']
+            absent_count += row['absent']
+            if row['school_class__class_name'] is not None:
+                class_wise_stats[row['school_class__class_name']]["present"] += row['present']
+                class_wise_stats[row['school_class__class_name']]["absent"] += row['absent']
 
         return Response({
             "date": date,
@@ -3403,6 +3492,44 @@ class AttendanceSummaryAPIView(APIView):
         }, status=status.HTTP_200_OK)
     
 
+class AttendanceTrendAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Day-by-day attendance between ?start= and ?end= (YYYY-MM-DD, default the
+        last 30 days), for the whole school or ?class_id= / ?section_id=.
+        """
+        try:
+            end = timezone.datetime.strptime(request.query_params['end'], "%Y-%m-%d").date() \
+                if request.query_params.get('end') else timezone.now().date()
+            start = timezone.datetime.strptime(request.query_params['start'], "%Y-%m-%d").date() \
+                if request.query_params.get('start') else end - timezone.timedelta(days=29)
+        except ValueError:
+            return Response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            class_id = int(request.query_params['class_id']) if request.query_params.get('class_id') else None
+            section_id = int(request.query_params['section_id']) if request.query_params.get('section_id') else None
+        except ValueError:
+            return Response({"detail": "class_id and section_id must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = AttendanceDailyRollup.objects.filter(date__range=(start, end))
+        if class_id is not None:
+            rollups = rollups.filter(school_class_id=class_id)
+        if section_id is not None:
+            rollups = rollups.filter(section_id=section_id)
+
+        trend = [
+            {**row, "percentage": percentage(row["present"], row["present"] + row["absent"])}
+            for row in rollups.values('date').annotate(
+                total=Sum('total'), present=Sum('present'), absent=Sum('absent')
+            ).order_by('date')
+        ]
+
+        return Response({"start": start, "end": end, "trend": trend}, status=status.HTTP_200_OK)
+
+
 class SyllabusSummaryAPIView(APIView):
     def get(self, request, teacher_id):
         syllabuses = Syllabus.objects.filter(teacher_id=teacher_id).prefetch_related('chapters__topics__subtopics')
@@ -3504,10 +3631,10 @@ class FeeDashboardAPIView(APIView):
         total_payments_monthly = StudentPayment.objects.filter(date__month=datetime.now().month).count()
 
         # 🔹 Students with cleared dues (Balance = 0)
-        cleared_students = StudentTransaction.objects.filter(balance=0).values("student").distinct().count()
+        cleared_students = StudentAccount.objects.filter(balance=0, student__bills__isnull=False).values("student").distinct().count()
 
         # 🔹 Students with outstanding balance (Balance > 0) and have transactions/bills
-        students_with_dues = StudentTransaction.objects.filter(balance__gt=0).filter(student__in=StudentBill.objects.values('student')).values("student").distinct().count()  # Ensure there is a bill generated for the student
+        students_with_dues = StudentAccount.objects.filter(balance__gt=0, student__bills__isnull=False).values("student").distinct().count()  # Ensure there is a bill generated for the student
         
 
         # 🔹 Total Scholarship/Discount Amount
@@ -3550,6 +3677,7 @@ class FeeDashboardAPIView(APIView):
 @method_decorator(csrf_exempt, name='dispatch')
 class PaymentSearchAPIView(ListAPIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'heavy'
     pagination_class = CustomPagination  # Pagination class should not be instantiated
     serializer_class = None  # We will return custom JSON
 
@@ -3771,12 +3899,12 @@ class FinanceSummaryAPIView(APIView):
     
 class IsPrincipal(BasePermission):
     def has_permission(self, request, view):
-        return Principal.objects.filter(user=request.user).exists()
+        return has_role(request, 'principal')
 
 @api_view(['GET'])
 def dashboard_stats(request):
     # Check if user is a principal
-    if not Principal.objects.filter(user=request.user).exists():
+    if not has_role(request, 'principal'):
         return Response(
             {"error": "Access Denied. Only principals can view this data."}, 
             status=status.HTTP_403_FORBIDDEN
@@ -3819,6 +3947,26 @@ class UserSearchAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 
+class StudentTypeaheadAPIView(APIView):
+    """
+    Students matching what has been typed so far: every word of `q` must start
+    a name, username, phone, parents' phone, roll number, class or section of
+    the student. Served from the in-memory index of myapp.typeahead.
+    """
+    permission_classes = [IsAuthenticated, IsAccountant | IsPrincipal | IsTeacher | IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), TYPEAHEAD_MAX_RESULTS)
+            class_id = request.query_params.get('class_id')
+            class_id = int(class_id) if class_id else None
+        except ValueError:
+            return Response({"error": "limit and class_id must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = student_index.search(request.query_params.get('q', ''), limit=limit, class_id=class_id)
+        return Response(results, status=status.HTTP_200_OK)
+
+
 
 class QuizViewSet(viewsets.ModelViewSet):
     queryset = Quiz.objects.all()
@@ -3884,3 +4032,29 @@ class TaskViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+
+
+from django.http import HttpResponse
+from .metrics import metrics_registry, metrics_setting
+
+
+class MetricsAPIView(APIView):
+    """
+    Per-endpoint request count, latency histogram, SQL queries, DB/serializer
+    time and response bytes of this worker, in the Prometheus text format.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class SlowRequestLogAPIView(APIView):
+    """The slowest recent requests of this worker (newest first), with the SQL they ran"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response({
+            "threshold_ms": metrics_setting("SLOW_REQUEST_MS", 500),
+            "requests": metrics_registry.slow_request_log(),
+        })